@@ -24,7 +24,14 @@ app.route("/sms/<string:locale>", methods=["POST"])(api.sms_reply)
 app.route("/login", methods=["GET", "POST"])(admin.login)
 app.route("/logout", methods=["GET"])(admin.logout)
 app.route("/admin", methods=["GET"])(admin.admin_summary)
+app.route("/admin/refresh", methods=["POST"])(admin.admin_refresh)
 app.route("/admin/bulk-sms", methods=["GET", "POST"])(admin.admin_bulk_sms)
+app.route("/admin/bulk-sms/<int:bulk_send_id>", methods=["GET", "POST"])(
+    admin.admin_bulk_sms_status
+)
 app.route("/admin/bulk-upload", methods=["GET", "POST"])(admin.upload_users)
+app.route("/admin/bulk-upload/<int:client_import_id>", methods=["GET"])(
+    admin.upload_users_status
+)
 app.route("/admin/sms", methods=["GET", "POST"])(admin.admin_sms)
 app.route("/admin/stats", methods=["GET"])(admin.admin_stats)
@@ -1,3 +1,4 @@
+import datetime
 import os
 
 import flask
@@ -16,6 +17,15 @@ if not config.TESTING:
         "task": "airq.tasks.models_sync",
         "schedule": crontab(minute=0, hour="*"),
     }
+    BEAT_SCHEDULE["refresh_dashboard"] = {
+        "task": "airq.tasks.refresh_dashboard",
+        "schedule": crontab(minute="*/10"),
+    }
+    # Deletes task results older than `result_expires`.
+    BEAT_SCHEDULE["celery.backend_cleanup"] = {
+        "task": "celery.backend_cleanup",
+        "schedule": crontab(minute=30),
+    }
 
 
 def get_celery_logger():
@@ -33,7 +43,10 @@ else:
     broker_url = "sqs://{}:{}@".format(
         safequote(config.AWS_ACCESS_KEY_ID), safequote(config.AWS_SECRET_ACCESS_KEY)
     )
-    transport_options = {"region": "us-west-1", "visibility_timeout": 120}
+    transport_options = {
+        "region": "us-west-1",
+        "visibility_timeout": config.CELERY_VISIBILITY_TIMEOUT_SECONDS,
+    }
 
 
 celery = Celery(config.app.import_name)
@@ -42,9 +55,15 @@ celery.conf.update(
     beat_schedule=BEAT_SCHEDULE,
     broker_url=broker_url,
     broker_transport_options=transport_options,
+    # Chords need a result backend to know when all of their subtasks have finished.
+    # Its tables are created by a migration, and results are only needed until the
+    # chord finishes, so they're cleaned up hourly.
+    result_backend="db+" + config.app.config["SQLALCHEMY_DATABASE_URI"],
+    result_expires=datetime.timedelta(hours=1),
     result_serializer="json",
     task_default_queue=f"celery-{config.FLASK_ENV}",
     task_serializer="json",
+    worker_concurrency=config.CELERY_WORKER_CONCURRENCY,
     worker_enable_remote_control=False,
     worker_hijack_root_logger=False,
 )
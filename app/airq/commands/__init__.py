@@ -19,6 +19,7 @@ from airq.commands.resubscribe import Resubscribe
 from airq.commands.unsubscribe import Unsubscribe
 from airq.models.clients import Client
 from airq.models.clients import ClientIdentifierType
+from airq.models.events import Event
 
 
 COMMANDS: typing.List[typing.Type[SMSCommand]] = [
@@ -60,9 +61,10 @@ def _parse_command(client: Client, user_input: str) -> SMSCommand:
 def handle_command(
     user_input: str, identifier: str, identifier_type: ClientIdentifierType, locale: str
 ) -> MessageResponse:
-    client, was_created = Client.query.get_or_create(
-        identifier, identifier_type, locale
-    )
-    if not was_created:
-        client.mark_seen(locale)
-    return _parse_command(client, user_input).handle()
+    with Event.query.buffered():
+        client, was_created = Client.query.get_or_create(
+            identifier, identifier_type, locale
+        )
+        if not was_created:
+            client.mark_seen(locale)
+        return _parse_command(client, user_input).handle()
@@ -1,15 +1,38 @@
 import abc
+import typing
 
+from flask_babel import get_locale
 from flask_babel import ngettext, gettext
 
 from airq import config
 from airq.commands.base import MessageResponse
 from airq.commands.base import RegexCommand
+from airq.lib.cache import VersionedLRUCache
 from airq.lib.geo import kilometers_to_miles
 from airq.models.events import EventType
 from airq.models.zipcodes import Zipcode
 
 
+# Rendered replies are cached per zipcode and locale until what they show changes.
+#
+# These are versioned by columns of the zipcode row, so a lookup still needs it.
+# That's fine, since every reply loads it anyway to check that its readings aren't
+# stale and to log its pm25. What a hit saves is loading the zipcode's city and
+# rendering the reply. Summaries show the city's name, which is versioned by
+# `city_id` since cities are never renamed (a new name is a new city). Details
+# show the recommendations, which can change when only nearby zipcodes do.
+_summary_cache: VersionedLRUCache[typing.Tuple[int, str], str] = VersionedLRUCache(
+    "summary", maxsize=10000
+)
+_details_cache: VersionedLRUCache[
+    typing.Tuple[int, str], typing.Tuple[str, typing.List[str]]
+] = VersionedLRUCache("details", maxsize=10000)
+
+
+def _get_cache_key(zipcode: Zipcode) -> typing.Tuple[int, str]:
+    return zipcode.id, str(get_locale())
+
+
 class BaseQualityCommand(RegexCommand):
     def handle(self) -> MessageResponse:
         if self.params.get("zipcode"):
@@ -46,9 +69,6 @@ class GetQuality(BaseQualityCommand):
     event_type = EventType.QUALITY
 
     def _get_message(self, zipcode: Zipcode) -> MessageResponse:
-        aqi = zipcode.aqi
-        aqi_display = gettext(" (AQI %(aqi)s)", aqi=aqi) if aqi else ""
-
         is_first_message = self.client.zipcode_id is None
         was_updated = self.client.update_subscription(zipcode)
         if self.client.is_enabled_for_alerts and is_first_message and was_updated:
@@ -60,7 +80,7 @@ class GetQuality(BaseQualityCommand):
                         city=zipcode.city.name,
                         zipcode=zipcode.zipcode,
                         pm25_level=zipcode.pm25_level.display,
-                        aqi_display=aqi_display,
+                        aqi_display=self._get_aqi_display(zipcode),
                     )
                 )
                 .newline()
@@ -77,12 +97,10 @@ class GetQuality(BaseQualityCommand):
             response = (
                 MessageResponse()
                 .write(
-                    gettext(
-                        "%(city)s %(zipcode)s is %(pm25_level)s%(aqi_display)s.",
-                        city=zipcode.city.name,
-                        zipcode=zipcode.zipcode,
-                        pm25_level=zipcode.pm25_level.display,
-                        aqi_display=aqi_display,
+                    _summary_cache.get(
+                        _get_cache_key(zipcode),
+                        (zipcode.pm25_updated_at, zipcode.city_id),
+                        lambda: self._render_summary(zipcode),
                     )
                 )
                 .newline()
@@ -109,6 +127,21 @@ class GetQuality(BaseQualityCommand):
 
         return response
 
+    @staticmethod
+    def _get_aqi_display(zipcode: Zipcode) -> str:
+        aqi = zipcode.aqi
+        return gettext(" (AQI %(aqi)s)", aqi=aqi) if aqi else ""
+
+    @classmethod
+    def _render_summary(cls, zipcode: Zipcode) -> str:
+        return gettext(
+            "%(city)s %(zipcode)s is %(pm25_level)s%(aqi_display)s.",
+            city=zipcode.city.name,
+            zipcode=zipcode.zipcode,
+            pm25_level=zipcode.pm25_level.display,
+            aqi_display=cls._get_aqi_display(zipcode),
+        )
+
 
 class GetLast(GetQuality):
     pattern = r"^2[\.\)]?$"
@@ -119,6 +152,25 @@ class GetDetails(BaseQualityCommand):
     pattern = r"^1[\.\)]?$"
 
     def _get_message(self, zipcode: Zipcode) -> MessageResponse:
+        body, recommendations = _details_cache.get(
+            _get_cache_key(zipcode),
+            (zipcode.pm25_updated_at, zipcode.recommendations_data),
+            lambda: self._render_details(zipcode),
+        )
+
+        self.client.log_event(
+            EventType.DETAILS,
+            zipcode=zipcode.zipcode,
+            recommendations=recommendations,
+            pm25=zipcode.pm25,
+            num_sensors=zipcode.num_sensors,
+        )
+
+        return MessageResponse(body=body)
+
+    @staticmethod
+    def _render_details(zipcode: Zipcode) -> typing.Tuple[str, typing.List[str]]:
+        """Render the details reply, returning it with the recommended zipcodes."""
         response = MessageResponse().write(zipcode.pm25_level.description).write("")
 
         num_desired = 3
@@ -131,11 +183,11 @@ class GetDetails(BaseQualityCommand):
                 response.write(
                     gettext(
                         " - %(city)s %(zipcode)s: %(pm25_level)s (%(distance)s mi)",
-                        city=recommendation.city.name,
+                        city=recommendation.city_name,
                         zipcode=recommendation.zipcode,
                         pm25_level=recommendation.pm25_level.display.upper(),
                         distance=round(
-                            kilometers_to_miles(recommendation.distance(zipcode)),
+                            kilometers_to_miles(recommendation.distance),
                             ndigits=1,
                         ),  # TODO: Make this based on locale
                     )
@@ -152,12 +204,4 @@ class GetDetails(BaseQualityCommand):
             )
         )
 
-        self.client.log_event(
-            EventType.DETAILS,
-            zipcode=zipcode.zipcode,
-            recommendations=[r.zipcode for r in recommended_zipcodes],
-            pm25=zipcode.pm25,
-            num_sensors=zipcode.num_sensors,
-        )
-
-        return response
+        return response.body, [r.zipcode for r in recommended_zipcodes]
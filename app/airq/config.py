@@ -29,9 +29,24 @@ TWILIO_NUMBERS = {
     "es": os.getenv("TWILIO_NUMBER_ES", ""),
 }
 TWILIO_SID = os.getenv("TWILIO_SID", "")
+# Lets us point the Twilio client at a fake server.
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "")
+# How many messages each worker sends at once, and how fast each of our numbers
+# may send across all workers.
+TWILIO_MAX_CONCURRENT_SENDS = int(os.getenv("TWILIO_MAX_CONCURRENT_SENDS", "8"))
+TWILIO_MESSAGES_PER_SECOND = float(os.getenv("TWILIO_MESSAGES_PER_SECOND", "10"))
+
+# How many tasks each Celery worker runs at once.
+CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", "4"))
+# SQS hands a task to another worker if it isn't finished within this long, so
+# every task needs to finish well within it.
+CELERY_VISIBILITY_TIMEOUT_SECONDS = 60 * 60
 
 PURPLEAIR_API_KEY = os.getenv("PURPLEAIR_API_KEY", "")
 
+# Either "sql" (compute zipcode metrics inside Postgres) or "python".
+METRICS_SYNC_MODE = os.getenv("METRICS_SYNC_MODE", "sql")
+
 PG_DB = os.getenv("POSTGRES_DB", "postgres")
 PG_HOST = os.getenv("POSTGRES_HOST", "db")
 PG_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
@@ -40,6 +55,9 @@ PG_USER = os.getenv("POSTGRES_USER", "postgres")
 
 SERVER_URL = os.getenv("SERVER_URL", "localhost:80")
 
+# Where we keep the GeoNames and timezone dumps between syncs.
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "/tmp/airq/downloads")
+
 
 # Init logging before doing anything else.
 #
@@ -1,5 +1,6 @@
 import codecs
 import csv
+import pytz
 import typing
 
 from flask import flash
@@ -18,17 +19,21 @@ from airq.decorators import admin_required
 from airq.forms import BulkClientUploadForm
 from airq.forms import BulkSMSForm
 from airq.forms import LoginForm
+from airq.forms import RefreshDashboardForm
+from airq.forms import ResumeBulkSMSForm
 from airq.forms import SMSForm
+from airq.lib.cache import get_cache_stats
 from airq.lib.clock import now
 from airq.lib.clock import timestamp
-from airq.lib.sms import coerce_phone_number
-from airq.lib.sms import is_valid_phone_number
+from airq.models.bulk_sends import BULK_SEND_STALL_SECONDS
+from airq.models.bulk_sends import BulkSend
 from airq.models.clients import Client
-from airq.models.clients import ClientIdentifierType
-from airq.models.events import Event
-from airq.models.zipcodes import Zipcode
+from airq.models.dashboard import DashboardSnapshot
+from airq.models.imports import ClientImport
 from airq.models.users import User
 from airq.tasks import bulk_send
+from airq.tasks import import_clients
+from airq.tasks import refresh_dashboard
 
 
 def login() -> typing.Union[Response, str]:
@@ -53,20 +58,34 @@ def logout() -> Response:
 
 @admin_required
 def admin_summary() -> str:
+    snapshot = DashboardSnapshot.query.get_latest()
+    computed_at = None
+    if snapshot is None:
+        refresh_dashboard.delay(0)
+        flash("Stats are being computed; check back in a minute.")
+    else:
+        computed_at = snapshot.created_at.astimezone(
+            pytz.timezone("America/Los_Angeles")
+        )
     return render_template(
         "admin.html",
         title="Admin",
-        summary={
-            "Total Alerts Sent": Client.query.get_total_num_sends(),
-            "Total Subscribed Clients": Client.query.get_total_num_subscriptions(),
-            "Total New Clients": Client.query.get_total_new(),
-            "Total Clients": Client.query.filter_phones().count(),
-        },
-        activity_counts=Client.query.get_activity_counts(),
-        event_stats=Event.query.get_stats(),
+        snapshot=snapshot,
+        computed_at=computed_at,
+        refresh_form=RefreshDashboardForm(snapshot_id=snapshot.id if snapshot else 0),
+        cache_stats=get_cache_stats(),
     )
 
 
+@admin_required
+def admin_refresh() -> Response:
+    form = RefreshDashboardForm()
+    if form.validate_on_submit():
+        refresh_dashboard.delay(form.snapshot_id.data)
+        flash("Refreshing stats; reload the page in a minute.")
+    return redirect(url_for("admin_summary"))
+
+
 @admin_required
 def admin_stats():
     last_active_at = request.args.get("last_active_at")
@@ -82,9 +101,11 @@ def admin_bulk_sms():
         return redirect(url_for("admin_summary"))
     form = BulkSMSForm(last_active_at=now())
     if form.validate_on_submit():
-        bulk_send.delay(form.data["message"], form.data["last_active_at"].timestamp())
-        flash("Sent!")
-        return redirect(url_for("admin_summary"))
+        new_bulk_send = BulkSend.query.create(
+            form.data["message"], form.data["last_active_at"].timestamp()
+        )
+        bulk_send.delay(new_bulk_send.id)
+        return redirect(url_for("admin_bulk_sms_status", bulk_send_id=new_bulk_send.id))
     return render_template(
         "bulk_sms.html",
         form=form,
@@ -92,6 +113,28 @@ def admin_bulk_sms():
     )
 
 
+@admin_required
+def admin_bulk_sms_status(bulk_send_id: int):
+    if not current_user.can_send_sms:
+        return redirect(url_for("admin_summary"))
+    form = ResumeBulkSMSForm()
+    current_bulk_send = BulkSend.query.get_or_404(bulk_send_id)
+    if form.validate_on_submit():
+        if current_bulk_send.resume():
+            bulk_send.delay(bulk_send_id)
+            flash("Resumed!")
+        else:
+            flash("This is still making progress, so it can't be resumed yet.")
+        return redirect(url_for("admin_bulk_sms_status", bulk_send_id=bulk_send_id))
+    return render_template(
+        "bulk_sms_status.html",
+        form=form,
+        bulk_send=current_bulk_send,
+        progress=current_bulk_send.get_progress(),
+        stall_minutes=BULK_SEND_STALL_SECONDS // 60,
+    )
+
+
 @admin_required
 def admin_sms():
     if not current_user.can_send_sms:
@@ -109,51 +152,23 @@ def admin_sms():
 def upload_users():
     form = BulkClientUploadForm()
     if form.validate_on_submit():
-        buffer = form.csv_file.data.stream
-        reader = csv.DictReader(codecs.iterdecode(buffer, "utf-8"))
-        headers = reader.fieldnames
-        if "phone_number" not in headers or "zipcode" not in headers:
+        reader = csv.DictReader(codecs.iterdecode(form.csv_file.data.stream, "utf-8"))
+        if ClientImport.get_missing_columns(reader.fieldnames or []):
             flash(
                 "You must upload a CSV with a column titled 'phone_number' and a column titled 'zipcode'"
             )
-        else:
-            num_created = 0
-            num_duplicates = 0
-            all_errors = []
-            for i, row in enumerate(reader, start=1):
-                errors = []
-
-                zipcode = Zipcode.query.get_by_zipcode(row["zipcode"].strip())
-                if zipcode is None:
-                    errors.append(f"Row {i}: {row['zipcode']} is not a valid zipcode")
-
-                phone_number = coerce_phone_number(row["phone_number"].strip())
-                if not is_valid_phone_number(phone_number):
-                    errors.append(
-                        f"Row {i}: {row['phone_number']} is not a valid US phone number"
-                    )
-
-                if errors:
-                    all_errors.extend(errors)
-                else:
-                    client, was_created = Client.query.get_or_create(
-                        phone_number, ClientIdentifierType.PHONE_NUMBER
-                    )
-                    if was_created:
-                        client.update_subscription(zipcode)
-                        num_created += 1
-                    else:
-                        num_duplicates += 1
-
-            if num_created:
-                flash(f"Created {num_created} users")
-            if num_duplicates:
-                flash(
-                    f"Skipped {num_duplicates} phone numbers because they're already in the system"
-                )
-            for error in all_errors:
-                flash(error)
-
-        return redirect(url_for("upload_users"))
+            return redirect(url_for("upload_users"))
+
+        client_import = ClientImport.query.create(reader, form.data["locale"])
+        import_clients.delay(client_import.id)
+        return redirect(
+            url_for("upload_users_status", client_import_id=client_import.id)
+        )
 
     return render_template("bulk_upload.html", form=form)
+
+
+@admin_required
+def upload_users_status(client_import_id: int):
+    client_import = ClientImport.query.get_or_404(client_import_id)
+    return render_template("bulk_upload_status.html", client_import=client_import)
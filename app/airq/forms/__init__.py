@@ -1,10 +1,14 @@
 from flask_wtf import FlaskForm
 from wtforms import FileField
+from wtforms import IntegerField
 from wtforms import PasswordField
+from wtforms import SelectField
 from wtforms import StringField
 from wtforms import SubmitField
 from wtforms import TextAreaField
 from wtforms.validators import DataRequired
+from wtforms.validators import Optional
+from wtforms.widgets import HiddenInput
 
 from airq.forms.fields import LocalDateTimeField
 from airq.forms.validators import PhoneNumberValidator
@@ -32,6 +36,10 @@ class BulkSMSForm(FlaskForm):
     submit_btn = SubmitField("Submit")
 
 
+class ResumeBulkSMSForm(FlaskForm):
+    submit_btn = SubmitField("Resume")
+
+
 class SMSForm(FlaskForm):
     message = TextAreaField(
         "Message", validators=[DataRequired()], render_kw={"cols": 50, "rows": 10}
@@ -46,4 +54,14 @@ class BulkClientUploadForm(FlaskForm):
     csv_file = FileField(
         "CSV File", validators=[DataRequired()], render_kw={"accept": ".csv"}
     )
+    locale = SelectField(
+        "Language", choices=[("en", "English"), ("es", "Spanish")], default="en"
+    )
     submit_btn = SubmitField("Upload")
+
+
+class RefreshDashboardForm(FlaskForm):
+    # The snapshot the page showed (0 if none), so that refreshing it twice only
+    # computes one new snapshot.
+    snapshot_id = IntegerField(widget=HiddenInput(), validators=[Optional()])
+    submit_btn = SubmitField("Refresh")
@@ -0,0 +1,123 @@
+import collections
+import dataclasses
+import threading
+import time
+import typing
+
+from airq.lib.logging import get_airq_logger
+
+
+logger = get_airq_logger(__name__)
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+# Log each cache's stats once per this many lookups.
+STATS_LOG_INTERVAL = 1000
+
+_caches: typing.List["VersionedLRUCache"] = []
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    hit_seconds: float = 0.0
+    miss_seconds: float = 0.0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def mean_hit_ms(self) -> float:
+        return 1000 * self.hit_seconds / self.hits if self.hits else 0.0
+
+    @property
+    def mean_miss_ms(self) -> float:
+        return 1000 * self.miss_seconds / self.misses if self.misses else 0.0
+
+
+class VersionedLRUCache(typing.Generic[K, V]):
+    """A thread-safe, in-process LRU cache whose entries are tagged with a version.
+
+    A lookup only hits if the entry was stored with the version being asked for,
+    so callers can invalidate entries by bumping the version they pass in (e.g.,
+    a zipcode's `pm25_updated_at`) without having to know what is cached.
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: "collections.OrderedDict[K, typing.Tuple[typing.Any, V]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        _caches.append(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K, version: typing.Any, compute: typing.Callable[[], V]) -> V:
+        """Get the value for key at the given version, computing it on a miss."""
+        start = time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._record(is_hit=True, seconds=time.perf_counter() - start)
+                return entry[1]
+
+        # Compute outside the lock; at worst two threads compute the same value.
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._record(is_hit=False, seconds=time.perf_counter() - start)
+        return value
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats = CacheStats()
+
+    def _record(self, is_hit: bool, seconds: float):
+        if is_hit:
+            self._stats.hits += 1
+            self._stats.hit_seconds += seconds
+        else:
+            self._stats.misses += 1
+            self._stats.miss_seconds += seconds
+
+        if self._stats.lookups % STATS_LOG_INTERVAL == 0:
+            logger.info(
+                "%s cache: %.1f%% hit rate over %s lookups (%.3fms per hit, %.3fms per miss)",
+                self.name,
+                100 * self._stats.hit_rate,
+                self._stats.lookups,
+                self._stats.mean_hit_ms,
+                self._stats.mean_miss_ms,
+            )
+
+
+def get_cache_stats() -> typing.Dict[str, CacheStats]:
+    """Stats for every cache in this process, by name."""
+    return {cache.name: cache.stats for cache in _caches}
+
+
+def clear_caches():
+    """Clear every cache in this process."""
+    for cache in _caches:
+        cache.clear()
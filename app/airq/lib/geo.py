@@ -1,4 +1,11 @@
 import math
+import numpy as np
+import typing
+
+
+EARTH_RADIUS_KM = 6371  # Use 3956 for miles
+
+TCoordinates = typing.Union[float, typing.Sequence[float], np.ndarray]
 
 
 def haversine_distance(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
@@ -17,8 +24,43 @@ def haversine_distance(lon1: float, lat1: float, lon2: float, lat2: float) -> fl
         + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
     )
     c = 2 * math.asin(math.sqrt(a))
-    r = 6371  # Radius of earth in kilometers. Use 3956 for miles
-    return c * r
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_many(
+    lon1: TCoordinates, lat1: TCoordinates, lon2: TCoordinates, lat2: TCoordinates
+) -> np.ndarray:
+    """
+    Vectorized version of haversine_distance.
+
+    Arguments are broadcast against each other, so passing scalars for the
+    first point and arrays for the second computes the distance from one
+    point to many (e.g., this zipcode against all others).
+    """
+    lon1, lat1, lon2, lat2 = (
+        np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2)
+    )
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_matrix(
+    lons1: TCoordinates, lats1: TCoordinates, lons2: TCoordinates, lats2: TCoordinates
+) -> np.ndarray:
+    """
+    Pairwise distances between two sets of points.
+
+    Returns a matrix of shape (len(lons1), len(lons2)).
+    """
+    return haversine_many(
+        np.asarray(lons1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lats1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lons2, dtype=np.float64)[np.newaxis, :],
+        np.asarray(lats2, dtype=np.float64)[np.newaxis, :],
+    )
 
 
 def kilometers_to_miles(kilometers: float) -> float:
@@ -30,3 +72,13 @@ def kilometers_to_miles(kilometers: float) -> float:
 
     # calculate miles
     return kilometers * conv_fac
+
+
+def geohash_prefix_range(prefix: str) -> typing.Tuple[str, str]:
+    """The range [start, end) of geohashes which begin with `prefix`.
+
+    Only holds when geohashes are compared bytewise (i.e., with the "C" collation).
+    """
+    if not prefix:
+        raise ValueError("Geohash prefix must not be empty")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -1,9 +1,83 @@
+import dataclasses
+import hashlib
+import json
+import os
 import requests
+import typing
+
+from airq import config
+
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclasses.dataclass
+class CachedDownload:
+    path: str
+    sha256: str
+    # False if the server told us our cached copy is still current.
+    was_downloaded: bool
 
 
 def chunked_download(url: str, filename: str):
     resp = requests.get(url, stream=True)
     resp.raise_for_status()
     with open(filename, "wb") as fd:
-        for chunk in resp.iter_content(chunk_size=512):
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
             fd.write(chunk)
+
+
+def _read_metadata(path: str) -> typing.Dict[str, str]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def cached_download(url: str, filename: str) -> CachedDownload:
+    """Download `url` into the download cache, unless our copy is current.
+
+    We keep the ETag and Last-Modified headers of each download alongside it
+    and send them back on the next request, so servers which support
+    conditional requests only send the file again if it has changed.
+    """
+    os.makedirs(config.DOWNLOAD_CACHE_DIR, exist_ok=True)
+    path = os.path.join(config.DOWNLOAD_CACHE_DIR, filename)
+    metadata_path = f"{path}.json"
+
+    headers = {}
+    metadata = _read_metadata(metadata_path)
+    if metadata.get("url") == url and os.path.exists(path):
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    resp = requests.get(url, headers=headers, stream=True)
+    if resp.status_code == 304:
+        return CachedDownload(
+            path=path, sha256=metadata["sha256"], was_downloaded=False
+        )
+    resp.raise_for_status()
+
+    # Download to a temporary file so that a failed download never leaves a
+    # truncated file behind under the cached name.
+    sha256 = hashlib.sha256()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fd:
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+            fd.write(chunk)
+    os.replace(tmp_path, path)
+
+    metadata = {
+        "url": url,
+        "etag": resp.headers.get("ETag", ""),
+        "last_modified": resp.headers.get("Last-Modified", ""),
+        "sha256": sha256.hexdigest(),
+    }
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f)
+
+    return CachedDownload(path=path, sha256=metadata["sha256"], was_downloaded=True)
@@ -0,0 +1,101 @@
+import io
+import typing
+
+from airq.config import db
+
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def _format_copy_value(value: typing.Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, float):
+        # repr round-trips exactly through Postgres' float8 input.
+        return repr(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def create_staging_table(name: str, like: str) -> str:
+    """Create a temp table shaped like `like` which is dropped on commit."""
+    db.session.execute(
+        f"CREATE TEMP TABLE {name} (LIKE {like} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    return name
+
+
+def create_temp_table(name: str, columns: typing.Dict[str, str]) -> str:
+    """Create a temp table with the given column types which is dropped on commit."""
+    db.session.execute(
+        "CREATE TEMP TABLE {} ({}) ON COMMIT DROP".format(
+            name,
+            ", ".join(f"{column} {type_}" for column, type_ in columns.items()),
+        )
+    )
+    return name
+
+
+class _CopyRowsReader(io.TextIOBase):
+    """A file for COPY FROM which formats rows only as they're read."""
+
+    def __init__(self, rows: typing.Iterable[typing.Sequence[typing.Any]]):
+        self._rows = iter(rows)
+        self._pending = ""
+        self.num_rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: typing.Optional[int] = -1) -> str:
+        if size is None:
+            size = -1
+        chunks = [self._pending]
+        length = len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "\t".join(_format_copy_value(v) for v in row) + "\n"
+            chunks.append(line)
+            length += len(line)
+            self.num_rows += 1
+        data = "".join(chunks)
+        if size < 0:
+            self._pending = ""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+
+def copy_rows(
+    table: str,
+    columns: typing.Sequence[str],
+    rows: typing.Iterable[typing.Sequence[typing.Any]],
+) -> int:
+    """Bulk load rows into a table with COPY.
+
+    Rows are formatted as Postgres asks for more data, so only about
+    COPY_CHUNK_SIZE characters of them are held in memory at a time.
+
+    This runs on the session's connection, so it participates in the current
+    transaction (and can see temp tables created by it).
+    """
+    reader = _CopyRowsReader(rows)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN".format(table, ", ".join(columns)),
+            reader,
+            size=COPY_CHUNK_SIZE,
+        )
+    finally:
+        cursor.close()
+    return reader.num_rows
@@ -1,3 +1,8 @@
+import codecs
+import dataclasses
+import json
+import numpy as np
+import re
 import requests
 import typing
 
@@ -6,8 +11,13 @@ from airq.config import PURPLEAIR_API_KEY
 
 PURPLEAIR_URL = "https://api.purpleair.com/v1/sensors"
 
+# Size of the chunks we read off of the socket when streaming the response.
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def call_purpleair_api() -> requests.Response:
+_DATA_KEY_RE = re.compile(r'"data"\s*:\s*\[')
+
+
+def call_purpleair_api(stream: bool = False) -> requests.Response:
     fields = [
         "pm2.5",
         "latitude",
@@ -24,6 +34,180 @@ def call_purpleair_api() -> requests.Response:
         PURPLEAIR_URL,
         params=params,
         headers={"X-API-Key": PURPLEAIR_API_KEY},
+        stream=stream,
     )
     resp.raise_for_status()
     return resp
+
+
+@dataclasses.dataclass
+class SensorColumns:
+    """Sensor readings from Purpleair, stored column-wise.
+
+    Missing or unparseable values are NaN in the float columns
+    and -1 in `channel_flag`. Rows without a valid `sensor_index` are dropped.
+    """
+
+    channel_flags: typing.List[str]
+    sensor_index: np.ndarray
+    pm25: np.ndarray
+    humidity: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    last_seen: np.ndarray
+    channel_flag: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.sensor_index)
+
+    @classmethod
+    def empty(cls) -> "SensorColumns":
+        return cls._from_batches([], [])
+
+    @classmethod
+    def _from_batches(
+        cls,
+        channel_flags: typing.List[str],
+        batches: typing.List[typing.Dict[str, np.ndarray]],
+    ) -> "SensorColumns":
+        def concat(name: str, dtype: typing.Any) -> np.ndarray:
+            if not batches:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate([batch[name] for batch in batches])
+
+        return cls(
+            channel_flags=channel_flags,
+            sensor_index=concat("sensor_index", np.int64),
+            pm25=concat("pm2.5", np.float64),
+            humidity=concat("humidity", np.float64),
+            latitude=concat("latitude", np.float64),
+            longitude=concat("longitude", np.float64),
+            last_seen=concat("last_seen", np.int64),
+            channel_flag=concat("channel_flags", np.int8),
+        )
+
+
+def _to_float_array(values: typing.Sequence[typing.Any]) -> np.ndarray:
+    try:
+        # Numpy converts `None` to NaN for us.
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+
+    def to_float(value: typing.Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return float("nan")
+
+    return np.array([to_float(v) for v in values], dtype=np.float64)
+
+
+def _to_columns(
+    fields: typing.List[str], rows: typing.List[typing.List[typing.Any]]
+) -> typing.Dict[str, np.ndarray]:
+    raw = dict(zip(fields, zip(*rows))) if rows else {}
+    n = len(rows)
+
+    def get(name: str) -> np.ndarray:
+        values = raw.get(name)
+        if values is None:
+            return np.full(n, np.nan)
+        return _to_float_array(values)
+
+    # Rows without a usable id can't be stored, so they're dropped here rather
+    # than cast to a garbage id.
+    sensor_index = get("sensor_index")
+    with np.errstate(invalid="ignore"):
+        has_id = np.isfinite(sensor_index) & (sensor_index == np.trunc(sensor_index))
+
+    def get_valid(name: str) -> np.ndarray:
+        return get(name)[has_id]
+
+    last_seen = get_valid("last_seen")
+    channel_flag = get_valid("channel_flags")
+    return {
+        "sensor_index": sensor_index[has_id].astype(np.int64),
+        "pm2.5": get_valid("pm2.5"),
+        "humidity": get_valid("humidity"),
+        "latitude": get_valid("latitude"),
+        "longitude": get_valid("longitude"),
+        "last_seen": np.nan_to_num(last_seen, nan=0).astype(np.int64),
+        "channel_flags": np.nan_to_num(channel_flag, nan=-1).astype(np.int8),
+    }
+
+
+_ROW_SEPARATOR_RE = re.compile(r"[\s,]*")
+
+_row_decoder = json.JSONDecoder()
+
+
+def _decode_rows(
+    buf: str, rows: typing.List[typing.List[typing.Any]]
+) -> typing.Tuple[str, bool]:
+    """Decode the complete rows at the start of `buf` into `rows`.
+
+    Returns whatever follows the last complete row (the start of a row we haven't
+    received all of yet), and whether we reached the end of the data array. Rows
+    are decoded by the JSON decoder itself, so brackets and commas inside of
+    strings are handled, and anything after the data array is never looked at.
+    """
+    pos = 0
+    while True:
+        pos = _ROW_SEPARATOR_RE.match(buf, pos).end()  # type: ignore
+        if pos == len(buf):
+            return "", False
+        if buf[pos] == "]":
+            return "", True
+        try:
+            row, pos = _row_decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # A row is only valid JSON once all of it has arrived.
+            return buf[pos:], False
+        rows.append(row)
+
+
+def parse_sensor_columns(
+    chunks: typing.Iterable[bytes],
+) -> SensorColumns:
+    """Parse a Purpleair /sensors response into columns without building it in memory.
+
+    The header (everything before the "data" key) is decoded up front, then rows are
+    decoded in batches as the body arrives and immediately folded into numpy arrays.
+    This relies on Purpleair sending "fields" and "channel_flags" before "data",
+    which it always has.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    header: typing.Optional[typing.Dict[str, typing.Any]] = None
+    batches: typing.List[typing.Dict[str, np.ndarray]] = []
+
+    def decode_header(text: str) -> typing.Dict[str, typing.Any]:
+        header = json.loads(text.rstrip().rstrip(",") + "}")
+        if "fields" not in header or "channel_flags" not in header:
+            raise ValueError("Expected fields and channel_flags before data")
+        return header
+
+    is_done = False
+    for chunk in chunks:
+        buf += decoder.decode(chunk)
+        if header is None:
+            match = _DATA_KEY_RE.search(buf)
+            if not match:
+                continue
+            header = decode_header(buf[: match.start()])
+            buf = buf[match.end() :]
+
+        rows: typing.List[typing.List[typing.Any]] = []
+        buf, is_done = _decode_rows(buf, rows)
+        if rows:
+            batches.append(_to_columns(header["fields"], rows))
+        if is_done:
+            break
+
+    if header is None:
+        raise ValueError("Purpleair response is missing sensor data")
+    if not is_done:
+        raise ValueError("Purpleair response ended in the middle of sensor data")
+
+    return SensorColumns._from_batches(header["channel_flags"], batches)
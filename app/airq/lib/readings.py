@@ -1,8 +1,11 @@
 import enum
 import math
+import numpy as np
 import typing
 
 from flask_babel import gettext
+from sqlalchemy import case
+from sqlalchemy.sql.expression import ColumnElement
 
 from airq.lib.choices import IntChoicesEnum
 
@@ -31,6 +34,26 @@ class Pm25(IntChoicesEnum):
 
         return cls.HAZARDOUS
 
+    @classmethod
+    def from_measurements(cls, measurements: np.ndarray) -> np.ndarray:
+        """Vectorized `from_measurement`, returning each level's value."""
+        thresholds = sorted(level.value for level in cls.__members__.values())
+        return np.take(
+            thresholds, np.searchsorted(thresholds, measurements, side="right") - 1
+        )
+
+    @classmethod
+    def from_measurement_expression(cls, measurement: ColumnElement) -> ColumnElement:
+        """SQL equivalent of `from_measurement`, evaluating to the level's value."""
+        levels = sorted(cls.__members__.values(), key=lambda level: level.value)
+        return case(
+            [
+                (measurement < upper.value, level.value)
+                for level, upper in zip(levels, levels[1:])
+            ],
+            else_=levels[-1].value,
+        )
+
     @property
     def display(self) -> str:
         if self == self.GOOD:
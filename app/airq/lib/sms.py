@@ -10,7 +10,10 @@ def coerce_phone_number(phone_number: str) -> str:
 
 
 def is_valid_phone_number(phone_number: str) -> bool:
-    number_obj = phonenumbers.parse(phone_number, region="US")
+    try:
+        number_obj = phonenumbers.parse(phone_number, region="US")
+    except phonenumbers.NumberParseException:
+        return False
     if not number_obj:
         return False
     return phonenumbers.is_valid_number(number_obj)
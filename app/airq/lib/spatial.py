@@ -0,0 +1,86 @@
+import numpy as np
+import typing
+
+from scipy.spatial import cKDTree
+
+from airq.lib.geo import EARTH_RADIUS_KM
+
+
+def to_unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Convert decimal degrees to xyz coordinates on the unit sphere."""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(kilometers: float) -> float:
+    """Straight-line distance through the unit sphere for a great circle distance."""
+    return 2 * np.sin(min(kilometers / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chords: np.ndarray) -> np.ndarray:
+    """Great circle distance for a straight-line distance through the unit sphere."""
+    return 2 * np.arcsin(np.minimum(chords, 2) / 2) * EARTH_RADIUS_KM
+
+
+class SpatialIndex:
+    """Answers nearest-neighbour queries by great circle distance.
+
+    Points are stored in a KD-tree as xyz coordinates on the unit sphere.
+    Straight-line distance between points on the sphere increases
+    monotonically with great circle distance, so the tree's nearest
+    neighbours are also the nearest neighbours over the earth's surface.
+    """
+
+    def __init__(
+        self,
+        ids: typing.Sequence[int],
+        latitudes: typing.Sequence[float],
+        longitudes: typing.Sequence[float],
+    ):
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._tree = (
+            cKDTree(to_unit_vectors(latitudes, longitudes)) if len(self._ids) else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def query(
+        self,
+        latitudes: typing.Sequence[float],
+        longitudes: typing.Sequence[float],
+        k: int,
+        max_distance_km: float,
+    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Find the k nearest points within max_distance_km of each of the given points.
+
+        Returns two arrays of shape (len(latitudes), k): the ids of the neighbours
+        and their distances in kilometers, each row sorted by distance. Missing
+        neighbours have an id of -1 and a distance of infinity.
+        """
+        num_points = len(latitudes)
+        if not num_points or self._tree is None or k <= 0:
+            return (
+                np.full((num_points, max(k, 0)), -1, dtype=np.int64),
+                np.full((num_points, max(k, 0)), np.inf),
+            )
+
+        chords, indices = self._tree.query(
+            to_unit_vectors(latitudes, longitudes),
+            k=k,
+            distance_upper_bound=km_to_chord(max_distance_km),
+        )
+        chords = np.reshape(chords, (num_points, k))
+        indices = np.reshape(indices, (num_points, k))
+
+        is_found = np.isfinite(chords)
+        distances = np.full(chords.shape, np.inf)
+        distances[is_found] = chord_to_km(chords[is_found])
+        is_found &= distances < max_distance_km
+        distances[~is_found] = np.inf
+
+        ids = np.full(indices.shape, -1, dtype=np.int64)
+        ids[is_found] = self._ids[indices[is_found]]
+        return ids, distances
@@ -0,0 +1,120 @@
+import functools
+import re
+import typing
+
+
+# A quoted string or a bare value (a number or NULL). Quoted strings are matched
+# as a whole, so commas, parens and escaped quotes inside them are skipped over.
+_QUOTED_CONTENTS = r"[^'\\]*(?:(?:\\.|'')[^'\\]*)*"
+_BARE = r"[^,'()]*"
+_VALUE_RE = re.compile(f"'{_QUOTED_CONTENTS}'|{_BARE}", re.DOTALL)
+
+_ESCAPE_RE = re.compile(r"\\(.)|''", re.DOTALL)
+_ESCAPES = {
+    "0": "\0",
+    "b": "\b",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "Z": "\x1a",
+}
+
+
+def _unescape_match(match: typing.Match) -> str:
+    char = match.group(1)
+    if char is None:
+        return "'"
+    return _ESCAPES.get(char, char)
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPE_RE.sub(_unescape_match, value)
+
+
+def _parse_values(
+    groups: typing.Tuple[str, ...]
+) -> typing.Tuple[typing.Optional[str], ...]:
+    values: typing.List[typing.Optional[str]] = []
+    for quoted, bare in zip(groups[0:-1:2], groups[1:-1:2]):
+        # Bare values are never empty, so an empty one means the value was
+        # quoted.
+        if bare:
+            values.append(None if bare == "NULL" else bare.strip())
+        elif "\\" in quoted or "''" in quoted:
+            values.append(_unescape(quoted))
+        else:
+            values.append(quoted)
+    return tuple(values)
+
+
+@functools.lru_cache()
+def _get_rows_re(num_columns: int, columns: typing.Tuple[int, ...]) -> typing.Pattern:
+    """Match a whole row at a time, capturing only the values of `columns`.
+
+    Each captured column has two groups: the contents of a quoted value and a
+    bare value, only one of which is non-empty. The last group matches anything
+    which isn't a row, so that findall can't silently skip over it.
+    """
+    values = []
+    for i in range(num_columns):
+        if i in columns:
+            values.append(f"'({_QUOTED_CONTENTS})'|({_BARE})")
+        else:
+            values.append(f"'{_QUOTED_CONTENTS}'|{_BARE}")
+    row = r"\(" + ",".join(f"(?:{value})" for value in values) + r"\)[,;]?"
+    return re.compile(f"{row}|(\\S)", re.DOTALL)
+
+
+def _count_columns(line: str, pos: int) -> int:
+    """Count the values in the row starting at `pos`."""
+    num_columns = 0
+    pos += 1  # Skip the leading "("
+    while True:
+        match = _VALUE_RE.match(line, pos)
+        assert match
+        num_columns += 1
+        pos = match.end()
+        if line[pos : pos + 1] == ")":
+            return num_columns
+        if line[pos : pos + 1] != ",":
+            raise ValueError(f"Can't parse SQL row: {line[pos:pos + 50]!r}")
+        pos += 1
+
+
+def iter_insert_rows(
+    lines: typing.Iterable[str], columns: typing.Sequence[int]
+) -> typing.Iterator[typing.Tuple[typing.Optional[str], ...]]:
+    """Yield the given columns of each row inserted by a MySQL dump.
+
+    Lines other than (extended) INSERT statements are skipped, so `lines` can
+    be the dump file itself. Quoted strings are unescaped and NULLs are
+    returned as None.
+
+    Rows are matched by a regex built for the table's number of columns, so
+    each line of the dump is split into rows and values in a single pass.
+    """
+    # The regex captures columns in order, so this puts them back in the order
+    # they were asked for.
+    sorted_columns = tuple(sorted(set(columns)))
+    order = [sorted_columns.index(column) for column in columns]
+    is_ordered = order == list(range(len(order)))
+
+    for line in lines:
+        if not line.startswith("INSERT INTO"):
+            continue
+
+        pos = line.index("(", line.index(" VALUES "))
+        rows_re = _get_rows_re(_count_columns(line, pos), sorted_columns)
+        needs_unescape = "\\" in line or "''" in line
+        for groups in rows_re.findall(line, pos):
+            if groups[-1]:
+                raise ValueError(f"Can't parse SQL row near {groups[-1]!r}")
+            quoted_values: typing.Tuple[str, ...] = groups[0:-1:2]
+            values: typing.Tuple[typing.Optional[str], ...] = quoted_values
+            # Most rows only have quoted values without escapes, whose contents
+            # are already what we want.
+            if any(groups[1:-1:2]) or (
+                needs_unescape and any("\\" in v or "''" in v for v in quoted_values)
+            ):
+                values = _parse_values(groups)
+            yield values if is_ordered else tuple([values[i] for i in order])
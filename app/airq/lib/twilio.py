@@ -1,10 +1,18 @@
+import concurrent.futures
 import enum
+import functools
 import logging
+import sqlalchemy as sa
+import threading
+import time
 import typing
 
 from airq import config
+from airq.config import db
 
+from requests.adapters import HTTPAdapter
 from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 
 
@@ -23,6 +31,19 @@ class TwilioErrorCode(enum.IntEnum):
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def get_client() -> Client:
+    """A Twilio client whose HTTP connections are pooled and reused across sends."""
+    http_client = TwilioHttpClient(pool_connections=True)
+    adapter = HTTPAdapter(pool_maxsize=config.TWILIO_MAX_CONCURRENT_SENDS)
+    http_client.session.mount("https://", adapter)
+    http_client.session.mount("http://", adapter)
+    client = Client(config.TWILIO_SID, config.TWILIO_AUTHTOKEN, http_client=http_client)
+    if config.TWILIO_API_URL:
+        client.api.base_url = config.TWILIO_API_URL
+    return client
+
+
 def send_sms(
     body: str, to_number: str, locale: str, media: typing.Optional[str] = None
 ):
@@ -38,5 +59,155 @@ def send_sms(
     if config.DEV:
         logger.info("Would send SMS: %s", kwargs)
     else:
-        client = Client(config.TWILIO_SID, config.TWILIO_AUTHTOKEN)
-        client.messages.create(**kwargs)
+        get_client().messages.create(**kwargs)
+
+
+# Reserves the next `:duration` seconds for a key and returns how many seconds to
+# wait before they start. Postgres' clock is used so that every worker agrees on
+# the time.
+_RATE_LIMIT_RESERVE_SQL = """
+INSERT INTO rate_limits (key, next_allowed_at)
+VALUES (:key, date_part('epoch', clock_timestamp()) + :duration)
+ON CONFLICT (key) DO UPDATE
+SET next_allowed_at = greatest(
+    rate_limits.next_allowed_at, date_part('epoch', clock_timestamp())
+) + :duration
+RETURNING next_allowed_at - :duration - date_part('epoch', clock_timestamp())
+"""
+
+
+class RateLimiter:
+    """Spaces out calls for each key so that none exceeds `per_second`.
+
+    The schedule for each key is kept in the rate_limits table, so the limit holds
+    across every thread and Celery worker, not just within this process. Slots are
+    reserved from it `block_size` at a time (by default, a second's worth) and
+    handed out here, so that each call doesn't cost a round trip. Slots which
+    aren't used in time are skipped rather than sent in a burst.
+    """
+
+    def __init__(self, per_second: float, block_size: typing.Optional[int] = None):
+        self._interval = 1 / per_second if per_second > 0 else 0
+        self._block_size = block_size or max(1, int(per_second))
+        # Messages are sent from threads without an app context.
+        self._engine = db.engine
+        self._lock = threading.Lock()
+        # The next slot for each key, on our monotonic clock, and how many are left.
+        self._slots: typing.Dict[str, typing.Tuple[float, int]] = {}
+
+    def _reserve(self, key: str) -> float:
+        with self._engine.begin() as conn:
+            return conn.execute(
+                sa.text(_RATE_LIMIT_RESERVE_SQL),
+                key=key,
+                duration=self._interval * self._block_size,
+            ).scalar()
+
+    def wait(self, key: str):
+        if not self._interval:
+            return
+        with self._lock:
+            slot, num_left = self._slots.get(key, (0.0, 0))
+            if not num_left or slot < time.monotonic() - self._interval:
+                slot = time.monotonic() + self._reserve(key)
+                num_left = self._block_size
+            self._slots[key] = (slot + self._interval, num_left - 1)
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def get_max_messages_per_task(seconds: float) -> int:
+    """How many messages one task can be sure to send within `seconds`.
+
+    Each of our numbers is rate limited across every worker, so when all of them
+    are sending from the same number, each only gets its share of the limit.
+    Returns 0 if sends aren't rate limited.
+    """
+    if config.TWILIO_MESSAGES_PER_SECOND <= 0:
+        return 0
+    per_second = config.TWILIO_MESSAGES_PER_SECOND / config.CELERY_WORKER_CONCURRENCY
+    return max(1, int(seconds * per_second))
+
+
+TTag = typing.TypeVar("TTag")
+
+
+class SmsDispatcher(typing.Generic[TTag]):
+    """Sends text messages concurrently over the shared Twilio client.
+
+    Each message is submitted with a tag (e.g., the client it's for). Results are
+    handed back, tagged, on the thread that iterates `results()`, so callers can
+    safely touch the database when handling them.
+    """
+
+    def __init__(
+        self,
+        max_workers: typing.Optional[int] = None,
+        per_second: typing.Optional[float] = None,
+    ):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or config.TWILIO_MAX_CONCURRENT_SENDS,
+            thread_name_prefix="sms",
+        )
+        if per_second is None:
+            # Messages are only logged in dev, so there's nothing to limit.
+            per_second = 0 if config.DEV else config.TWILIO_MESSAGES_PER_SECOND
+        self._rate_limiter = RateLimiter(per_second)
+        self._futures: typing.Dict[concurrent.futures.Future, TTag] = {}
+        self._started_at = time.perf_counter()
+        self.num_sent = 0
+        self.num_failed = 0
+
+    def __enter__(self) -> "SmsDispatcher[TTag]":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _send(
+        self, body: str, to_number: str, locale: str, media: typing.Optional[str]
+    ):
+        self._rate_limiter.wait(config.TWILIO_NUMBERS.get(locale, ""))
+        send_sms(body, to_number, locale, media=media)
+
+    def submit(
+        self,
+        tag: TTag,
+        body: str,
+        to_number: str,
+        locale: str,
+        media: typing.Optional[str] = None,
+    ):
+        future = self._executor.submit(self._send, body, to_number, locale, media)
+        self._futures[future] = tag
+
+    def results(
+        self,
+    ) -> typing.Iterator[typing.Tuple[TTag, typing.Optional[Exception]]]:
+        """Yield (tag, exception) for each submitted message as it completes.
+
+        The exception is None if the message was sent.
+        """
+        for future in concurrent.futures.as_completed(list(self._futures)):
+            tag = self._futures.pop(future)
+            exc = future.exception()
+            if exc is None:
+                self.num_sent += 1
+            else:
+                self.num_failed += 1
+            yield tag, typing.cast(typing.Optional[Exception], exc)
+
+    @property
+    def messages_per_second(self) -> float:
+        elapsed = time.perf_counter() - self._started_at
+        return self.num_sent / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        logger.info(
+            "Sent %s messages (%s failed) at %.1f messages/second",
+            self.num_sent,
+            self.num_failed,
+            self.messages_per_second,
+        )
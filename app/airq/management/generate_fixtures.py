@@ -1,11 +1,12 @@
 import json
+import numpy as np
 import os
 import pathlib
 import requests
 import shutil
 import zipfile
 
-from airq.lib.geo import haversine_distance
+from airq.lib.geo import haversine_many
 from airq.lib.http import chunked_download
 from airq.lib.purpleair import call_purpleair_api
 from airq.sync.geonames import COUNTRY_CODE
@@ -17,8 +18,10 @@ COORDINATES = (45.5181, -122.6745)  # Central Portland
 RADIUS = 100
 
 
-def _is_in_range(lat: float, lon: float):
-    return haversine_distance(lon, lat, COORDINATES[1], COORDINATES[0]) < RADIUS
+def _is_in_range(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Whether each point is within RADIUS of COORDINATES (False for missing points)."""
+    with np.errstate(invalid="ignore"):
+        return haversine_many(lons, lats, COORDINATES[1], COORDINATES[0]) < RADIUS
 
 
 def generate_fixtures():
@@ -44,14 +47,13 @@ def generate_fixtures():
     longitude_idx = fields.index("longitude")
     last_seen_idx = fields.index("last_seen")
 
-    for data in response_json["data"]:
-        latitude = data[latitude_idx]
-        longitude = data[longitude_idx]
-        if (
-            latitude is not None
-            and longitude is not None
-            and _is_in_range(latitude, longitude)
-        ):
+    # Numpy converts missing coordinates to NaN, which are never in range.
+    in_range = _is_in_range(
+        np.array([data[latitude_idx] for data in response_json["data"]], dtype=float),
+        np.array([data[longitude_idx] for data in response_json["data"]], dtype=float),
+    )
+    for data, is_in_range in zip(response_json["data"], in_range):
+        if is_in_range:
             data[last_seen_idx] = timestamp
             results.append(data)
         else:
@@ -73,15 +75,18 @@ def generate_fixtures():
     num_skipped = 0
     with zipfile.ZipFile(tmpfile) as zf:
         with zf.open(f"{COUNTRY_CODE}.txt", "r") as fd:
-            for line in fd.readlines():
-                fields = line.decode().strip().split("\t")
-                latitude = float(fields[9].strip())
-                longitude = float(fields[10].strip())
-                if _is_in_range(latitude, longitude):
-                    num_kept += 1
-                    lines += line.decode()
-                else:
-                    num_skipped += 1
+            raw_lines = [line.decode() for line in fd.readlines()]
+    rows = [line.strip().split("\t") for line in raw_lines]
+    in_range = _is_in_range(
+        np.array([float(fields[9].strip()) for fields in rows]),
+        np.array([float(fields[10].strip()) for fields in rows]),
+    )
+    for line, is_in_range in zip(raw_lines, in_range):
+        if is_in_range:
+            num_kept += 1
+            lines += line
+        else:
+            num_skipped += 1
 
     tmpdir = "/tmp/geonames_out.zip"
     try:
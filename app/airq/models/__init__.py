@@ -1,6 +1,10 @@
+from . import bulk_sends
 from . import cities
 from . import clients
+from . import dashboard
 from . import events
+from . import imports
+from . import rate_limits
 from . import relations
 from . import sensors
 from . import users
@@ -0,0 +1,225 @@
+import dataclasses
+import datetime
+import typing
+
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from airq.config import CELERY_VISIBILITY_TIMEOUT_SECONDS
+from airq.config import db
+from airq.lib.clock import now
+from airq.lib.twilio import get_max_messages_per_task
+from airq.lib.util import chunk_list
+from airq.models.clients import Client
+from airq.models.clients import ClientQuery
+
+
+# Each chunk is sent by its own task. Keep these small enough that a chunk
+# finishes well within the broker's visibility timeout, even when every worker
+# is sending and sharing the rate limit.
+BULK_SEND_CHUNK_SIZE = min(
+    100, get_max_messages_per_task(CELERY_VISIBILITY_TIMEOUT_SECONDS / 4) or 100
+)
+
+# Within a chunk, clients are checked for whether they've already been sent the
+# message in batches of this many, just before the batch is sent.
+BULK_SEND_BATCH_SIZE = 10
+
+# A bulk send can only be resumed once nobody has been sent it for this long.
+# Resuming one whose chunks are still running would pick clients who are about
+# to get the message, and they'd get it twice.
+BULK_SEND_STALL_SECONDS = 10 * 60
+
+
+@dataclasses.dataclass
+class BulkSendProgress:
+    num_recipients: int
+    num_sent: int
+    seconds: float
+
+    @property
+    def percent_complete(self) -> float:
+        if not self.num_recipients:
+            return 100.0
+        return 100 * min(self.num_sent / self.num_recipients, 1)
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.num_sent / self.seconds if self.seconds else 0.0
+
+
+class BulkSendQuery(BaseQuery):
+    def create(self, message: str, last_active_at: float) -> "BulkSend":
+        bulk_send = BulkSend(
+            message=message,
+            last_active_at=last_active_at,
+            num_recipients=Client.query.filter_inactive_since(last_active_at).count(),
+        )
+        db.session.add(bulk_send)
+        db.session.commit()
+        return bulk_send
+
+
+class BulkSend(db.Model):  # type: ignore
+    """A message sent to every client who has been inactive since some time."""
+
+    __tablename__ = "bulk_sends"
+
+    query_class = BulkSendQuery
+
+    id = db.Column(db.Integer(), primary_key=True)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), default=now, nullable=False)
+    completed_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+    resumed_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+    message = db.Column(db.Text(), nullable=False)
+    last_active_at = db.Column(db.Float(), nullable=False)
+    num_recipients = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<BulkSend {self.id}>"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.completed_at is not None
+
+    def _filter_unsent(self, query: ClientQuery) -> ClientQuery:
+        return query.filter_inactive_since(self.last_active_at).filter(
+            ~BulkSendRecipient.query.filter(
+                BulkSendRecipient.bulk_send_id == self.id,
+                BulkSendRecipient.client_id == Client.id,
+            ).exists()
+        )
+
+    def get_chunks(self) -> typing.Iterator[typing.Tuple[int, int]]:
+        """Split the clients we haven't sent to yet into ranges of ids.
+
+        Each range is (after_id, through_id]. Ranges are found by paging through
+        client ids in order, so we never need to hold all of them in memory.
+        """
+        after_id = 0
+        while True:
+            client_ids = [
+                client_id
+                for client_id, in self._filter_unsent(Client.query)
+                .filter(Client.id > after_id)
+                .order_by(Client.id)
+                .with_entities(Client.id)
+                .limit(BULK_SEND_CHUNK_SIZE)
+            ]
+            if not client_ids:
+                return
+            yield after_id, client_ids[-1]
+            after_id = client_ids[-1]
+
+    def send_chunk(self, after_id: int, through_id: int) -> int:
+        """Send the message to the clients in a range who haven't gotten it yet.
+
+        Each batch of clients is checked against the recipients just before it's
+        sent, and each recipient is recorded as soon as their message is sent. So
+        if the chunk is redelivered, or the send resumed, while this is still
+        running, the two skip whoever the other has already messaged.
+        """
+        client_ids = [
+            client_id
+            for client_id, in self._filter_unsent(Client.query)
+            .filter(Client.id > after_id)
+            .filter(Client.id <= through_id)
+            .order_by(Client.id)
+            .with_entities(Client.id)
+        ]
+        bulk_send_id = self.id
+        num_sent = 0
+        for batch_ids in chunk_list(client_ids, BULK_SEND_BATCH_SIZE):
+            clients = (
+                self._filter_unsent(Client.query)
+                .filter(Client.id.in_(batch_ids))
+                .all()
+            )
+            # Committing expires the clients, so read their ids up front.
+            ids = {client: client.id for client in clients}
+            for client in Client.send_messages(
+                (client, self.message) for client in clients
+            ):
+                db.session.execute(
+                    insert(BulkSendRecipient.__table__)
+                    .values(
+                        bulk_send_id=bulk_send_id,
+                        client_id=ids[client],
+                        sent_at=now(),
+                    )
+                    .on_conflict_do_nothing()
+                )
+                db.session.commit()
+                num_sent += 1
+        return num_sent
+
+    def get_last_progress_at(self) -> datetime.datetime:
+        """When this was last started, resumed, or sent to someone."""
+        last_sent_at = (
+            BulkSendRecipient.query.filter(BulkSendRecipient.bulk_send_id == self.id)
+            .with_entities(func.max(BulkSendRecipient.sent_at))
+            .scalar()
+        )
+        return max(
+            t for t in (self.created_at, self.resumed_at, last_sent_at) if t is not None
+        )
+
+    @property
+    def is_stalled(self) -> bool:
+        if self.is_complete:
+            return False
+        stalled_seconds = (now() - self.get_last_progress_at()).total_seconds()
+        return stalled_seconds >= BULK_SEND_STALL_SECONDS
+
+    def resume(self) -> bool:
+        """Mark this as resumed, unless it's still making progress.
+
+        This is checked and updated in a single UPDATE, so if it's resumed twice
+        at once only one of them succeeds. Returns whether it was resumed.
+        """
+        cutoff = now() - datetime.timedelta(seconds=BULK_SEND_STALL_SECONDS)
+        num_updated = BulkSend.query.filter(
+            BulkSend.id == self.id,
+            BulkSend.completed_at.is_(None),
+            func.coalesce(BulkSend.resumed_at, BulkSend.created_at) <= cutoff,
+            ~BulkSendRecipient.query.filter(
+                BulkSendRecipient.bulk_send_id == self.id,
+                BulkSendRecipient.sent_at > cutoff,
+            ).exists(),
+        ).update({"resumed_at": now()}, synchronize_session=False)
+        db.session.commit()
+        return bool(num_updated)
+
+    def mark_complete(self):
+        # A resumed send is completed by each run which finishes; keep the first.
+        if self.completed_at is None:
+            self.completed_at = now()
+            db.session.commit()
+
+    def get_progress(self) -> BulkSendProgress:
+        num_sent = BulkSendRecipient.query.filter(
+            BulkSendRecipient.bulk_send_id == self.id
+        ).count()
+        ended_at = self.completed_at or now()
+        return BulkSendProgress(
+            num_recipients=self.num_recipients,
+            num_sent=num_sent,
+            seconds=(ended_at - self.created_at).total_seconds(),
+        )
+
+
+class BulkSendRecipient(db.Model):  # type: ignore
+    __tablename__ = "bulk_send_recipients"
+
+    bulk_send_id = db.Column(
+        db.Integer(),
+        db.ForeignKey("bulk_sends.id", name="bulk_send_recipients_bulk_send_id_fkey"),
+        primary_key=True,
+    )
+    client_id = db.Column(
+        db.Integer(),
+        db.ForeignKey("clients.id", name="bulk_send_recipients_client_id_fkey"),
+        primary_key=True,
+    )
+    sent_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
@@ -8,10 +8,13 @@ from flask_babel import lazy_gettext
 from flask_sqlalchemy import BaseQuery
 from sqlalchemy import and_
 from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from twilio.base.exceptions import TwilioRestException
 
 from airq.config import db
+from airq.lib.client_preferences import ClientPreferencesRegistry
 from airq.lib.client_preferences import IntegerChoicesPreference
 from airq.lib.client_preferences import IntegerPreference
 from airq.lib.clock import now
@@ -20,6 +23,7 @@ from airq.lib.readings import Pm25
 from airq.lib.readings import pm25_to_aqi
 from airq.lib.sms import coerce_phone_number
 from airq.lib.twilio import send_sms
+from airq.lib.twilio import SmsDispatcher
 from airq.lib.twilio import TwilioErrorCode
 from airq.models.events import Event
 from airq.models.events import EventType
@@ -28,6 +32,9 @@ from airq.models.zipcodes import Zipcode
 
 logger = logging.getLogger(__name__)
 
+# Windows, in days, for which the admin page shows how many clients were active.
+ACTIVITY_WINDOWS = [1, 2, 3, 4, 5, 6, 7, 30]
+
 
 class ClientIdentifierType(enum.Enum):
     PHONE_NUMBER = 1
@@ -43,7 +50,7 @@ class ClientQuery(BaseQuery):
     def get_or_create(
         self, identifier: str, type_code: ClientIdentifierType, locale: str
     ) -> typing.Tuple["Client", bool]:
-        client = self.filter_by(identifier=identifier, type_code=type_code).first()
+        client = self.get_with_context(identifier, type_code)
         if not client:
             client = Client(
                 identifier=identifier,
@@ -58,6 +65,20 @@ class ClientQuery(BaseQuery):
             was_created = False
         return client, was_created
 
+    def get_with_context(
+        self, identifier: str, type_code: ClientIdentifierType
+    ) -> typing.Optional["Client"]:
+        """Get a client along with everything needed to handle its messages.
+
+        The client's zipcode and city are loaded in the same query, and the client
+        row itself carries its conversation state (see `log_event`).
+        """
+        return (
+            self.filter_by(identifier=identifier, type_code=type_code)
+            .options(joinedload(Client.zipcode).joinedload(Zipcode.city))
+            .first()
+        )
+
     def get_by_phone_number(self, phone_number: str) -> typing.Optional["Client"]:
         phone_number = coerce_phone_number(phone_number)
         return self.filter_phones().filter_by(identifier=phone_number).first()
@@ -84,18 +105,53 @@ class ClientQuery(BaseQuery):
             .filter(Client.zipcode_id.isnot(None))
         )
 
-    def filter_eligible_for_share_requests(self) -> "ClientQuery":
-        subq = (
-            Event.query.filter(Event.type_code == EventType.SHARE_REQUEST)
-            .filter(Event.timestamp > Client.get_share_request_cutoff())
-            .with_entities(Event.client_id, Event.timestamp)
-            .subquery()
+    def filter_alert_candidates(self) -> "ClientQuery":
+        """Clients eligible for sending who pass the cheap checks in `maybe_notify`.
+
+        The alert frequency, AQI level change and alert threshold are all checked
+        here so that we only load clients we're likely to alert. `maybe_notify`
+        still makes the final call.
+        """
+        alert_frequency = func.coalesce(
+            Client.preferences["alert_frequency"].as_integer(),
+            ClientPreferencesRegistry.get_default("alert_frequency"),
+        )
+        alert_threshold = func.coalesce(
+            Client.preferences["alert_threshold"].as_integer(),
+            ClientPreferencesRegistry.get_default("alert_threshold"),
         )
+        curr_aqi_level = Pm25.from_measurement_expression(Zipcode.pm25)
+        last_aqi_level = Pm25.from_measurement_expression(Client.last_pm25)
+        return (
+            self.filter_phones()
+            .join(Client.zipcode)
+            .options(contains_eager(Client.zipcode).joinedload(Zipcode.city))
+            .filter(Client.alerts_disabled_at == 0)
+            .filter(Client.last_pm25.isnot(None))
+            .filter(Client.last_alert_sent_at < timestamp() - alert_frequency * 60 * 60)
+            .filter(curr_aqi_level != last_aqi_level)
+            .filter(
+                ~and_(
+                    curr_aqi_level < alert_threshold, last_aqi_level <= alert_threshold
+                )
+            )
+            .filter(
+                ~and_(
+                    curr_aqi_level == alert_threshold, last_aqi_level < alert_threshold
+                )
+            )
+        )
+
+    def filter_eligible_for_share_requests(self) -> "ClientQuery":
         share_window_start, share_window_end = Client.get_share_window()
         return (
             self.filter_phones()
-            .outerjoin(subq, and_(subq.c.client_id == Client.id))
-            .filter(subq.c.timestamp == None)
+            .filter(
+                or_(
+                    Client.last_share_request_at == None,
+                    Client.last_share_request_at <= Client.get_share_request_cutoff(),
+                )
+            )
             # Client must have signed up more than 7 days ago
             .filter(Client.created_at < now() - datetime.timedelta(days=7))
             .filter(Client.last_alert_sent_at > share_window_start)
@@ -132,16 +188,28 @@ class ClientQuery(BaseQuery):
             .count()
         )
 
-    def get_activity_counts(self):
-        windows = [1, 2, 3, 4, 5, 6, 7, 30]
+    def get_activity_counts(self) -> typing.Dict[int, int]:
+        """Number of clients active (or alerted) within each of the last few days."""
         curr_time = timestamp()
-        counts = {window: 0 for window in windows}
-        for client in self.filter_phones().all():
-            for window in windows:
-                ts = curr_time - (window * 24 * 60 * 60)
-                if client.last_activity_at > ts or client.last_alert_sent_at > ts:
-                    counts[window] += 1
-        return counts
+        cutoffs = [curr_time - (window * 24 * 60 * 60) for window in ACTIVITY_WINDOWS]
+        last_active_at = func.greatest(
+            Client.last_activity_at, Client.last_alert_sent_at
+        )
+        counts = (
+            self.filter_phones()
+            # Lets Postgres use the indexes on both columns to skip inactive clients.
+            .filter(
+                or_(
+                    Client.last_activity_at > min(cutoffs),
+                    Client.last_alert_sent_at > min(cutoffs),
+                )
+            )
+            .with_entities(
+                *[func.count().filter(last_active_at > cutoff) for cutoff in cutoffs]
+            )
+            .one()
+        )
+        return dict(zip(ACTIVITY_WINDOWS, counts))
 
 
 class Client(db.Model):  # type: ignore
@@ -177,6 +245,11 @@ class Client(db.Model):  # type: ignore
 
     preferences = db.Column(db.JSON(), nullable=True)
 
+    # Denormalized from the events table by `log_event`.
+    last_inbound_event_type = db.Column(db.Integer(), nullable=True)
+    last_inbound_event_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+    last_share_request_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+
     zipcode = db.relationship("Zipcode")
     events = db.relationship("Event")
 
@@ -215,10 +288,14 @@ class Client(db.Model):  # type: ignore
     #
 
     def mark_seen(self, locale: str):
+        """Record that the client just messaged us.
+
+        This isn't committed here; it's written along with whatever else the
+        client's message changes.
+        """
         self.last_activity_at = timestamp()
         if self.locale != locale:
             self.locale = locale
-        db.session.commit()
 
     #
     # Prefs
@@ -302,40 +379,85 @@ class Client(db.Model):  # type: ignore
             try:
                 send_sms(message, self.identifier, self.locale, media=media)
             except TwilioRestException as e:
-                code = TwilioErrorCode.from_exc(e)
-                if code:
-                    logger.warning(
-                        "Disabling alerts for recipient %s: %s",
-                        self,
-                        code.name,
-                    )
-                    self.disable_alerts(is_automatic=True)
+                if self.handle_send_error(e):
                     return False
-                else:
-                    raise
+                raise
         else:
             # Other clients types don't yet support message sending.
             logger.info("Not messaging client %s: %s", self.id, message)
 
         return True
 
+    def handle_send_error(self, exc: BaseException) -> bool:
+        """Disable alerts if Twilio says we can't message this client.
+
+        Returns whether the error was handled.
+        """
+        code = None
+        if isinstance(exc, TwilioRestException):
+            code = TwilioErrorCode.from_exc(exc)
+        if not code:
+            return False
+
+        logger.warning(
+            "Disabling alerts for recipient %s: %s",
+            self,
+            code.name,
+        )
+        self.disable_alerts(is_automatic=True)
+        return True
+
+    @classmethod
+    def send_messages(
+        cls, messages: typing.Iterable[typing.Tuple["Client", str]]
+    ) -> typing.Iterator["Client"]:
+        """Send each client its message concurrently, yielding the clients we reached.
+
+        Failures are handled here, on the calling thread, just as `send_message`
+        would handle them.
+        """
+        with SmsDispatcher["Client"]() as dispatcher:
+            for client, message in messages:
+                if client.type_code == ClientIdentifierType.PHONE_NUMBER:
+                    dispatcher.submit(client, message, client.identifier, client.locale)
+                else:
+                    # Other clients types don't yet support message sending.
+                    logger.info("Not messaging client %s: %s", client.id, message)
+                    yield client
+
+            for client, exc in dispatcher.results():
+                if exc is None:
+                    yield client
+                elif not client.handle_send_error(exc):
+                    logger.error(
+                        "Failed to send message to %s: %s", client, exc, exc_info=exc
+                    )
+
     def maybe_notify(self) -> bool:
-        if not self.is_in_send_window:
+        message = self.get_alert_message()
+        if message is None or not self.send_message(message):
             return False
 
+        self.mark_alerted()
+        return True
+
+    def get_alert_message(self) -> typing.Optional[str]:
+        """The alert we should send this client right now, if any."""
+        if not self.is_in_send_window:
+            return None
+
         alert_frequency = self.alert_frequency * 60 * 60
         if self.last_alert_sent_at >= timestamp() - alert_frequency:
-            return False
+            return None
 
         curr_pm25 = self.zipcode.pm25
-        curr_humidity = self.zipcode.humidity
         curr_aqi_level = Pm25.from_measurement(curr_pm25)
         curr_aqi = pm25_to_aqi(curr_pm25)
 
         # Only send if the pm25 changed a level since the last time we sent this alert.
         last_aqi_level = Pm25.from_measurement(self.last_pm25)
         if curr_aqi_level == last_aqi_level:
-            return False
+            return None
 
         alert_threshold = self.alert_threshold
 
@@ -346,12 +468,12 @@ class Client(db.Model):  # type: ignore
         # or from UNHEALTHY to MODERATE, but will be notified if the AQI transitions from
         # VERY UNHEALTHY to UNHEALTHY.
         if curr_aqi_level < alert_threshold and last_aqi_level <= alert_threshold:
-            return False
+            return None
 
         # If the current AQI is at the alert threshold but the last AQI was under it,
         # don't send the alert because we haven't crossed the threshold yet.
         if curr_aqi_level == alert_threshold and last_aqi_level < alert_threshold:
-            return False
+            return None
 
         # Do not alert clients who received an alert recently unless AQI has changed markedly.
         was_alerted_recently = self.last_alert_sent_at > timestamp() - (60 * 60 * 6)
@@ -362,34 +484,40 @@ class Client(db.Model):  # type: ignore
             and curr_aqi
             and abs(curr_aqi - last_aqi) < 20
         ):
-            return False
+            return None
 
-        message = gettext(
+        return gettext(
             'Air quality in %(city)s %(zipcode)s has changed to %(curr_aqi_level)s (AQI %(curr_aqi)s).\n\n Reply "M" for Menu or "E" to end alerts.',
             city=self.zipcode.city.name,
             zipcode=self.zipcode.zipcode,
             curr_aqi_level=curr_aqi_level.display,
             curr_aqi=curr_aqi,
         )
-        if not self.send_message(message):
-            return False
 
+    def mark_alerted(self):
+        """Record that we just sent this client an alert about its zipcode."""
+        curr_pm25 = self.zipcode.pm25
         self.last_alert_sent_at = timestamp()
         self.last_pm25 = curr_pm25
-        self.last_humidity = curr_humidity
+        self.last_humidity = self.zipcode.humidity
         self.num_alerts_sent += 1
-        db.session.commit()
-
         self.log_event(EventType.ALERT, zipcode=self.zipcode.zipcode, pm25=curr_pm25)
 
+    def request_share(self) -> bool:
+        message = self.get_share_request_message()
+        if message is None or not self.send_message(message):
+            return False
+
+        self.mark_share_requested()
         return True
 
-    def request_share(self) -> bool:
+    def get_share_request_message(self) -> typing.Optional[str]:
+        """The share request we should send this client right now, if any."""
         if not self.is_in_send_window:
-            return False
+            return None
 
         if self.created_at >= now() - datetime.timedelta(days=7):
-            return False
+            return None
 
         # Double check that we're all good to go
         share_window_start, share_window_end = self.get_share_window()
@@ -398,27 +526,41 @@ class Client(db.Model):  # type: ignore
             or self.last_alert_sent_at <= share_window_start
             or self.last_alert_sent_at >= share_window_end
         ):
-            return False
+            return None
 
         # Check the last share request we sent was a long time ago
-        share_request = self.get_last_share_request()
-        if share_request and share_request.timestamp >= self.get_share_request_cutoff():
-            return False
+        if (
+            self.last_share_request_at
+            and self.last_share_request_at >= self.get_share_request_cutoff()
+        ):
+            return None
 
-        message = gettext(
+        return gettext(
             "Has Hazebot been helpful? We’re looking for ways to grow and improve, and we’d love your help. Save our contact and share Hazebot with a friend, or text “feedback” to send feedback."
         )
-        if not self.send_message(message):
-            return False
 
-        Event.query.create(self.id, EventType.SHARE_REQUEST)
-        return True
+    def mark_share_requested(self):
+        """Record that we just asked this client to share Hazebot."""
+        self.log_event(EventType.SHARE_REQUEST)
 
     #
     # Events
     #
 
+    @staticmethod
+    def is_inbound_event_type(event_type: typing.Any) -> typing.Any:
+        """Whether an event (or, in a query, a type_code column) was sent by the client."""
+        if isinstance(event_type, EventType):
+            return event_type not in (EventType.ALERT, EventType.SHARE_REQUEST)
+        return ~event_type.in_([EventType.ALERT, EventType.SHARE_REQUEST])
+
     def log_event(self, event_type: EventType, **event_data: typing.Any) -> Event:
+        # These are committed along with the event.
+        if self.is_inbound_event_type(event_type):
+            self.last_inbound_event_type = event_type
+            self.last_inbound_event_at = now()
+        elif event_type == EventType.SHARE_REQUEST:
+            self.last_share_request_at = now()
         return Event.query.create(self.id, event_type, **event_data)
 
     def _get_last_event_by_type(self, event_type: EventType) -> typing.Optional[Event]:
@@ -438,17 +580,14 @@ class Client(db.Model):  # type: ignore
     def get_last_client_event(self) -> typing.Optional[Event]:
         return (
             Event.query.filter(Event.client_id == self.id)
-            .filter(
-                ~Event.type_code.in_([EventType.ALERT, EventType.SHARE_REQUEST])
-            )  # filter for only inbound events
+            .filter(self.is_inbound_event_type(Event.type_code))
             .order_by(Event.timestamp.desc())
             .first()
         )
 
     def get_last_client_event_type(self) -> typing.Optional[EventType]:
-        last_event = self.get_last_client_event()
-        if last_event:
-            return EventType(last_event.type_code)
+        if self.last_inbound_event_type is not None:
+            return EventType(self.last_inbound_event_type)
         return None
 
     def should_accept_feedback(self) -> bool:
@@ -457,9 +596,7 @@ class Client(db.Model):  # type: ignore
         ) or self.has_recent_last_event_of_type(EventType.UNSUBSCRIBE)
 
     def has_recent_last_event_of_type(self, event_type: EventType) -> bool:
-        last_event = self.get_last_client_event()
         return bool(
-            last_event
-            and last_event.type_code == event_type
-            and now() - last_event.timestamp < Client.EVENT_RESPONSE_TIME
+            self.last_inbound_event_type == event_type
+            and now() - self.last_inbound_event_at < Client.EVENT_RESPONSE_TIME
         )
@@ -0,0 +1,94 @@
+import typing
+
+from flask_sqlalchemy import BaseQuery
+
+from airq.config import db
+from airq.lib.clock import now
+from airq.models.clients import Client
+from airq.models.events import Event
+
+
+# Id of the Postgres advisory lock held while a refresh runs.
+REFRESH_LOCK_ID = 1
+
+
+class DashboardSnapshotQuery(BaseQuery):
+    def get_latest(self) -> typing.Optional["DashboardSnapshot"]:
+        return self.order_by(DashboardSnapshot.created_at.desc()).first()
+
+    def get_latest_id(self) -> int:
+        """The id of the latest snapshot, or 0 if there isn't one yet."""
+        snapshot = self.get_latest()
+        return snapshot.id if snapshot else 0
+
+    def refresh(
+        self, stale_id: typing.Optional[int] = None
+    ) -> typing.Optional["DashboardSnapshot"]:
+        """Create a snapshot, unless another refresh is running.
+
+        If `stale_id` is given, the refresh is also skipped unless it's still the
+        latest snapshot's id (see `get_latest_id`), since otherwise a refresh queued
+        after it has already replaced it. So any number of refreshes queued for the
+        same snapshot only compute one.
+        """
+        # Released when the transaction ends, i.e. once the snapshot is committed.
+        is_locked = db.session.execute(
+            "SELECT pg_try_advisory_xact_lock(:lock_id)",
+            {"lock_id": REFRESH_LOCK_ID},
+        ).scalar()
+        if not is_locked:
+            return None
+        if stale_id is not None and self.get_latest_id() != stale_id:
+            db.session.rollback()
+            return None
+        return self.create()
+
+    def create(self) -> "DashboardSnapshot":
+        """Compute the admin dashboard's stats and replace the previous snapshot."""
+        snapshot = DashboardSnapshot(
+            data={
+                "summary": {
+                    "Total Alerts Sent": Client.query.get_total_num_sends(),
+                    "Total Subscribed Clients": Client.query.get_total_num_subscriptions(),
+                    "Total New Clients": Client.query.get_total_new(),
+                    "Total Clients": Client.query.filter_phones().count(),
+                },
+                "activity_counts": Client.query.get_activity_counts(),
+                "event_stats": Event.query.get_stats(),
+            },
+        )
+        db.session.add(snapshot)
+        db.session.flush()
+        self.filter(DashboardSnapshot.id != snapshot.id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return snapshot
+
+
+class DashboardSnapshot(db.Model):  # type: ignore
+    """Stats for the admin dashboard, which are too slow to compute on page load."""
+
+    __tablename__ = "dashboard_snapshots"
+
+    query_class = DashboardSnapshotQuery
+
+    id = db.Column(db.Integer(), primary_key=True)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), default=now, nullable=False)
+    # Postgres' json type preserves key order, which the dashboard's tables rely on.
+    data = db.Column(db.JSON(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DashboardSnapshot {self.created_at}>"
+
+    @property
+    def summary(self) -> typing.Dict[str, int]:
+        return self.data["summary"]
+
+    @property
+    def activity_counts(self) -> typing.Dict[str, int]:
+        return self.data["activity_counts"]
+
+    @property
+    def event_stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        return self.data["event_stats"]
@@ -1,18 +1,39 @@
 import collections
+import contextlib
 import datetime
 import dataclasses
 import enum
+import logging
+import pytz
+import threading
 import typing
 
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import and_
 from sqlalchemy import desc
 from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
 
 from airq.config import db
 from airq.lib import clock
 from airq.lib.util import data_matches_schema
 
 
+logger = logging.getLogger(__name__)
+
+# Stats are bucketed by day in Postgres' "PST", which is always UTC-8.
+STATS_TIMEZONE = pytz.FixedOffset(-8 * 60)
+
+
+def get_stats_date(dt: datetime.datetime) -> datetime.date:
+    return dt.astimezone(STATS_TIMEZONE).date()
+
+
+def get_stats_day_start(date: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(date, datetime.time(), tzinfo=STATS_TIMEZONE)
+
+
 class EventSchema(typing.Protocol):
     def __call__(self, **kwargs: typing.Any) -> object:
         ...
@@ -38,16 +59,147 @@ class EventType(enum.IntEnum):
     DONATE = 16
 
 
+class EventBuffer:
+    """Collects events so that they can be written with a single INSERT.
+
+    Rows are validated as they are added. If the multi-row INSERT fails, we fall
+    back to writing events one at a time, each in its own savepoint, so that one
+    bad row can't take the rest of the batch down with it. Rows which are
+    rejected on their own are logged in full, since writing them again would
+    fail the same way.
+
+    If the commit itself fails, every row is lost along with the transaction, so
+    the rows are handed to the `write_events` task to be written again (unless
+    `requeue` is False, as it is in that task, which retries on its own).
+    """
+
+    def __init__(self, requeue: bool = True):
+        self._rows: typing.List[typing.Dict[str, typing.Any]] = []
+        self._requeue = requeue
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, event: "Event"):
+        self._rows.append(
+            {
+                "client_id": event.client_id,
+                "type_code": event.type_code,
+                "timestamp": event.timestamp,
+                "json_data": event.json_data,
+            }
+        )
+
+    def load(self, rows: typing.List[typing.Dict[str, typing.Any]]):
+        """Add rows which were serialized by `dump`."""
+        for row in rows:
+            self._rows.append(
+                dict(row, timestamp=datetime.datetime.fromisoformat(row["timestamp"]))
+            )
+
+    @staticmethod
+    def dump(
+        rows: typing.List[typing.Dict[str, typing.Any]]
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        return [dict(row, timestamp=row["timestamp"].isoformat()) for row in rows]
+
+    def flush(self) -> int:
+        """Write the buffered events and commit the session."""
+        rows, self._rows = self._rows, []
+        num_written = 0
+        try:
+            if rows:
+                num_written = self._write(rows)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            logger.exception("Failed to commit %s events", len(rows))
+            if self._requeue:
+                self._requeue_rows(rows)
+            raise
+        return num_written
+
+    def _requeue_rows(self, rows: typing.List[typing.Dict[str, typing.Any]]):
+        from airq.tasks import write_events
+
+        try:
+            write_events.delay(self.dump(rows))
+        except Exception:
+            logger.exception("Failed to requeue %s events: %s", len(rows), rows)
+
+    def _write(self, rows: typing.List[typing.Dict[str, typing.Any]]) -> int:
+        table = Event.__table__
+        if len(rows) == 1:
+            # There's nothing to fall back to, so skip the savepoint.
+            db.session.execute(table.insert().values(rows))
+            return 1
+
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(rows))
+            return len(rows)
+        except SQLAlchemyError:
+            logger.exception(
+                "Failed to write %s events; writing them one at a time", len(rows)
+            )
+
+        num_written = 0
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(row))
+                num_written += 1
+            except SQLAlchemyError:
+                logger.exception("Failed to write event: %s", row)
+        return num_written
+
+
+_local = threading.local()
+
+
 class EventQuery(BaseQuery):
     def create(
         self, client_id: int, type_code: EventType, **data: typing.Any
     ) -> "Event":
-        event = Event(client_id=client_id, type_code=type_code, json_data=data or {})
+        event = Event(
+            client_id=client_id,
+            type_code=type_code,
+            timestamp=clock.now(),
+            json_data=data or {},
+        )
         event.validate()
-        db.session.add(event)
-        db.session.commit()
+        buffer = getattr(_local, "buffer", None)
+        if buffer is not None:
+            buffer.add(event)
+        else:
+            db.session.add(event)
+            db.session.commit()
         return event
 
+    @contextlib.contextmanager
+    def buffered(self) -> typing.Iterator[EventBuffer]:
+        """Buffer events created in this block and write them all when it exits.
+
+        The session is committed along with the events, so callers don't need
+        to commit on their own. If the block raises, the events are discarded
+        and the session is rolled back instead. Nested blocks share the
+        outermost buffer.
+        """
+        buffer = getattr(_local, "buffer", None)
+        if buffer is not None:
+            yield buffer
+            return
+
+        buffer = _local.buffer = EventBuffer()
+        try:
+            yield buffer
+        except BaseException:
+            _local.buffer = None
+            db.session.rollback()
+            raise
+        _local.buffer = None
+        buffer.flush()
+
     def get_stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
         cutoff = clock.now() - datetime.timedelta(days=30)
         metrics = [m.name for m in EventType]
@@ -57,16 +209,41 @@ class EventQuery(BaseQuery):
             lambda: {name: 0 for name in keys}
         )
         totals = {name: 0 for name in keys}
-        for date, type_code, count in (
-            self.filter(Event.timestamp > cutoff)
+
+        # Whole days come from the rollup. The cutoff falls partway through the
+        # first day, and the last day in the rollup may have been partial when it
+        # was counted, so those and anything since are counted from the events
+        # themselves (which is cheap, since they're ranges on `timestamp`).
+        first_full_date = get_stats_date(cutoff) + datetime.timedelta(days=1)
+        counted_through = max(
+            EventCount.query.get_last_date() or first_full_date, first_full_date
+        )
+        counts = (
+            EventCount.query.filter(EventCount.date >= first_full_date)
+            .filter(EventCount.date < counted_through)
+            .with_entities(EventCount.date, EventCount.type_code, EventCount.count)
+            .all()
+        )
+        counts.extend(
+            self.filter(
+                or_(
+                    and_(
+                        Event.timestamp > cutoff,
+                        Event.timestamp < get_stats_day_start(first_full_date),
+                    ),
+                    Event.timestamp >= get_stats_day_start(counted_through),
+                )
+            )
             .with_entities(
                 func.DATE(func.timezone("PST", Event.timestamp)).label("date"),
                 Event.type_code,
                 func.count(Event.id),
             )
             .group_by("date", Event.type_code)
-            .order_by(desc("date"))
             .all()
+        )
+        for date, type_code, count in sorted(
+            counts, key=lambda row: row[0], reverse=True
         ):
             event_date = date.strftime("%Y-%m-%d")
             event_type = EventType(type_code)
@@ -99,7 +276,8 @@ class Event(db.Model):  # type: ignore
 
     query_class = EventQuery
 
-    id = db.Column(db.Integer(), primary_key=True)
+    # Postgres needs the partition key to be part of the primary key.
+    id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
     client_id = db.Column(
         db.Integer(),
         db.ForeignKey("clients.id", name="events_client_id_fkey"),
@@ -108,10 +286,17 @@ class Event(db.Model):  # type: ignore
     )
     type_code = db.Column(db.Integer(), nullable=False, index=True)
     timestamp = db.Column(
-        db.TIMESTAMP(timezone=True), nullable=False, default=clock.now, index=True
+        db.TIMESTAMP(timezone=True),
+        nullable=False,
+        default=clock.now,
+        index=True,
+        primary_key=True,
     )
     json_data = db.Column(db.JSON(), nullable=False)
 
+    # Events are partitioned by month; see `airq.sync.events`.
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
+
     def __repr__(self) -> str:
         return f"<Event {self.type_code}>"
 
@@ -165,6 +350,26 @@ class Event(db.Model):  # type: ignore
         return dataclasses.asdict(schema(**json_data))
 
 
+class EventCountQuery(BaseQuery):
+    def get_last_date(self) -> typing.Optional[datetime.date]:
+        return self.with_entities(func.max(EventCount.date)).scalar()
+
+
+class EventCount(db.Model):  # type: ignore
+    """Daily counts of each type of event, maintained by `airq.sync.events`."""
+
+    __tablename__ = "event_counts"
+
+    query_class = EventCountQuery
+
+    date = db.Column(db.Date(), primary_key=True)
+    type_code = db.Column(db.Integer(), primary_key=True)
+    count = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<EventCount {self.date} {self.type_code}: {self.count}>"
+
+
 @dataclasses.dataclass
 class QualityEventSchema:
     zipcode: str
@@ -0,0 +1,201 @@
+import typing
+
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy.dialects.postgresql import insert
+
+from airq.config import db
+from airq.lib.clock import now
+from airq.lib.clock import timestamp
+from airq.lib.postgres import copy_rows
+from airq.lib.sms import coerce_phone_number
+from airq.lib.sms import is_valid_phone_number
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
+from airq.models.zipcodes import Zipcode
+
+
+# Rows are validated and inserted this many at a time, and progress is
+# recorded after each batch.
+IMPORT_BATCH_SIZE = 1000
+
+REQUIRED_COLUMNS = ("phone_number", "zipcode")
+
+
+class ClientImportQuery(BaseQuery):
+    def create(
+        self, rows: typing.Iterable[typing.Dict[str, str]], locale: str = "en"
+    ) -> "ClientImport":
+        """Store the rows of an uploaded CSV (e.g., a `csv.DictReader`).
+
+        Rows are streamed into the database with COPY as they're read, so the
+        upload never has to fit in memory.
+        """
+        client_import = ClientImport(locale=locale, num_rows=0)
+        db.session.add(client_import)
+        db.session.flush()
+        client_import.num_rows = copy_rows(
+            ClientImportRow.__tablename__,
+            ["client_import_id", "row_number", "phone_number", "zipcode"],
+            (
+                (client_import.id, i, row["phone_number"] or "", row["zipcode"] or "")
+                for i, row in enumerate(rows, start=1)
+            ),
+        )
+        db.session.commit()
+        return client_import
+
+
+class ClientImport(db.Model):  # type: ignore
+    """A CSV of phone numbers and zipcodes uploaded by an admin.
+
+    The CSV's rows are stored in client_import_rows (rather than passed to the
+    worker directly) because they can be much larger than our broker allows a
+    message to be. They're deleted once the import completes.
+    """
+
+    __tablename__ = "client_imports"
+
+    query_class = ClientImportQuery
+
+    id = db.Column(db.Integer(), primary_key=True)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), default=now, nullable=False)
+    completed_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True)
+    locale = db.Column(db.String(), nullable=False)
+    num_rows = db.Column(db.Integer(), nullable=False)
+    num_processed = db.Column(db.Integer(), nullable=False, default=0)
+    num_created = db.Column(db.Integer(), nullable=False, default=0)
+    num_duplicates = db.Column(db.Integer(), nullable=False, default=0)
+    errors = db.Column(db.JSON(), nullable=False, default=list)
+
+    def __repr__(self) -> str:
+        return f"<ClientImport {self.id}>"
+
+    @staticmethod
+    def get_missing_columns(headers: typing.Sequence[str]) -> typing.List[str]:
+        return [column for column in REQUIRED_COLUMNS if column not in headers]
+
+    @property
+    def is_complete(self) -> bool:
+        return self.completed_at is not None
+
+    def _get_batch(self) -> typing.List["ClientImportRow"]:
+        return (
+            ClientImportRow.query.filter(
+                ClientImportRow.client_import_id == self.id,
+                ClientImportRow.row_number > self.num_processed,
+            )
+            .order_by(ClientImportRow.row_number)
+            .limit(IMPORT_BATCH_SIZE)
+            .all()
+        )
+
+    def run(self):
+        """Create a client for each valid row which isn't already a client.
+
+        If a previous run was interrupted, this picks up after the last batch
+        it recorded.
+        """
+        if self.is_complete:
+            return
+
+        zipcodes = {
+            zipcode: (zipcode_id, pm25)
+            for zipcode, zipcode_id, pm25 in Zipcode.query.with_entities(
+                Zipcode.zipcode, Zipcode.id, Zipcode.pm25
+            )
+        }
+        # Phone numbers seen by a previous run were inserted then, so they're
+        # still counted as duplicates when the insert skips them.
+        seen: typing.Set[str] = set()
+        # Parsing is most of the cost of a row, so each number is only parsed once.
+        validity: typing.Dict[str, bool] = {}
+        while True:
+            batch = self._get_batch()
+            if not batch:
+                break
+
+            rows = []
+            errors = []
+            num_duplicates = 0
+            for row in batch:
+                i = row.row_number
+                zipcode = zipcodes.get(row.zipcode.strip())
+                if zipcode is None:
+                    errors.append(f"Row {i}: {row.zipcode} is not a valid zipcode")
+
+                phone_number = coerce_phone_number(row.phone_number.strip())
+                is_valid = validity.get(phone_number)
+                if is_valid is None:
+                    is_valid = validity[phone_number] = is_valid_phone_number(
+                        phone_number
+                    )
+                if not is_valid:
+                    errors.append(
+                        f"Row {i}: {row.phone_number} is not a valid US phone number"
+                    )
+
+                if zipcode is None or not is_valid:
+                    continue
+                if phone_number in seen:
+                    num_duplicates += 1
+                    continue
+
+                seen.add(phone_number)
+                zipcode_id, pm25 = zipcode
+                rows.append(
+                    {
+                        "identifier": phone_number,
+                        "type_code": ClientIdentifierType.PHONE_NUMBER,
+                        "created_at": now(),
+                        "last_activity_at": timestamp(),
+                        "locale": self.locale,
+                        "zipcode_id": zipcode_id,
+                        "last_pm25": pm25,
+                    }
+                )
+
+            num_created = self._insert_clients(rows)
+            self.num_processed = batch[-1].row_number
+            self.num_created += num_created
+            self.num_duplicates += num_duplicates + len(rows) - num_created
+            self.errors = self.errors + errors
+            db.session.commit()
+
+        ClientImportRow.query.filter(
+            ClientImportRow.client_import_id == self.id
+        ).delete(synchronize_session=False)
+        self.completed_at = now()
+        db.session.commit()
+
+    @staticmethod
+    def _insert_clients(rows: typing.List[typing.Dict[str, typing.Any]]) -> int:
+        if not rows:
+            return 0
+        table = Client.__table__
+        stmt = (
+            insert(table)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["identifier", "type_code"])
+            .returning(table.c.id)
+        )
+        return len(db.session.execute(stmt).fetchall())
+
+
+class ClientImportRow(db.Model):  # type: ignore
+    """A row of a client import's CSV which hasn't been imported yet."""
+
+    __tablename__ = "client_import_rows"
+
+    client_import_id = db.Column(
+        db.Integer(),
+        db.ForeignKey(
+            "client_imports.id", name="client_import_rows_client_import_id_fkey"
+        ),
+        primary_key=True,
+    )
+    row_number = db.Column(db.Integer(), primary_key=True)
+    phone_number = db.Column(db.String(), nullable=False)
+    zipcode = db.Column(db.String(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ClientImportRow {self.client_import_id}:{self.row_number}>"
@@ -0,0 +1,16 @@
+from airq.config import db
+
+
+class RateLimit(db.Model):  # type: ignore
+    """When the next call for a key is allowed, shared by every worker.
+
+    See `airq.lib.twilio.RateLimiter`.
+    """
+
+    __tablename__ = "rate_limits"
+
+    key = db.Column(db.String(), primary_key=True)
+    next_allowed_at = db.Column(db.Float(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<RateLimit {self.key}>"
@@ -1,18 +1,14 @@
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import func
 
 from airq.config import db
+from airq.lib.geo import geohash_prefix_range
 
 
 class SensorQuery(BaseQuery):
-    def get_last_updated_at(self) -> int:
-        result = (
-            self.order_by(Sensor.updated_at.desc())
-            .with_entities(Sensor.updated_at)
-            .first()
-        )
-        if result:
-            return result[0]
-        return 0
+    def filter_geohash_prefix(self, prefix: str) -> "SensorQuery":
+        start, end = geohash_prefix_range(prefix)
+        return self.filter(Sensor.geohash >= start, Sensor.geohash < end)
 
 
 class Sensor(db.Model):  # type: ignore
@@ -26,22 +22,33 @@ class Sensor(db.Model):  # type: ignore
     updated_at = db.Column(db.Integer(), nullable=False)
     latitude = db.Column(db.Float(), nullable=False)
     longitude = db.Column(db.Float(), nullable=False)
-    geohash_bit_1 = db.Column(db.String(), nullable=False)
-    geohash_bit_2 = db.Column(db.String(), nullable=False)
-    geohash_bit_3 = db.Column(db.String(), nullable=False)
-    geohash_bit_4 = db.Column(db.String(), nullable=False)
-    geohash_bit_5 = db.Column(db.String(), nullable=False)
-    geohash_bit_6 = db.Column(db.String(), nullable=False)
-    geohash_bit_7 = db.Column(db.String(), nullable=False)
-    geohash_bit_8 = db.Column(db.String(), nullable=False)
-    geohash_bit_9 = db.Column(db.String(), nullable=False)
-    geohash_bit_10 = db.Column(db.String(), nullable=False)
-    geohash_bit_11 = db.Column(db.String(), nullable=False)
-    geohash_bit_12 = db.Column(db.String(), nullable=False)
+    geohash = db.Column(db.String(collation="C"), nullable=False, index=True)
 
     def __repr__(self) -> str:
         return f"<Sensor {self.id}: {self.latest_reading}>"
 
-    @property
-    def geohash(self) -> str:
-        return "".join([getattr(self, f"geohash_bit_{i}") for i in range(1, 13)])
+
+class SensorLastSeenQuery(BaseQuery):
+    def get_last_seen_at(self) -> int:
+        """When Purpleair last reported any sensor, or 0 if it never has."""
+        return self.with_entities(func.max(SensorLastSeen.last_seen)).scalar() or 0
+
+
+class SensorLastSeen(db.Model):  # type: ignore
+    """When Purpleair last reported each sensor, which decides if it's fresh.
+
+    This moves on every sync, so it's kept out of `sensors`, which is only
+    rewritten when a sensor's values change (see `airq.sync.purpleair`).
+    """
+
+    __tablename__ = "sensors_last_seen"
+
+    query_class = SensorLastSeenQuery
+
+    sensor_id = db.Column(
+        db.Integer(), db.ForeignKey("sensors.id"), nullable=False, primary_key=True
+    )
+    last_seen = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SensorLastSeen {self.sensor_id}: {self.last_seen}>"
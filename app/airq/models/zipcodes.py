@@ -4,7 +4,7 @@ import typing
 from flask_sqlalchemy import BaseQuery
 
 from airq.lib.clock import timestamp
-from airq.lib.geo import haversine_distance
+from airq.lib.geo import geohash_prefix_range
 from airq.lib.readings import Pm25
 from airq.lib.readings import pm25_to_aqi
 from airq.config import db
@@ -18,10 +18,37 @@ class ZipcodeMetrics:
     sensor_ids: typing.List[int]
 
 
+@dataclasses.dataclass
+class ZipcodeRecommendation:
+    zipcode: str
+    city_name: str
+    pm25: float
+    distance: float
+
+    @property
+    def pm25_level(self) -> Pm25:
+        return Pm25.from_measurement(self.pm25)
+
+
 class ZipcodeQuery(BaseQuery):
     def get_by_zipcode(self, zipcode: str) -> typing.Optional["Zipcode"]:
         return self.filter_by(zipcode=zipcode).first()
 
+    def get_last_pm25_updated_at(self) -> int:
+        result = (
+            self.order_by(Zipcode.pm25_updated_at.desc())
+            .with_entities(Zipcode.pm25_updated_at)
+            .first()
+        )
+        if result:
+            return result[0]
+        return 0
+
+    def filter_geohash_prefix(self, prefix: str) -> "ZipcodeQuery":
+        """Zipcodes whose geohash begins with `prefix`, found via its index."""
+        start, end = geohash_prefix_range(prefix)
+        return self.filter(Zipcode.geohash >= start, Zipcode.geohash < end)
+
 
 class Zipcode(db.Model):  # type: ignore
     __tablename__ = "zipcodes"
@@ -35,18 +62,9 @@ class Zipcode(db.Model):  # type: ignore
     longitude = db.Column(db.Float(asdecimal=True), nullable=False)
     timezone = db.Column(db.String(), nullable=True)
 
-    geohash_bit_1 = db.Column(db.String(), nullable=False)
-    geohash_bit_2 = db.Column(db.String(), nullable=False)
-    geohash_bit_3 = db.Column(db.String(), nullable=False)
-    geohash_bit_4 = db.Column(db.String(), nullable=False)
-    geohash_bit_5 = db.Column(db.String(), nullable=False)
-    geohash_bit_6 = db.Column(db.String(), nullable=False)
-    geohash_bit_7 = db.Column(db.String(), nullable=False)
-    geohash_bit_8 = db.Column(db.String(), nullable=False)
-    geohash_bit_9 = db.Column(db.String(), nullable=False)
-    geohash_bit_10 = db.Column(db.String(), nullable=False)
-    geohash_bit_11 = db.Column(db.String(), nullable=False)
-    geohash_bit_12 = db.Column(db.String(), nullable=False)
+    # The "C" collation sorts geohashes bytewise, so the index can serve prefix
+    # range queries (see `filter_geohash_prefix`).
+    geohash = db.Column(db.String(collation="C"), nullable=False, index=True)
 
     pm25 = db.Column(db.Float(), nullable=False, index=True, server_default="0")
     humidity = db.Column(db.Float(), nullable=False, server_default="0")
@@ -55,17 +73,13 @@ class Zipcode(db.Model):  # type: ignore
     )
 
     metrics_data = db.Column(db.JSON(), nullable=True)
+    recommendations_data = db.Column(db.JSON(), nullable=True)
 
     city = db.relationship("City")
 
     def __repr__(self) -> str:
         return f"<Zipcode {self.zipcode}>"
 
-    def __new__(cls, *args, **kwargs):
-        obj = super().__new__(cls)
-        obj._distance_cache = {}
-        return obj
-
     def get_metrics(self) -> ZipcodeMetrics:
         if not hasattr(self, "_metrics"):
             self._metrics = ZipcodeMetrics(
@@ -88,11 +102,6 @@ class Zipcode(db.Model):  # type: ignore
     def min_sensor_distance(self) -> int:
         return self.get_metrics().min_sensor_distance
 
-    @property
-    def geohash(self) -> str:
-        """This zipcode's geohash."""
-        return "".join([getattr(self, f"geohash_bit_{i}") for i in range(1, 13)])
-
     @property
     def aqi(self) -> typing.Optional[int]:
         """The AQI for this zipcode (e.g., 35)."""
@@ -113,34 +122,17 @@ class Zipcode(db.Model):  # type: ignore
         """Whether this zipcode's pm25 measurements are considered stale."""
         return self.pm25_updated_at < self.pm25_stale_cutoff()
 
-    def distance(self, other: "Zipcode") -> float:
-        """Distance between this zip and the given zip."""
-        if other.id in self._distance_cache:
-            return self._distance_cache[other.id]
-        if self.id in other._distance_cache:
-            return other._distance_cache[self.id]
-        self._distance_cache[other.id] = haversine_distance(
-            other.longitude,
-            other.latitude,
-            self.longitude,
-            self.latitude,
-        )
-        return self._distance_cache[other.id]
+    def get_recommendations(
+        self, num_desired: int
+    ) -> typing.List["ZipcodeRecommendation"]:
+        """Get n recommended zipcodes near this zipcode, sorted by distance.
 
-    def get_recommendations(self, num_desired: int) -> typing.List["Zipcode"]:
-        """Get n recommended zipcodes near this zipcode, sorted by distance."""
-        if not self.pm25_level or self.is_pm25_stale:
+        Recommendations are precomputed during the metrics sync.
+        """
+        if not self.pm25_level or self.is_pm25_stale or not self.recommendations_data:
             return []
 
-        cutoff = self.pm25_stale_cutoff()
-        zipcodes = (
-            Zipcode.query.filter(Zipcode.pm25_updated_at > cutoff)
-            .filter(Zipcode.pm25 < self.pm25_level)
-            .all()
-        )
-        # Sorting 40000 zipcodes in memory is surprisingly fast.
-        #
-        # I wouldn't be surprised if doing this huge fetch every time actually leads to better
-        # performance since Postgres can easily cache the whole query.
-        #
-        return sorted(zipcodes, key=lambda z: self.distance(z))[:num_desired]
+        return [
+            ZipcodeRecommendation(**data)
+            for data in self.recommendations_data[:num_desired]
+        ]
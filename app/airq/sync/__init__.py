@@ -5,6 +5,7 @@ import typing
 
 from airq.models.sensors import Sensor
 from airq.models.zipcodes import Zipcode
+from airq.sync.events import events_sync
 from airq.sync.geonames import geonames_sync
 from airq.sync.purpleair import purpleair_sync
 
@@ -28,6 +29,10 @@ def models_sync(
 ):
     start_ts = time.perf_counter()
 
+    # Scheduled rebuilds are skipped if GeoNames hasn't changed since the last
+    # one. Rebuilds we ask for explicitly always happen.
+    only_if_changed = force_rebuild_geography is None
+
     num_zipcodes = Zipcode.query.count()
     if only_if_empty or num_zipcodes == 0:
         force_rebuild_geography = num_zipcodes == 0
@@ -35,11 +40,13 @@ def models_sync(
         force_rebuild_geography = _should_sync_geonames()
 
     if force_rebuild_geography:
-        geonames_sync()
+        geonames_sync(only_if_changed=only_if_changed and num_zipcodes > 0)
 
     if not only_if_empty or Sensor.query.count() == 0:
         purpleair_sync()
 
+    events_sync()
+
     duration = time.perf_counter() - start_ts
     if duration > 60 * 5:
         log_level = logging.ERROR
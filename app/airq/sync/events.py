@@ -0,0 +1,112 @@
+import datetime
+import typing
+
+from airq.celery import get_celery_logger
+from airq.config import db
+from airq.lib import clock
+from airq.models.events import EventCount
+from airq.models.events import get_stats_day_start
+
+
+# Partitions are created this many months ahead of the current one, so events
+# should never land in the default partition.
+PARTITION_MONTHS_AHEAD = 2
+
+# A partition can't be created for a range that already has rows in the default
+# partition, so it's created as a plain table, the rows are moved into it, and
+# then it's attached.
+_CREATE_PARTITION_TABLE_SQL = "CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS)"
+
+_MOVE_DEFAULT_EVENTS_SQL = """
+WITH moved AS (
+    DELETE FROM events_default
+    WHERE timestamp >= :start AND timestamp < :end
+    RETURNING id, client_id, type_code, timestamp, json_data
+)
+INSERT INTO {name} (id, client_id, type_code, timestamp, json_data)
+SELECT id, client_id, type_code, timestamp, json_data FROM moved
+"""
+
+_ATTACH_PARTITION_SQL = """
+ALTER TABLE events ATTACH PARTITION {name}
+FOR VALUES FROM ('{start:%Y-%m-%d} 00:00+00') TO ('{end:%Y-%m-%d} 00:00+00')
+"""
+
+# Recounts every day since `start`. Counts only ever go up, so it's safe to
+# overwrite whatever was there before.
+_EVENT_COUNTS_SQL = """
+INSERT INTO event_counts (date, type_code, count)
+SELECT DATE(timezone('PST', timestamp)), type_code, count(*)
+FROM events
+WHERE timestamp >= :start
+GROUP BY 1, 2
+ON CONFLICT (date, type_code) DO UPDATE SET count = EXCLUDED.count
+"""
+
+
+def _add_months(month: datetime.date, num_months: int) -> datetime.date:
+    years, month_index = divmod(month.month - 1 + num_months, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+
+def get_partition_name(month: datetime.date) -> str:
+    return f"events_{month:%Y_%m}"
+
+
+def _create_partition(name: str, month: datetime.date) -> int:
+    """Create and attach the partition for `month`.
+
+    Returns the number of events moved into it from the default partition.
+    """
+    start = datetime.datetime.combine(month, datetime.time(), datetime.timezone.utc)
+    end = datetime.datetime.combine(
+        _add_months(month, 1), datetime.time(), datetime.timezone.utc
+    )
+    db.session.execute(_CREATE_PARTITION_TABLE_SQL.format(name=name))
+    num_moved = db.session.execute(
+        _MOVE_DEFAULT_EVENTS_SQL.format(name=name), {"start": start, "end": end}
+    ).rowcount
+    db.session.execute(_ATTACH_PARTITION_SQL.format(name=name, start=start, end=end))
+    return num_moved
+
+
+def _partitions_sync() -> typing.List[str]:
+    logger = get_celery_logger()
+    this_month = clock.now("UTC").date().replace(day=1)
+    names = []
+    for i in range(PARTITION_MONTHS_AHEAD + 1):
+        month = _add_months(this_month, i)
+        name = get_partition_name(month)
+        exists = db.session.execute(
+            "SELECT to_regclass(:name) IS NOT NULL", {"name": name}
+        ).scalar()
+        if not exists:
+            num_moved = _create_partition(name, month)
+            if num_moved:
+                logger.warning(
+                    "Moved %s events from events_default to %s", num_moved, name
+                )
+        names.append(name)
+    db.session.commit()
+    logger.info("Ensured events partitions %s", ", ".join(names))
+    return names
+
+
+def _event_counts_sync():
+    logger = get_celery_logger()
+
+    # The last day we counted may not have been over yet, so we count it again.
+    last_date = EventCount.query.get_last_date()
+    if last_date is None:
+        start = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+    else:
+        start = get_stats_day_start(last_date)
+
+    num_rows = db.session.execute(_EVENT_COUNTS_SQL, {"start": start}).rowcount
+    db.session.commit()
+    logger.info("Updated %s event counts since %s", num_rows, start)
+
+
+def events_sync():
+    _partitions_sync()
+    _event_counts_sync()
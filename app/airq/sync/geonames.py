@@ -1,26 +1,25 @@
-import collections
-import decimal
 import geohash
 import gzip
+import io
+import json
 import logging
-import requests
+import os
 import typing
 import zipfile
 
+from airq import config
 from airq.config import db
-from airq.lib.http import chunked_download
-from airq.lib.util import chunk_list
-from airq.models.cities import City
-from airq.models.zipcodes import Zipcode
+from airq.lib.http import cached_download
+from airq.lib.postgres import copy_rows
+from airq.lib.postgres import create_temp_table
+from airq.lib.sql_dumps import iter_insert_rows
 
 
 logger = logging.getLogger(__name__)
 
 
-TGeonamesData = typing.List[
-    typing.Tuple[str, str, str, decimal.Decimal, decimal.Decimal]
-]
-TCitiesMap = typing.Dict[str, typing.Dict[str, City]]
+# (zipcode, city name, state code, latitude, longitude)
+TGeonamesRow = typing.Tuple[str, str, str, float, float]
 
 
 COUNTRY_CODE = "US"
@@ -28,133 +27,172 @@ GEONAMES_URL = f"http://download.geonames.org/export/zip/{COUNTRY_CODE}.zip"
 ZIP_2_TIMEZONES_URL = "https://sourceforge.net/projects/zip2timezone/files/timezonebyzipcode_20120424.sql.gz/download"
 ARMY_PREFIXES = ("FPO", "APO")
 
-
-def _get_geonames_data() -> TGeonamesData:
-    zipfile_name = f"{COUNTRY_CODE}.zip"
-    chunked_download(GEONAMES_URL, zipfile_name)
-
-    geonames_data = []
-    with zipfile.ZipFile(zipfile_name) as zf:
-        with zf.open(f"{COUNTRY_CODE}.txt", "r") as fd:  # type: ignore
-            for line in fd.readlines():
-                fields = line.decode().strip().split("\t")
-                zipcode = fields[1].strip()
+# Records the hashes of the downloads we last synced from, so that we can skip
+# syncing when neither of them has changed.
+SYNCED_HASHES_FILENAME = "geonames_synced.json"
+
+_CITIES_SYNC_SQL = """
+INSERT INTO cities (name, state_code)
+SELECT DISTINCT city_name, state_code
+FROM {staging}
+ON CONFLICT (name, state_code) DO NOTHING
+"""
+
+# Only writes zipcodes which are new or have changed, so a rebuild which
+# doesn't change anything doesn't write anything.
+#
+# A zipcode listed more than once in the timezones dump gets its last timezone.
+_ZIPCODES_SYNC_SQL = """
+WITH timezones AS (
+    SELECT DISTINCT ON (zipcode) zipcode, timezone
+    FROM {timezones_staging}
+    ORDER BY zipcode, position DESC
+)
+INSERT INTO zipcodes (zipcode, city_id, latitude, longitude, timezone, geohash)
+SELECT DISTINCT ON (staging.zipcode)
+    staging.zipcode,
+    cities.id,
+    staging.latitude,
+    staging.longitude,
+    timezones.timezone,
+    staging.geohash
+FROM {staging} AS staging
+JOIN cities
+    ON cities.name = staging.city_name AND cities.state_code = staging.state_code
+LEFT JOIN timezones ON timezones.zipcode = staging.zipcode
+ORDER BY staging.zipcode
+ON CONFLICT (zipcode) DO UPDATE SET
+    city_id = EXCLUDED.city_id,
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    timezone = EXCLUDED.timezone,
+    geohash = EXCLUDED.geohash
+WHERE (zipcodes.city_id, zipcodes.latitude, zipcodes.longitude, zipcodes.timezone)
+    IS DISTINCT FROM
+    (EXCLUDED.city_id, EXCLUDED.latitude, EXCLUDED.longitude, EXCLUDED.timezone)
+"""
+
+
+def _iter_geonames_rows(filename: str) -> typing.Iterator[TGeonamesRow]:
+    """Read the geonames dump one line at a time."""
+    with zipfile.ZipFile(filename) as zf:
+        with zf.open(f"{COUNTRY_CODE}.txt", "r") as fd:
+            for line in io.TextIOWrapper(fd, encoding="utf-8"):
+                fields = line.rstrip("\r\n").split("\t")
                 city_name = fields[2].strip()
-                state_code = fields[4].strip()
-                latitude = decimal.Decimal(fields[9].strip())
-                longitude = decimal.Decimal(fields[10].strip())
-                place_name = fields[2].strip()
-                if place_name.startswith(ARMY_PREFIXES):
+                if city_name.startswith(ARMY_PREFIXES):
                     continue
-                geonames_data.append(
-                    (zipcode, city_name, state_code, latitude, longitude)
+                yield (
+                    fields[1].strip(),
+                    city_name,
+                    fields[4].strip(),
+                    float(fields[9]),
+                    float(fields[10]),
                 )
 
-    return geonames_data
-
-
-def _get_timezones_data() -> typing.Dict[str, str]:
-    filename = "zipcodes_to_timezones.gz"
-    chunked_download(ZIP_2_TIMEZONES_URL, filename)
-
-    zipcode_to_timezones = {}
-    with gzip.open(filename) as f:
-        for line in f:
-            line = line.decode().strip()
-            if line.startswith("INSERT INTO"):
-                i = 0
-                while line[i] != "(":
-                    i += 1
-                i += 1  # Skip the leading "("
-                j = len(line) - 1
-                j -= 1  # Skip the trailing ";"
-                j -= 1  # Skip the trailing ")"
-                row_defs = line[i:j].split("),(")
-                for row_def in row_defs:
-                    fields = row_def.split(",")
-                    zipcode = fields[1][1:-1].strip()
-                    timezone = fields[6][1:-1].strip()
-                    zipcode_to_timezones[zipcode] = timezone
-
-    return zipcode_to_timezones
-
-
-def _build_cities_map(geonames_data: TGeonamesData) -> TCitiesMap:
-    cities_map: TCitiesMap = collections.defaultdict(dict)
-    for city in City.query.all():
-        cities_map[city.state_code][city.name] = city
-    new_cities = []
-    for _, city_name, state_code, _, _ in geonames_data:
-        city = cities_map.get(state_code, {}).get(city_name)
-        if city is None:
-            city = City(name=city_name, state_code=state_code)
-            cities_map[state_code][city_name] = city
-            new_cities.append(city)
-
-    if new_cities:
-        logger.info("Creating %s cities", len(new_cities))
-        db.session.bulk_save_objects(new_cities)
-        db.session.commit()
-        for city in City.query.all():
-            cities_map[city.state_code][city.name] = city
-
-    return cities_map
-
-
-def _zipcodes_sync(
-    geonames_data: TGeonamesData,
-    cities_map: TCitiesMap,
-    timezones_map: typing.Dict[str, str],
-):
-    existing_zipcodes = {zipcode.zipcode: zipcode for zipcode in Zipcode.query.all()}
-    updates = []
-    new_zipcodes = []
-    for zipcode, city_name, state_code, latitude, longitude in geonames_data:
-        obj = existing_zipcodes.get(zipcode)
-        timezone = timezones_map.get(zipcode)
-        if (
-            not obj
-            or obj.latitude != latitude
-            or obj.longitude != longitude
-            or timezone != obj.timezone
+
+def _iter_timezones_rows(filename: str) -> typing.Iterator[typing.Tuple[int, str, str]]:
+    """Yield (position, zipcode, timezone) from the zip2timezone dump."""
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        rows = iter_insert_rows(f, columns=(1, 6))
+        for position, (zipcode, timezone) in enumerate(rows):
+            if zipcode and timezone:
+                yield position, zipcode.strip(), timezone.strip()
+
+
+def _stage_geonames(
+    zipfile_name: str, timezones_filename: str
+) -> typing.Tuple[str, str, int]:
+    """COPY both dumps into temp tables, straight from the files."""
+    timezones_staging = create_temp_table(
+        "timezones_staging",
+        {"position": "integer", "zipcode": "text", "timezone": "text"},
+    )
+    copy_rows(
+        timezones_staging,
+        ["position", "zipcode", "timezone"],
+        _iter_timezones_rows(timezones_filename),
+    )
+
+    def iter_rows() -> typing.Iterator[typing.Sequence[typing.Any]]:
+        for zipcode, city_name, state_code, latitude, longitude in _iter_geonames_rows(
+            zipfile_name
         ):
-            gh = geohash.encode(latitude, longitude)
-            data = dict(
-                zipcode=zipcode,
-                city_id=cities_map[state_code][city_name].id,
-                latitude=latitude,
-                longitude=longitude,
-                timezone=timezone,
-                **{f"geohash_bit_{i}": c for i, c in enumerate(gh, start=1)},
+            yield (
+                zipcode,
+                city_name,
+                state_code,
+                latitude,
+                longitude,
+                geohash.encode(latitude, longitude),
             )
-            if obj:
-                data["id"] = obj.id
-                updates.append(data)
-            else:
-                new_zipcodes.append(Zipcode(**data))
-
-    if new_zipcodes:
-        logger.info("Creating %s zipcodes", len(new_zipcodes))
-        for objects in chunk_list(new_zipcodes):
-            db.session.bulk_save_objects(objects)
-            db.session.commit()
-
-    if updates:
-        logger.info("Updating %s zipcodes", len(updates))
-        for mappings in chunk_list(updates):
-            db.session.bulk_update_mappings(Zipcode, mappings)
-            db.session.commit()
-
-
-def geonames_sync():
-    logger.info("Retrieving timezone data from sourceforge")
-    timezones_map = _get_timezones_data()
 
-    logger.info("Retrieving zipcode data from geonames")
-    geonames_data = _get_geonames_data()
+    staging = create_temp_table(
+        "geonames_staging",
+        {
+            "zipcode": "text",
+            "city_name": "text",
+            "state_code": "text",
+            "latitude": "double precision",
+            "longitude": "double precision",
+            "geohash": "text",
+        },
+    )
+    num_rows = copy_rows(
+        staging,
+        ["zipcode", "city_name", "state_code", "latitude", "longitude", "geohash"],
+        iter_rows(),
+    )
+    return staging, timezones_staging, num_rows
+
+
+def _get_synced_hashes_path() -> str:
+    return os.path.join(config.DOWNLOAD_CACHE_DIR, SYNCED_HASHES_FILENAME)
 
-    logger.info("Syncing cities from %s entries", len(geonames_data))
-    cities_map = _build_cities_map(geonames_data)
 
-    logger.info("Syncing zipcodes from %s entries", len(geonames_data))
-    _zipcodes_sync(geonames_data, cities_map, timezones_map)
+def _get_synced_hashes() -> typing.Dict[str, str]:
+    try:
+        with open(_get_synced_hashes_path()) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _set_synced_hashes(hashes: typing.Dict[str, str]):
+    with open(_get_synced_hashes_path(), "w") as f:
+        json.dump(hashes, f)
+
+
+def geonames_sync(only_if_changed: bool = False):
+    logger.info("Retrieving timezone data from sourceforge")
+    timezones_download = cached_download(
+        ZIP_2_TIMEZONES_URL, "zipcodes_to_timezones.gz"
+    )
+
+    logger.info("Retrieving zipcode data from geonames")
+    geonames_download = cached_download(GEONAMES_URL, f"{COUNTRY_CODE}.zip")
+
+    hashes = {
+        ZIP_2_TIMEZONES_URL: timezones_download.sha256,
+        GEONAMES_URL: geonames_download.sha256,
+    }
+    if only_if_changed and hashes == _get_synced_hashes():
+        logger.info("Skipping geonames sync because its sources haven't changed")
+        return
+
+    staging, timezones_staging, num_rows = _stage_geonames(
+        geonames_download.path, timezones_download.path
+    )
+
+    logger.info("Syncing cities from %s entries", num_rows)
+    num_cities = db.session.execute(_CITIES_SYNC_SQL.format(staging=staging)).rowcount
+    logger.info("Created %s cities", num_cities)
+
+    logger.info("Syncing zipcodes from %s entries", num_rows)
+    num_zipcodes = db.session.execute(
+        _ZIPCODES_SYNC_SQL.format(staging=staging, timezones_staging=timezones_staging)
+    ).rowcount
+    db.session.commit()
+    logger.info("Created or updated %s zipcodes", num_zipcodes)
+
+    _set_synced_hashes(hashes)
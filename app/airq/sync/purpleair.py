@@ -2,22 +2,37 @@ import collections
 import geohash
 import json
 import logging
-import math
+import numpy as np
 import requests
 import typing
 
+from celery import chord
+from celery.result import AsyncResult
 from flask_babel import force_locale
 
 from airq.celery import get_celery_logger
+from airq.config import CELERY_VISIBILITY_TIMEOUT_SECONDS
 from airq.config import db
+from airq.config import METRICS_SYNC_MODE
 from airq.lib.clock import timestamp
-from airq.lib.geo import haversine_distance
+from airq.lib.geo import haversine_many
+from airq.lib.postgres import copy_rows
+from airq.lib.postgres import create_staging_table
+from airq.lib.postgres import create_temp_table
 from airq.lib.purpleair import call_purpleair_api
-from airq.lib.trie import Trie
+from airq.lib.purpleair import parse_sensor_columns
+from airq.lib.purpleair import SensorColumns
+from airq.lib.purpleair import STREAM_CHUNK_SIZE
+from airq.lib.readings import Pm25
+from airq.lib.spatial import SpatialIndex
+from airq.lib.twilio import get_max_messages_per_task
 from airq.lib.util import chunk_list
+from airq.models.cities import City
 from airq.models.clients import Client
+from airq.models.events import Event
 from airq.models.relations import SensorZipcodeRelation
 from airq.models.sensors import Sensor
+from airq.models.sensors import SensorLastSeen
 from airq.models.zipcodes import Zipcode
 
 
@@ -27,19 +42,46 @@ DESIRED_NUM_READINGS = 8
 # Allow any number of readings within 2.5km from the zipcode centroid.
 DESIRED_READING_DISTANCE_KM = 2.5
 
+# Relate each sensor to its 25 closest zipcodes within 25km.
+MAX_ZIPCODES_PER_SENSOR = 25
+MAX_SENSOR_DISTANCE_KM = 25
 
-def _get_purpleair_data() -> typing.List[typing.Dict[str, typing.Any]]:
+# Only use readings from sensors which reported in the last 30 minutes.
+SENSOR_FRESHNESS_SECONDS = 30 * 60
+
+# Store the 3 closest zipcodes at each better pm25 level, which is enough
+# for the 3 recommendations GetDetails sends.
+RECOMMENDATIONS_PER_LEVEL = 3
+
+# Alerts and share requests are sent by subtasks which each handle this many clients.
+# If a shard outlives the visibility timeout, SQS hands it to another worker while
+# it's still running, so shards are capped at what one can send in a quarter of the
+# timeout while every worker shares the rate limit.
+CLIENTS_PER_SEND_SHARD = min(
+    250, get_max_messages_per_task(CELERY_VISIBILITY_TIMEOUT_SECONDS / 4) or 250
+)
+
+# Sent messages are recorded in transactions of this many clients. Messages go out
+# before their transaction commits, so this is also how many clients could be
+# messaged twice if a commit fails.
+SENDS_PER_COMMIT = 10
+
+
+def _get_purpleair_data() -> SensorColumns:
     logger = get_celery_logger()
     try:
-        resp = call_purpleair_api()
-    except (requests.RequestException, json.JSONDecodeError) as e:
+        resp = call_purpleair_api(stream=True)
+        return parse_sensor_columns(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+    except (requests.RequestException, ValueError) as e:
         # Send an email to an admin if data lags by more than 30 minutes.
         # Otherwise, just log a warning as most of these errors are
         # transient. In the future we might choose to retry on transient
         # failures, but it's not urgent since we will rerun the sync
         # every ten minutes anyway.
-        last_updated_at = Sensor.query.get_last_updated_at()
-        seconds_since_last_update = timestamp() - last_updated_at
+        #
+        # Note that malformed JSON surfaces as a ValueError.
+        last_seen_at = SensorLastSeen.query.get_last_seen_at()
+        seconds_since_last_update = timestamp() - last_seen_at
         if seconds_since_last_update > 30 * 60:
             level = logging.ERROR
         else:
@@ -51,174 +93,404 @@ def _get_purpleair_data() -> typing.List[typing.Dict[str, typing.Any]]:
             e,
             exc_info=True,
         )
-        return []
-    else:
-        response_dict = resp.json()
-        fields = response_dict["fields"]
-        channel_flags = response_dict["channel_flags"]
-        data = []
-        for sensor_data in response_dict["data"]:
-            sensor_data = dict(zip(fields, sensor_data))
-            try:
-                sensor_data["channel_flags"] = channel_flags[
-                    sensor_data["channel_flags"]
-                ]
-            except KeyError:
-                pass
-            data.append(sensor_data)
-        return data
-
-
-def _is_valid_reading(sensor_data: typing.Dict[str, typing.Any]) -> bool:
-    if sensor_data["last_seen"] < timestamp() - (60 * 60):
-        # Out of date / maybe dead
-        return False
-    if sensor_data["channel_flags"] != "Normal":
-        # Flagged for an unusually high reading
-        return False
-    try:
-        pm25 = float(sensor_data["pm2.5"])
-    except (TypeError, ValueError):
-        return False
-    if math.isnan(pm25):
-        # Purpleair can occasionally return NaN.
-        # I wonder if this is a bug on their end.
-        return False
-    if pm25 <= 0 or pm25 > 1000:
-        # Something is very wrong
-        return False
-    try:
-        humidity = float(sensor_data["humidity"])
-    except (TypeError, ValueError):
-        return False
-    if math.isnan(humidity):
-        return False
-    latitude = sensor_data["latitude"]
-    longitude = sensor_data["longitude"]
-    if latitude is None or longitude is None:
-        return False
-
-    return True
+        return SensorColumns.empty()
+
+
+def _validate_readings(
+    purpleair_data: SensorColumns,
+) -> typing.Tuple[np.ndarray, typing.Dict[str, int]]:
+    """Validate every reading in one pass.
+
+    Returns a boolean mask of valid readings, along with the number of
+    readings rejected by each rule. Each rejected reading is only counted
+    against the first rule it fails.
+    """
+    pm25 = purpleair_data.pm25
+    humidity = purpleair_data.humidity
+
+    channel_flags = purpleair_data.channel_flags
+    codes = purpleair_data.channel_flag.astype(np.intp)
+    is_normal = np.zeros(len(purpleair_data), dtype=bool)
+    if channel_flags:
+        is_known = (codes >= 0) & (codes < len(channel_flags))
+        normal_codes = np.array([flag == "Normal" for flag in channel_flags])
+        is_normal = is_known & normal_codes[np.where(is_known, codes, 0)]
+
+    with np.errstate(invalid="ignore"):
+        rules = [
+            # Out of date / maybe dead
+            ("stale", purpleair_data.last_seen < timestamp() - (60 * 60)),
+            # Flagged for an unusually high reading
+            ("flagged", ~is_normal),
+            # Purpleair can occasionally return NaN.
+            # I wonder if this is a bug on their end.
+            ("invalid_pm25", np.isnan(pm25)),
+            # Something is very wrong
+            ("pm25_out_of_range", (pm25 <= 0) | (pm25 > 1000)),
+            ("invalid_humidity", np.isnan(humidity)),
+            (
+                "missing_coordinates",
+                np.isnan(purpleair_data.latitude) | np.isnan(purpleair_data.longitude),
+            ),
+        ]
+
+    is_valid = np.ones(len(purpleair_data), dtype=bool)
+    rejections = {}
+    for name, is_invalid in rules:
+        rejections[name] = int(np.count_nonzero(is_valid & is_invalid))
+        is_valid &= ~is_invalid
+
+    return is_valid, rejections
+
+
+_SENSOR_COLUMNS = [
+    "id",
+    "latest_reading",
+    "humidity",
+    "updated_at",
+    "latitude",
+    "longitude",
+    "geohash",
+]
+
+# Upserts the staged sensors, only writing rows whose values actually changed.
+#
+# updated_at (when PurpleAir last heard from the sensor) moves on every sync, so
+# it isn't compared, and is only written along with other changes. Whether a
+# sensor is fresh is decided by `sensors_last_seen` instead (see
+# `_SENSORS_LAST_SEEN_SQL`).
+#
+# All of the CTEs see the table as it was before the statement ran, so `moved`
+# picks out new sensors and sensors whose coordinates changed, and `changed` picks
+# out existing sensors whose readings changed or which are fresh again after
+# having gone stale.
+_SENSORS_UPSERT_SQL = """
+WITH staged AS (
+    SELECT DISTINCT ON (id) {columns}
+    FROM {staging}
+    ORDER BY id, updated_at DESC
+), moved AS (
+    SELECT staged.id
+    FROM staged
+    LEFT JOIN sensors ON sensors.id = staged.id
+    WHERE sensors.id IS NULL
+        OR sensors.latitude <> staged.latitude
+        OR sensors.longitude <> staged.longitude
+), changed AS (
+    SELECT staged.id
+    FROM staged
+    JOIN sensors ON sensors.id = staged.id
+    LEFT JOIN sensors_last_seen ON sensors_last_seen.sensor_id = staged.id
+    WHERE (sensors.latest_reading, sensors.humidity)
+            IS DISTINCT FROM (staged.latest_reading, staged.humidity)
+        OR (
+            coalesce(sensors_last_seen.last_seen, 0) <= :fresh_cutoff
+            AND staged.updated_at > :fresh_cutoff
+        )
+), upserted AS (
+    INSERT INTO sensors ({columns})
+    SELECT {columns} FROM staged
+    ON CONFLICT (id) DO UPDATE SET {updates}
+    WHERE ({current_values}) IS DISTINCT FROM ({excluded_values})
+    RETURNING sensors.id
+)
+SELECT
+    (SELECT count(*) FROM upserted),
+    ARRAY(SELECT id FROM moved ORDER BY id),
+    ARRAY(SELECT id FROM changed ORDER BY id)
+"""
+
+# Records when each staged sensor was last seen. This narrow table is the only
+# thing written for sensors whose values haven't changed, so that sensors which
+# are still reporting stay fresh without rewriting their rows in `sensors`.
+_SENSORS_LAST_SEEN_SQL = """
+INSERT INTO sensors_last_seen (sensor_id, last_seen)
+SELECT id, max(updated_at)
+FROM {staging}
+GROUP BY id
+ON CONFLICT (sensor_id) DO UPDATE SET last_seen = EXCLUDED.last_seen
+WHERE sensors_last_seen.last_seen < EXCLUDED.last_seen
+"""
 
 
 def _sensors_sync(
-    purpleair_data: typing.List[typing.Dict[str, typing.Any]]
-) -> typing.List[int]:
+    purpleair_data: SensorColumns,
+) -> typing.Tuple[typing.List[int], typing.List[int]]:
+    """Write the valid sensors from purpleair.
+
+    Returns the ids of sensors which are new or moved, and the ids of the other
+    sensors whose readings changed or which started reporting again. The caller
+    commits (see `purpleair_sync`).
+    """
     logger = get_celery_logger()
 
-    existing_sensor_map = {s.id: s for s in Sensor.query.all()}
-
-    updates = []
-    new_sensors = []
-    moved_sensor_ids = []
-    for result in purpleair_data:
-        if _is_valid_reading(result):
-            sensor = existing_sensor_map.get(result["sensor_index"])
-            latitude = result["latitude"]
-            longitude = result["longitude"]
-            pm25 = float(result["pm2.5"])
-            humidity = float(result["humidity"])
-            data: typing.Dict[str, typing.Any] = {
-                "id": result["sensor_index"],
-                "latest_reading": pm25,
-                "humidity": humidity,
-                "updated_at": result["last_seen"],
-            }
-
-            if (
-                not sensor
-                or sensor.latitude != latitude
-                or sensor.longitude != longitude
-            ):
-                gh = geohash.encode(latitude, longitude)
-                data.update(
-                    latitude=latitude,
-                    longitude=longitude,
-                    **{f"geohash_bit_{i}": c for i, c in enumerate(gh, start=1)},
-                )
-                moved_sensor_ids.append(result["sensor_index"])
-
-            if sensor:
-                updates.append(data)
-            else:
-                new_sensors.append(Sensor(**data))
-
-    if new_sensors:
-        logger.info("Creating %s sensors", len(new_sensors))
-        db.session.bulk_save_objects(new_sensors)
-        db.session.commit()
-
-    if updates:
-        logger.info("Updating %s sensors", len(updates))
-        db.session.bulk_update_mappings(Sensor, updates)
-        db.session.commit()
-
-    return moved_sensor_ids
-
+    is_valid, rejections = _validate_readings(purpleair_data)
+    num_valid = np.count_nonzero(is_valid)
+    logger.info(
+        "Rejected %s of %s sensors: %s",
+        len(purpleair_data) - num_valid,
+        len(purpleair_data),
+        rejections,
+    )
+    if not num_valid:
+        return [], []
+
+    def iter_rows() -> typing.Iterator[typing.Tuple[typing.Any, ...]]:
+        for sensor_index, pm25, humidity, latitude, longitude, last_seen in zip(
+            purpleair_data.sensor_index[is_valid].tolist(),
+            purpleair_data.pm25[is_valid].tolist(),
+            purpleair_data.humidity[is_valid].tolist(),
+            purpleair_data.latitude[is_valid].tolist(),
+            purpleair_data.longitude[is_valid].tolist(),
+            purpleair_data.last_seen[is_valid].tolist(),
+        ):
+            yield (
+                sensor_index,
+                pm25,
+                humidity,
+                last_seen,
+                latitude,
+                longitude,
+                geohash.encode(latitude, longitude),
+            )
 
-def _relations_sync(moved_sensor_ids: typing.List[int]):
+    staging = create_staging_table("sensors_staging", Sensor.__tablename__)
+    copy_rows(staging, _SENSOR_COLUMNS, iter_rows())
+
+    update_columns = [c for c in _SENSOR_COLUMNS if c != "id"]
+    value_columns = [c for c in update_columns if c != "updated_at"]
+    num_written, moved_sensor_ids, changed_sensor_ids = db.session.execute(
+        _SENSORS_UPSERT_SQL.format(
+            staging=staging,
+            columns=", ".join(_SENSOR_COLUMNS),
+            updates=", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns),
+            current_values=", ".join(f"sensors.{c}" for c in value_columns),
+            excluded_values=", ".join(f"EXCLUDED.{c}" for c in value_columns),
+        ),
+        {"fresh_cutoff": timestamp() - SENSOR_FRESHNESS_SECONDS},
+    ).fetchone()
+    num_seen = db.session.execute(
+        _SENSORS_LAST_SEEN_SQL.format(staging=staging)
+    ).rowcount
+    # It would otherwise only be dropped on commit, which the caller does.
+    db.session.execute(f"DROP TABLE {staging}")
+
+    logger.info(
+        "Wrote %s of %s sensors (%s new or moved, %s changed, %s seen)",
+        num_written,
+        num_valid,
+        len(moved_sensor_ids),
+        len(changed_sensor_ids),
+        num_seen,
+    )
+    return moved_sensor_ids, changed_sensor_ids
+
+
+def _relations_sync(moved_sensor_ids: typing.List[int]) -> typing.Set[int]:
+    """Rebuild the relations for the given sensors.
+
+    Returns the ids of the zipcodes which gained or lost a relation. The caller
+    commits (see `purpleair_sync`).
+    """
     logger = get_celery_logger()
 
-    trie: Trie[Zipcode] = Trie()
-    for zipcode in Zipcode.query.all():
-        trie.insert(zipcode.geohash, zipcode)
-
-    new_relations = []
+    zipcodes = (
+        Zipcode.query.with_entities(Zipcode.id, Zipcode.latitude, Zipcode.longitude)
+        .order_by(Zipcode.id)
+        .all()
+    )
+    all_zipcode_ids = np.array([z.id for z in zipcodes], dtype=np.int64)
+    zipcode_latitudes = np.array([z.latitude for z in zipcodes], dtype=np.float64)
+    zipcode_longitudes = np.array([z.longitude for z in zipcodes], dtype=np.float64)
+    index = SpatialIndex(all_zipcode_ids, zipcode_latitudes, zipcode_longitudes)
 
     # Delete the old relations before rebuilding them
-    deleted_relations_count = SensorZipcodeRelation.query.filter(
-        SensorZipcodeRelation.sensor_id.in_(moved_sensor_ids)
-    ).delete(synchronize_session=False)
-    logger.info("Deleting %s relations", deleted_relations_count)
-
-    sensors = Sensor.query.filter(Sensor.id.in_(moved_sensor_ids)).all()
-    for sensor in sensors:
-        gh = sensor.geohash
-        latitude = sensor.latitude
-        longitude = sensor.longitude
-        done = False
-        zipcode_ids: typing.Set[int] = set()
-        # TODO: Use Postgres' native geolocation extension.
-        while gh and not done:
-            zipcodes = [
-                zipcode for zipcode in trie.get(gh) if zipcode.id not in zipcode_ids
-            ]
-
-            for zipcode_id, distance in sorted(
-                [
-                    (
-                        z.id,
-                        haversine_distance(
-                            longitude, latitude, z.longitude, z.latitude
-                        ),
-                    )
-                    for z in zipcodes
-                ],
-                key=lambda t: t[1],
-            ):
-                if distance >= 25:
-                    done = True
-                    break
-                if len(zipcode_ids) >= 25:
-                    done = True
-                    break
-                zipcode_ids.add(zipcode_id)
-                data = {
-                    "zipcode_id": zipcode_id,
-                    "sensor_id": sensor.id,
-                    "distance": distance,
-                }
-                new_relations.append(SensorZipcodeRelation(**data))
-            gh = gh[:-1]
+    relations = SensorZipcodeRelation.__table__
+    deleted_zipcode_ids = [
+        zipcode_id
+        for zipcode_id, in db.session.execute(
+            relations.delete()
+            .where(relations.c.sensor_id.in_(moved_sensor_ids))
+            .returning(relations.c.zipcode_id)
+        )
+    ]
+    logger.info("Deleting %s relations", len(deleted_zipcode_ids))
+
+    sensors = (
+        Sensor.query.filter(Sensor.id.in_(moved_sensor_ids))
+        .with_entities(Sensor.id, Sensor.latitude, Sensor.longitude)
+        .all()
+    )
+    sensor_ids = np.array([s.id for s in sensors], dtype=np.int64)
+    sensor_latitudes = np.array([s.latitude for s in sensors], dtype=np.float64)
+    sensor_longitudes = np.array([s.longitude for s in sensors], dtype=np.float64)
+    zipcode_ids, _ = index.query(
+        sensor_latitudes,
+        sensor_longitudes,
+        k=MAX_ZIPCODES_PER_SENSOR,
+        max_distance_km=MAX_SENSOR_DISTANCE_KM,
+    )
+    is_related = zipcode_ids != -1
+    sensor_positions = np.nonzero(is_related)[0]
+    zipcode_positions = np.searchsorted(all_zipcode_ids, zipcode_ids[is_related])
+
+    # Store the exact haversine distance, rather than the index's approximation.
+    distances = haversine_many(
+        sensor_longitudes[sensor_positions],
+        sensor_latitudes[sensor_positions],
+        zipcode_longitudes[zipcode_positions],
+        zipcode_latitudes[zipcode_positions],
+    )
+
+    num_relations = copy_rows(
+        SensorZipcodeRelation.__tablename__,
+        ["sensor_id", "zipcode_id", "distance"],
+        zip(
+            sensor_ids[sensor_positions].tolist(),
+            zipcode_ids[is_related].tolist(),
+            distances.tolist(),
+        ),
+    )
+    logger.info("Created %s relations", num_relations)
+
+    return set(deleted_zipcode_ids) | set(zipcode_ids[is_related].tolist())
+
+
+# Computes the same metrics as `_metrics_sync_in_python`, in a single statement,
+# for the zipcodes selected by `affected`. Zipcodes which had fresh metrics as of the
+# last sync but aren't affected can't have changed, so their pm25_updated_at is
+# just bumped.
+#
+# Readings are summed in distance order and rounded with `python_round` (see the
+# migration which adds it) so that both modes write identical values.
+_METRICS_UPDATE_SQL = """
+WITH affected AS (
+    {affected}
+), ranked AS (
+    SELECT
+        sensors_zipcodes.zipcode_id,
+        sensors_zipcodes.distance,
+        sensors.id AS sensor_id,
+        sensors.latest_reading,
+        sensors.humidity,
+        row_number() OVER (
+            PARTITION BY sensors_zipcodes.zipcode_id
+            ORDER BY sensors_zipcodes.distance, sensors.id
+        ) AS rank
+    FROM sensors_zipcodes
+    JOIN sensors ON sensors.id = sensors_zipcodes.sensor_id
+    JOIN sensors_last_seen ON sensors_last_seen.sensor_id = sensors.id
+    WHERE sensors_last_seen.last_seen > :fresh_cutoff
+        AND sensors_zipcodes.zipcode_id IN (SELECT zipcode_id FROM affected)
+), metrics AS (
+    SELECT
+        zipcode_id,
+        count(*) AS num_sensors,
+        sum(latest_reading ORDER BY distance, sensor_id) / count(*) AS pm25,
+        sum(humidity ORDER BY distance, sensor_id) / count(*) AS humidity,
+        min(distance) AS min_sensor_distance,
+        max(distance) AS max_sensor_distance,
+        array_agg(sensor_id ORDER BY distance, sensor_id) AS sensor_ids
+    FROM ranked
+    WHERE rank <= :num_readings OR distance < :reading_distance
+    GROUP BY zipcode_id
+), updated AS (
+    UPDATE zipcodes
+    SET
+        pm25 = python_round(metrics.pm25, 3),
+        humidity = python_round(metrics.humidity, 3),
+        pm25_updated_at = :ts,
+        metrics_data = json_build_object(
+            'num_sensors', metrics.num_sensors,
+            'min_sensor_distance', python_round(metrics.min_sensor_distance, 3),
+            'max_sensor_distance', python_round(metrics.max_sensor_distance, 3),
+            'sensor_ids', metrics.sensor_ids
+        )
+    FROM metrics
+    WHERE zipcodes.id = metrics.zipcode_id
+    RETURNING zipcodes.id
+), refreshed AS (
+    UPDATE zipcodes
+    SET pm25_updated_at = :ts
+    WHERE pm25_updated_at = :last_synced_at
+        AND id NOT IN (SELECT zipcode_id FROM affected)
+    RETURNING zipcodes.id
+)
+SELECT (SELECT count(*) FROM updated), (SELECT count(*) FROM refreshed)
+"""
+
+_ALL_ZIPCODES_SQL = "SELECT id AS zipcode_id FROM zipcodes"
+
+# Zipcodes whose relations changed, and zipcodes related to sensors whose readings
+# changed or which went stale since the last sync. Sensors' last_seen is refreshed
+# whenever they're seen (see `_SENSORS_LAST_SEEN_SQL`), so only sensors which
+# stopped reporting go stale.
+_AFFECTED_ZIPCODES_SQL = """
+    SELECT unnest(CAST(:zipcode_ids AS integer[])) AS zipcode_id
+    UNION
+    SELECT sensors_zipcodes.zipcode_id
+    FROM sensors_zipcodes
+    JOIN sensors_last_seen
+        ON sensors_last_seen.sensor_id = sensors_zipcodes.sensor_id
+    WHERE sensors_zipcodes.sensor_id = ANY(CAST(:sensor_ids AS integer[]))
+        OR (
+            sensors_last_seen.last_seen > :last_fresh_cutoff
+            AND sensors_last_seen.last_seen <= :fresh_cutoff
+        )
+"""
+
+
+def _metrics_sync(
+    changed_sensor_ids: typing.Optional[typing.Collection[int]] = None,
+    changed_zipcode_ids: typing.Optional[typing.Collection[int]] = None,
+):
+    # Metrics and recommendations are committed together, so that nothing reading
+    # a zipcode (like the replies cached by its pm25_updated_at) can see its new
+    # metrics with its old recommendations.
+    if METRICS_SYNC_MODE == "python":
+        _metrics_sync_in_python()
+    else:
+        _metrics_sync_in_sql(changed_sensor_ids, changed_zipcode_ids)
+    _recommendations_sync()
+    db.session.commit()
 
-    if new_relations:
-        logger.info("Creating %s relations", len(new_relations))
-        for objs in chunk_list(new_relations):
-            db.session.bulk_save_objects(objs)
-            db.session.commit()
 
+def _metrics_sync_in_sql(
+    changed_sensor_ids: typing.Optional[typing.Collection[int]] = None,
+    changed_zipcode_ids: typing.Optional[typing.Collection[int]] = None,
+):
+    """Update the metrics of every zipcode affected by the given changes.
 
-def _metrics_sync():
+    If `changed_sensor_ids` is None (or metrics have never been synced) every
+    zipcode is recomputed. The caller commits (see `_metrics_sync`).
+    """
+    logger = get_celery_logger()
+    ts = timestamp()
+    last_synced_at = Zipcode.query.get_last_pm25_updated_at()
+    is_incremental = changed_sensor_ids is not None and last_synced_at > 0
+    num_updated, num_refreshed = db.session.execute(
+        _METRICS_UPDATE_SQL.format(
+            affected=_AFFECTED_ZIPCODES_SQL if is_incremental else _ALL_ZIPCODES_SQL
+        ),
+        {
+            "fresh_cutoff": ts - SENSOR_FRESHNESS_SECONDS,
+            "last_fresh_cutoff": last_synced_at - SENSOR_FRESHNESS_SECONDS,
+            "last_synced_at": last_synced_at,
+            "num_readings": DESIRED_NUM_READINGS,
+            "reading_distance": DESIRED_READING_DISTANCE_KM,
+            "sensor_ids": list(changed_sensor_ids or []),
+            "ts": ts,
+            "zipcode_ids": list(changed_zipcode_ids or []),
+        },
+    ).fetchone()
+    logger.info(
+        "Updated %s zipcodes (refreshed %s unchanged zipcodes)",
+        num_updated,
+        num_refreshed,
+    )
+
+
+def _metrics_sync_in_python():
     logger = get_celery_logger()
     updates = []
     ts = timestamp()
@@ -226,7 +498,8 @@ def _metrics_sync():
     zipcodes_to_sensors = collections.defaultdict(list)
     for zipcode_id, latest_reading, humidity, sensor_id, distance in (
         Sensor.query.join(SensorZipcodeRelation)
-        .filter(Sensor.updated_at > ts - (30 * 60))
+        .join(SensorLastSeen)
+        .filter(SensorLastSeen.last_seen > ts - SENSOR_FRESHNESS_SECONDS)
         .with_entities(
             SensorZipcodeRelation.zipcode_id,
             Sensor.latest_reading,
@@ -247,7 +520,7 @@ def _metrics_sync():
         farthest_reading = 0.0
         sensor_ids: typing.List[int] = []
         for reading, humidity, sensor_id, distance in sorted(
-            sensor_tuples, key=lambda s: s[-1]
+            sensor_tuples, key=lambda s: (s[-1], s[-2])
         ):
             if (
                 len(readings) < DESIRED_NUM_READINGS
@@ -285,35 +558,241 @@ def _metrics_sync():
     logger.info("Updating %s zipcodes", len(updates))
     for mappings in chunk_list(updates, batch_size=5000):
         db.session.bulk_update_mappings(Zipcode, mappings)
-        db.session.commit()
 
 
-def _send_alerts():
+_RECOMMENDATIONS_UPDATE_SQL = """
+UPDATE zipcodes
+SET recommendations_data = staged.recommendations_data
+FROM {staging} AS staged
+WHERE zipcodes.id = staged.id
+    AND CAST(zipcodes.recommendations_data AS text)
+        IS DISTINCT FROM CAST(staged.recommendations_data AS text)
+"""
+
+
+def _recommendations_sync():
+    """Store the closest zipcodes with better air for each zipcode with fresh data.
+
+    Each pm25 level gets its own k-d tree, and every zipcode at a worse level
+    queries it for its closest few members. The candidates are then ranked by
+    their exact distance. The caller commits, along with the metrics.
+    """
     logger = get_celery_logger()
-    num_sent = 0
-    for client in Client.query.filter_eligible_for_sending().all():
+    rows = (
+        Zipcode.query.join(City)
+        .filter(Zipcode.pm25_updated_at > Zipcode.pm25_stale_cutoff())
+        .with_entities(
+            Zipcode.id,
+            Zipcode.zipcode,
+            City.name,
+            Zipcode.latitude,
+            Zipcode.longitude,
+            Zipcode.pm25,
+        )
+        .order_by(Zipcode.id)
+        .all()
+    )
+    if not rows:
+        return
+
+    zipcode_ids, zipcodes, city_names, latitudes, longitudes, pm25s = zip(*rows)
+    latitudes = np.array(latitudes, dtype=np.float64)
+    longitudes = np.array(longitudes, dtype=np.float64)
+    levels = Pm25.from_measurements(np.array(pm25s, dtype=np.float64))
+
+    # Positions (in `rows`) of the closest zipcodes at each level, or -1.
+    candidates = np.full(
+        (len(rows), len(Pm25) * RECOMMENDATIONS_PER_LEVEL), -1, dtype=np.int64
+    )
+    for i, level in enumerate(Pm25):
+        is_level = levels == level
+        is_worse = levels > level
+        index = SpatialIndex(
+            np.flatnonzero(is_level), latitudes[is_level], longitudes[is_level]
+        )
+        columns = slice(
+            i * RECOMMENDATIONS_PER_LEVEL, (i + 1) * RECOMMENDATIONS_PER_LEVEL
+        )
+        candidates[is_worse, columns], _ = index.query(
+            latitudes[is_worse],
+            longitudes[is_worse],
+            RECOMMENDATIONS_PER_LEVEL,
+            max_distance_km=np.inf,
+        )
+
+    is_found = candidates != -1
+    positions = np.where(is_found, candidates, 0)
+    distances = haversine_many(
+        longitudes[:, np.newaxis],
+        latitudes[:, np.newaxis],
+        longitudes[positions],
+        latitudes[positions],
+    )
+    distances[~is_found] = np.inf
+    # Rows are sorted by id, so ties in distance go to the lower id.
+    order = np.lexsort((positions, distances))
+
+    def iter_rows() -> typing.Iterator[typing.Tuple[int, str]]:
+        for i, zipcode_id in enumerate(zipcode_ids):
+            recommendations = []
+            for j in order[i]:
+                if not is_found[i, j]:
+                    break
+                position = candidates[i, j]
+                recommendations.append(
+                    {
+                        "zipcode": zipcodes[position],
+                        "city_name": city_names[position],
+                        "pm25": pm25s[position],
+                        "distance": round(float(distances[i, j]), ndigits=3),
+                    }
+                )
+            yield zipcode_id, json.dumps(recommendations)
+
+    staging = create_temp_table(
+        "recommendations_staging", {"id": "integer", "recommendations_data": "json"}
+    )
+    copy_rows(staging, ["id", "recommendations_data"], iter_rows())
+    num_updated = db.session.execute(
+        _RECOMMENDATIONS_UPDATE_SQL.format(staging=staging)
+    ).rowcount
+    logger.info("Updated recommendations for %s of %s zipcodes", num_updated, len(rows))
+
+
+def _send_and_record(
+    client_ids: typing.List[int],
+    get_messages: typing.Callable[
+        [typing.List[int]], typing.List[typing.Tuple[Client, str]]
+    ],
+    mark_sent: typing.Callable[[Client], None],
+) -> int:
+    """Message `client_ids` and record the sends, SENDS_PER_COMMIT clients at a time.
+
+    Each batch's clients are loaded, and their eligibility checked, just before
+    they're messaged, so a shard which SQS redelivers while it's still running
+    skips the clients the first copy has already recorded.
+
+    Each batch's events are written with one INSERT and committed along with its
+    clients' updated state. A client which can't be recorded is skipped without
+    affecting the rest of its batch. But the messages have already gone out, so
+    if a batch's commit fails (or the worker dies before it), its clients look
+    like they weren't messaged, and may be messaged again by the next sync.
+    Returns the number of sends recorded.
+    """
+    logger = get_celery_logger()
+    num_recorded = 0
+    for batch_ids in chunk_list(client_ids, SENDS_PER_COMMIT):
+        sent = list(Client.send_messages(get_messages(batch_ids)))
+        num_marked = 0
+        try:
+            with Event.query.buffered():
+                for client in sent:
+                    try:
+                        mark_sent(client)
+                        num_marked += 1
+                    except Exception as e:
+                        # Discard whatever was changed before it failed.
+                        db.session.expire(client)
+                        logger.exception("Failed to record send to %s: %s", client, e)
+        except Exception as e:
+            logger.exception("Failed to record %s sends: %s", len(sent), e)
+        else:
+            num_recorded += num_marked
+    return num_recorded
+
+
+def _get_alert_messages(
+    client_ids: typing.List[int],
+) -> typing.List[typing.Tuple[Client, str]]:
+    logger = get_celery_logger()
+    messages = []
+    for client in (
+        Client.query.filter_alert_candidates().filter(Client.id.in_(client_ids)).all()
+    ):
         with force_locale(client.locale):
             try:
-                if client.maybe_notify():
-                    num_sent += 1
+                message = client.get_alert_message()
             except Exception as e:
                 logger.exception("Failed to send alert to %s: %s", client, e)
+                continue
+        if message:
+            messages.append((client, message))
+    return messages
 
-    logger.info("Sent %s alerts", num_sent)
 
+def send_alerts(client_ids: typing.List[int]) -> int:
+    num_sent = _send_and_record(client_ids, _get_alert_messages, Client.mark_alerted)
+    get_celery_logger().info("Sent %s alerts", num_sent)
+    return num_sent
 
-def _send_share_requests():
+
+def _get_share_request_messages(
+    client_ids: typing.List[int],
+) -> typing.List[typing.Tuple[Client, str]]:
     logger = get_celery_logger()
-    num_sent = 0
-    for client in Client.query.filter_eligible_for_share_requests().all():
+    messages = []
+    for client in (
+        Client.query.filter_eligible_for_share_requests()
+        .filter(Client.id.in_(client_ids))
+        .all()
+    ):
         with force_locale(client.locale):
             try:
-                if client.request_share():
-                    num_sent += 1
+                message = client.get_share_request_message()
             except Exception as e:
                 logger.exception("Failed to request share from %s: %s", client, e)
-
-    logger.info("Requests %s shares", num_sent)
+                continue
+        if message:
+            messages.append((client, message))
+    return messages
+
+
+def send_share_requests(client_ids: typing.List[int]) -> int:
+    num_sent = _send_and_record(
+        client_ids, _get_share_request_messages, Client.mark_share_requested
+    )
+    get_celery_logger().info("Requests %s shares", num_sent)
+    return num_sent
+
+
+def _schedule_sends() -> typing.Optional[AsyncResult]:
+    """Fan alerts and share requests out to a chord of shard tasks.
+
+    Only the ids of candidate clients are loaded here; each shard re-checks its
+    clients' eligibility just before messaging them, so a shard that runs late
+    (or twice) won't message anyone who has since been alerted or asked to share.
+    """
+    from airq import tasks
+
+    alert_client_ids = [
+        client_id
+        for client_id, in Client.query.filter_alert_candidates()
+        .with_entities(Client.id)
+        .order_by(Client.id)
+    ]
+    share_request_client_ids = [
+        client_id
+        for client_id, in Client.query.filter_eligible_for_share_requests()
+        .with_entities(Client.id)
+        .order_by(Client.id)
+    ]
+    shards = [
+        tasks.send_alerts.s(client_ids)
+        for client_ids in chunk_list(alert_client_ids, CLIENTS_PER_SEND_SHARD)
+    ] + [
+        tasks.send_share_requests.s(client_ids)
+        for client_ids in chunk_list(share_request_client_ids, CLIENTS_PER_SEND_SHARD)
+    ]
+    if not shards:
+        return None
+
+    get_celery_logger().info(
+        "Scheduling %s alerts and %s share requests in %s shards",
+        len(alert_client_ids),
+        len(share_request_client_ids),
+        len(shards),
+    )
+    return chord(shards)(tasks.log_sends.s())
 
 
 def purpleair_sync():
@@ -323,17 +802,19 @@ def purpleair_sync():
     purpleair_data = _get_purpleair_data()
 
     logger.info("Recieved %s sensors", len(purpleair_data))
-    moved_sensor_ids = _sensors_sync(purpleair_data)
+    # Sensors, relations and metrics are all committed at once by `_metrics_sync`.
+    # The metrics sync only recomputes zipcodes affected by this run's changes, so
+    # if a run fails, none of its changes can be committed without the metrics
+    # which depend on them.
+    moved_sensor_ids, changed_sensor_ids = _sensors_sync(purpleair_data)
 
+    changed_zipcode_ids: typing.Set[int] = set()
     if moved_sensor_ids:
         logger.info("Syncing relations for %s sensors", len(moved_sensor_ids))
-        _relations_sync(moved_sensor_ids)
+        changed_zipcode_ids = _relations_sync(moved_sensor_ids)
 
     logger.info("Syncing metrics")
-    _metrics_sync()
-
-    logger.info("Sending alerts")
-    _send_alerts()
+    _metrics_sync(moved_sensor_ids + changed_sensor_ids, changed_zipcode_ids)
 
-    logger.info("Requesting shares")
-    _send_share_requests()
+    logger.info("Scheduling alerts and share requests")
+    _schedule_sends()
@@ -1,3 +1,9 @@
+import collections
+import typing
+
+from celery import chord
+from sqlalchemy.exc import SQLAlchemyError
+
 from airq import config
 from airq.celery import celery
 from airq.lib.logging import get_airq_logger
@@ -14,15 +20,108 @@ def models_sync():
 
 
 @celery.task()
-def bulk_send(message: str, last_active_at: float):
-    from airq.models.clients import Client
+def refresh_dashboard(stale_id: typing.Optional[int] = None):
+    from airq.models.dashboard import DashboardSnapshot
+
+    DashboardSnapshot.query.refresh(stale_id)
+
+
+@celery.task(bind=True, max_retries=5, default_retry_delay=60)
+def write_events(self, rows: typing.List[typing.Dict[str, typing.Any]]) -> int:
+    """Write events whose original transaction failed to commit."""
+    from airq.models.events import EventBuffer
+
+    buffer = EventBuffer(requeue=False)
+    buffer.load(rows)
+    try:
+        return buffer.flush()
+    except SQLAlchemyError as e:
+        if self.request.retries >= self.max_retries:
+            logger.error("Dropping %s events: %s", len(rows), rows)
+            return 0
+        raise self.retry(exc=e)
+
+
+@celery.task()
+def import_clients(client_import_id: int):
+    from airq.models.imports import ClientImport
 
-    num_sent = 0
-    for client in Client.query.filter_inactive_since(last_active_at).all():
-        try:
-            if client.send_message(message):
-                num_sent += 1
-        except Exception as e:
-            logger.exception("Failed to send message to %s: %s", client, e)
+    client_import = ClientImport.query.get(client_import_id)
+    client_import.run()
+    logger.info(
+        "Imported %s clients from %s rows",
+        client_import.num_created,
+        client_import.num_processed,
+    )
+
+
+@celery.task()
+def bulk_send(bulk_send_id: int):
+    """Send a bulk message in parallel chunks.
+
+    This can be re-run to resume a bulk send which didn't finish; clients who
+    already got the message are skipped.
+    """
+    from airq.models.bulk_sends import BulkSend
+
+    bulk_send = BulkSend.query.get(bulk_send_id)
+    chunks = [
+        send_bulk_chunk.si(bulk_send_id, after_id, through_id)
+        for after_id, through_id in bulk_send.get_chunks()
+    ]
+    if chunks:
+        chord(chunks)(complete_bulk_send.si(bulk_send_id))
+    else:
+        complete_bulk_send(bulk_send_id)
+
+
+@celery.task()
+def send_bulk_chunk(bulk_send_id: int, after_id: int, through_id: int) -> int:
+    from airq.models.bulk_sends import BulkSend
+
+    return BulkSend.query.get(bulk_send_id).send_chunk(after_id, through_id)
+
+
+@celery.task()
+def complete_bulk_send(bulk_send_id: int):
+    from airq.models.bulk_sends import BulkSend
+
+    bulk_send = BulkSend.query.get(bulk_send_id)
+    bulk_send.mark_complete()
+    progress = bulk_send.get_progress()
+    logger.info(
+        "Sent %s of %s messages in %.1f seconds (%.1f per second)",
+        progress.num_sent,
+        progress.num_recipients,
+        progress.seconds,
+        progress.messages_per_second,
+    )
+
+
+@celery.task()
+def send_alerts(client_ids: typing.List[int]) -> typing.Dict[str, int]:
+    from airq.sync.purpleair import send_alerts
+
+    return {"alerts": send_alerts(client_ids)}
+
+
+@celery.task()
+def send_share_requests(client_ids: typing.List[int]) -> typing.Dict[str, int]:
+    from airq.sync.purpleair import send_share_requests
+
+    return {"share_requests": send_share_requests(client_ids)}
+
+
+@celery.task()
+def log_sends(results: typing.List[typing.Dict[str, int]]) -> typing.Dict[str, int]:
+    totals: typing.Counter[str] = collections.Counter()
+    for result in results:
+        totals.update(result)
 
-    logger.info("Sent %s messages", num_sent)
+    logger.info(
+        "Sent %s alerts and %s share requests in %s shards",
+        totals["alerts"],
+        totals["share_requests"],
+        len(results),
+    )
+    return {"alerts": totals["alerts"], "share_requests": totals["share_requests"]}
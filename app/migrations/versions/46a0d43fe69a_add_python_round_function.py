@@ -0,0 +1,64 @@
+"""Add python_round function
+
+Revision ID: 46a0d43fe69a
+Revises: bc92ae15a407
+Create Date: 2021-02-20 11:02:37.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "46a0d43fe69a"
+down_revision = "bc92ae15a407"
+branch_labels = None
+depends_on = None
+
+
+# Rounds exactly like Python's `round(x, ndigits)` does for floats: the exact binary
+# value of x is rounded, with ties going to the even digit. Postgres' own round()
+# works on a 15 digit decimal approximation of x and rounds ties away from zero,
+# which disagrees with Python for values like 0.0625 or 2.675.
+#
+# The exact value is read from the bits of x: |x| = mantissa / 2^shift, which is the
+# integer mantissa * 5^shift divided by 10^shift, so it can be rounded with integer
+# division in numeric. Only valid for ndigits >= 0.
+PYTHON_ROUND_SQL = """
+CREATE FUNCTION python_round(x double precision, ndigits integer)
+RETURNS double precision AS $$
+DECLARE
+    bits bigint := ('x' || encode(float8send(x), 'hex'))::bit(64)::bigint;
+    exponent integer := (bits >> 52) & 2047;
+    mantissa numeric := bits & 4503599627370495;
+    shift integer := 1075 - greatest(exponent, 1);
+    unit numeric;
+    quotient numeric;
+    remainder numeric;
+BEGIN
+    IF shift <= ndigits THEN
+        -- NaN, infinite, or without any digits past ndigits.
+        RETURN x;
+    END IF;
+    IF exponent > 0 THEN
+        -- Add the implicit leading bit of normal numbers.
+        mantissa := mantissa + 4503599627370496;
+    END IF;
+    unit := 10::numeric ^ (shift - ndigits);
+    quotient := div(mantissa * 5::numeric ^ shift, unit);
+    remainder := mod(mantissa * 5::numeric ^ shift, unit);
+    IF remainder > unit / 2 OR (remainder = unit / 2 AND mod(quotient, 2) = 1) THEN
+        quotient := quotient + 1;
+    END IF;
+    RETURN sign(x) * (quotient / 10::numeric ^ ndigits)::double precision;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE STRICT;
+"""
+
+
+def upgrade():
+    op.execute(PYTHON_ROUND_SQL)
+
+
+def downgrade():
+    op.execute("DROP FUNCTION python_round(double precision, integer)")
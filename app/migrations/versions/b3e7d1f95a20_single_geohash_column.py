@@ -0,0 +1,60 @@
+"""Store geohashes in a single indexed column
+
+Revision ID: b3e7d1f95a20
+Revises: 9f4b1c6d8e27
+Create Date: 2021-02-26 11:04:37.528190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3e7d1f95a20"
+down_revision = "9f4b1c6d8e27"
+branch_labels = None
+depends_on = None
+
+
+TABLES = ("sensors", "zipcodes")
+
+GEOHASH_BITS = [f"geohash_bit_{i}" for i in range(1, 13)]
+
+JOIN_GEOHASH_SQL = "UPDATE {table} SET geohash = {bits}".format(
+    table="{table}", bits=" || ".join(GEOHASH_BITS)
+)
+
+SPLIT_GEOHASH_SQL = "UPDATE {table} SET " + ", ".join(
+    f"{bit} = substr(geohash, {i}, 1)" for i, bit in enumerate(GEOHASH_BITS, 1)
+)
+
+# Dropping a column doesn't remove its values from existing rows, so we rewrite
+# them to actually make the rows smaller.
+REWRITE_ROWS_SQL = "UPDATE {table} SET geohash = geohash"
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(
+            table, sa.Column("geohash", sa.String(collation="C"), nullable=True)
+        )
+        op.execute(JOIN_GEOHASH_SQL.format(table=table))
+        op.alter_column(table, "geohash", nullable=False)
+        op.create_index(op.f(f"ix_{table}_geohash"), table, ["geohash"], unique=False)
+        for bit in GEOHASH_BITS:
+            op.drop_column(table, bit)
+        op.execute(REWRITE_ROWS_SQL.format(table=table))
+
+
+def downgrade():
+    for table in TABLES:
+        for bit in GEOHASH_BITS:
+            op.add_column(
+                table,
+                sa.Column(bit, sa.VARCHAR(), autoincrement=False, nullable=True),
+            )
+        op.execute(SPLIT_GEOHASH_SQL.format(table=table))
+        for bit in GEOHASH_BITS:
+            op.alter_column(table, bit, nullable=False)
+        op.drop_index(op.f(f"ix_{table}_geohash"), table_name=table)
+        op.drop_column(table, "geohash")
@@ -0,0 +1,126 @@
+"""Partition events by month and roll them up by day
+
+Revision ID: e2d9b7c41a53
+Revises: c5f3a8e21b94
+Create Date: 2021-02-24 10:12:48.220914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e2d9b7c41a53"
+down_revision = "c5f3a8e21b94"
+branch_labels = None
+depends_on = None
+
+
+# Postgres can't turn a table into a partitioned one in place, so we build the
+# partitioned table alongside the old one, move the rows over, and hand it the
+# old table's id sequence.
+RENAME_EVENTS_SQL = """
+ALTER TABLE events RENAME TO events_unpartitioned;
+ALTER INDEX events_pkey RENAME TO events_unpartitioned_pkey;
+ALTER INDEX ix_events_client_id RENAME TO ix_events_unpartitioned_client_id;
+ALTER INDEX ix_events_timestamp RENAME TO ix_events_unpartitioned_timestamp;
+ALTER INDEX ix_events_type_code RENAME TO ix_events_unpartitioned_type_code;
+"""
+
+CREATE_PARTITIONED_EVENTS_SQL = """
+CREATE TABLE events (
+    id integer NOT NULL DEFAULT nextval('events_id_seq'),
+    client_id integer NOT NULL,
+    type_code integer NOT NULL,
+    timestamp timestamp with time zone NOT NULL,
+    json_data json NOT NULL,
+    CONSTRAINT events_pkey PRIMARY KEY (id, timestamp),
+    CONSTRAINT events_client_id_fkey FOREIGN KEY (client_id) REFERENCES clients (id)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE events_id_seq OWNED BY events.id;
+CREATE INDEX ix_events_client_id ON events (client_id);
+CREATE INDEX ix_events_timestamp ON events (timestamp);
+CREATE INDEX ix_events_type_code ON events (type_code);
+CREATE TABLE events_default PARTITION OF events DEFAULT;
+"""
+
+# One partition per (UTC) month from the oldest event through next month. After
+# this, `airq.sync.events` creates partitions ahead of time.
+CREATE_MONTHLY_PARTITIONS_SQL = """
+DO $$
+DECLARE
+    month timestamp;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce(min(timestamp), now()) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month',
+            interval '1 month'
+        )
+        FROM events_unpartitioned
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+            'events_' || to_char(month, 'YYYY_MM'),
+            month || '+00',
+            (month + interval '1 month') || '+00'
+        );
+    END LOOP;
+END
+$$;
+"""
+
+MOVE_EVENTS_SQL = """
+INSERT INTO events (id, client_id, type_code, timestamp, json_data)
+SELECT id, client_id, type_code, timestamp, json_data
+FROM events_unpartitioned;
+DROP TABLE events_unpartitioned;
+"""
+
+BACKFILL_EVENT_COUNTS_SQL = """
+INSERT INTO event_counts (date, type_code, count)
+SELECT DATE(timezone('PST', timestamp)), type_code, count(*)
+FROM events
+GROUP BY 1, 2
+"""
+
+UNPARTITION_EVENTS_SQL = """
+CREATE TABLE events_unpartitioned (LIKE events INCLUDING DEFAULTS);
+INSERT INTO events_unpartitioned SELECT * FROM events;
+ALTER SEQUENCE events_id_seq OWNED BY events_unpartitioned.id;
+DROP TABLE events;
+ALTER TABLE events_unpartitioned RENAME TO events;
+ALTER TABLE events ADD CONSTRAINT events_pkey PRIMARY KEY (id);
+ALTER TABLE events ADD CONSTRAINT events_client_id_fkey
+    FOREIGN KEY (client_id) REFERENCES clients (id);
+CREATE INDEX ix_events_client_id ON events (client_id);
+CREATE INDEX ix_events_timestamp ON events (timestamp);
+CREATE INDEX ix_events_type_code ON events (type_code);
+"""
+
+
+def upgrade():
+    op.execute(RENAME_EVENTS_SQL)
+    op.execute(CREATE_PARTITIONED_EVENTS_SQL)
+    op.execute(CREATE_MONTHLY_PARTITIONS_SQL)
+    op.execute(MOVE_EVENTS_SQL)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table(
+        "event_counts",
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("type_code", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("date", "type_code"),
+    )
+    # ### end Alembic commands ###
+
+    op.execute(BACKFILL_EVENT_COUNTS_SQL)
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table("event_counts")
+    # ### end Alembic commands ###
+
+    op.execute(UNPARTITION_EVENTS_SQL)
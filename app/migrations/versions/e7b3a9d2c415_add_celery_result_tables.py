@@ -0,0 +1,67 @@
+"""Add celery result tables
+
+Revision ID: e7b3a9d2c415
+Revises: d41f7b0c6e58
+Create Date: 2021-02-27 16:05:48.220914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e7b3a9d2c415"
+down_revision = "d41f7b0c6e58"
+branch_labels = None
+depends_on = None
+
+
+# These match the models of Celery's SQLAlchemy result backend
+# (celery.backends.database.models), which would otherwise create them itself.
+# Its models take their ids from these sequences explicitly.
+SEQUENCES = ("task_id_sequence", "taskset_id_sequence")
+
+
+def upgrade():
+    for name in SEQUENCES:
+        op.execute(sa.schema.CreateSequence(sa.Sequence(name)))
+    op.create_table(
+        "celery_taskmeta",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("task_id", sa.String(length=155), nullable=True),
+        sa.Column("status", sa.String(length=50), nullable=True),
+        sa.Column("result", sa.LargeBinary(), nullable=True),
+        sa.Column("date_done", sa.DateTime(), nullable=True),
+        sa.Column("traceback", sa.Text(), nullable=True),
+        sa.Column("name", sa.String(length=155), nullable=True),
+        sa.Column("args", sa.LargeBinary(), nullable=True),
+        sa.Column("kwargs", sa.LargeBinary(), nullable=True),
+        sa.Column("worker", sa.String(length=155), nullable=True),
+        sa.Column("retries", sa.Integer(), nullable=True),
+        sa.Column("queue", sa.String(length=155), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("task_id"),
+    )
+    op.create_index(
+        op.f("ix_celery_taskmeta_date_done"),
+        "celery_taskmeta",
+        ["date_done"],
+        unique=False,
+    )
+    op.create_table(
+        "celery_tasksetmeta",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("taskset_id", sa.String(length=155), nullable=True),
+        sa.Column("result", sa.LargeBinary(), nullable=True),
+        sa.Column("date_done", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("taskset_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("celery_tasksetmeta")
+    op.drop_index(op.f("ix_celery_taskmeta_date_done"), table_name="celery_taskmeta")
+    op.drop_table("celery_taskmeta")
+    for name in SEQUENCES:
+        op.execute(sa.schema.DropSequence(sa.Sequence(name)))
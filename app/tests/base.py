@@ -1,14 +1,17 @@
+import contextlib
 import datetime
 import pytz
 import typing
 import unittest
 from unittest import mock
 
+from sqlalchemy import event
 from twilio.rest.api.v2010.account.message import MessageList
 
 from airq import models
 from airq.config import app
 from airq.config import db
+from airq.lib.cache import clear_caches
 from airq.lib.clock import timestamp
 from airq.models.events import Event
 from airq.models.events import EventType
@@ -26,6 +29,7 @@ class BaseTestCase(unittest.TestCase):
 
     _persistent_models = (
         models.relations.SensorZipcodeRelation,
+        models.sensors.SensorLastSeen,
         models.sensors.Sensor,
         models.zipcodes.Zipcode,
         models.cities.City,
@@ -42,7 +46,9 @@ class BaseTestCase(unittest.TestCase):
             if isinstance(c, type) and issubclass(c, db.Model):
                 if c not in cls._persistent_models:
                     ephemeral_models.append(c)
-        return ephemeral_models
+        # Delete from tables before the tables they reference.
+        tables = list(reversed(cls.db.Model.metadata.sorted_tables))
+        return sorted(ephemeral_models, key=lambda c: tables.index(c.__table__))
 
     @classmethod
     def _truncate_tables(cls, models: typing.Iterable[db.Model]):  # type: ignore
@@ -70,6 +76,7 @@ class BaseTestCase(unittest.TestCase):
         super().tearDown()
         self._teardown_mocks()
         self._truncate_tables(self._get_ephemeral_models())
+        clear_caches()
 
     @staticmethod
     def get_mock_datetime() -> datetime.datetime:
@@ -116,6 +123,24 @@ class BaseTestCase(unittest.TestCase):
             actual.decode(),
         )
 
+    @contextlib.contextmanager
+    def assert_num_queries(self, expected: int) -> typing.Iterator[None]:
+        statements: typing.List[str] = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", before_cursor_execute)
+        self.assertEqual(
+            expected,
+            len(statements),
+            "Unexpected queries:\n{}".format("\n".join(statements)),
+        )
+
     def assert_event(self, client_id: int, event_type: EventType, **data):
         event = (
             Event.query.filter_by(
@@ -0,0 +1,89 @@
+import hashlib
+import http.server
+import os
+import threading
+import typing
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures"
+)
+
+
+class FakeFixtureServer:
+    """A local stand-in for the servers we download static data from.
+
+    Serves each fixture in `fixtures` (a map of URL path to fixture file) with
+    an ETag and a Last-Modified header, and answers conditional requests for
+    an unchanged fixture with a 304. `responses` records the path and status
+    code of every request it answers.
+    """
+
+    LAST_MODIFIED = "Tue, 24 Apr 2012 00:00:00 GMT"
+
+    def __init__(self, fixtures: typing.Dict[str, str]):
+        self.fixtures = fixtures
+        self.responses: typing.List[typing.Tuple[str, int]] = []
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler()
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeFixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self) -> typing.Type[http.server.BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in server.fixtures:
+                    self._respond(404)
+                    return
+
+                with open(
+                    os.path.join(FIXTURES_DIR, server.fixtures[self.path]), "rb"
+                ) as f:
+                    content = f.read()
+                etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    self._respond(304)
+                    return
+
+                self._respond(
+                    200,
+                    content,
+                    {"ETag": etag, "Last-Modified": server.LAST_MODIFIED},
+                )
+
+            def _respond(
+                self,
+                status: int,
+                content: bytes = b"",
+                headers: typing.Optional[typing.Dict[str, str]] = None,
+            ):
+                with server._lock:
+                    server.responses.append((self.path, status))
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -9,6 +9,9 @@ from unittest import mock
 
 
 class MockResponse(abc.ABC):
+    status_code = 200
+    headers: typing.Dict[str, str] = {}
+
     @abc.abstractmethod
     def raise_for_status(self):
         pass
@@ -39,7 +42,10 @@ class SuccessResponse(MockResponse):
 
     def iter_content(self, chunk_size: typing.Optional[int] = None):
         with open(self._full_path, "rb") as f:
-            return [f.read()]
+            content = f.read()
+        if not chunk_size:
+            return [content]
+        return [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
 
     def json(self) -> dict:
         with open(self._full_path) as f:
@@ -0,0 +1,105 @@
+import http.server
+import json
+import threading
+import time
+import typing
+import urllib.parse
+
+from twilio.rest.api.v2010.account.message import MessageList
+
+
+# The real implementation, captured before tests patch it out.
+create_message = MessageList.create
+
+
+class FakeTwilioServer:
+    """A local stand-in for Twilio's messages API.
+
+    Point the Twilio client at `url` to send real HTTP requests without
+    talking to Twilio. Messages to numbers in `error_codes` fail with
+    the given Twilio error code.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        error_codes: typing.Optional[typing.Dict[str, int]] = None,
+    ):
+        self.latency = latency
+        self.error_codes = error_codes or {}
+        self.messages: typing.List[typing.Dict[str, str]] = []
+        self.connections: typing.Set[typing.Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler()
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeTwilioServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self) -> typing.Type[http.server.BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # Keep connections open so that clients can reuse them.
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+                message = {k: v[0] for k, v in form.items()}
+                with server._lock:
+                    server.connections.add(self.client_address)
+                if server.latency:
+                    time.sleep(server.latency)
+
+                error_code = server.error_codes.get(message.get("To", ""))
+                if error_code:
+                    self._respond(
+                        400,
+                        {
+                            "code": error_code,
+                            "message": "Fake error",
+                            "more_info": "",
+                            "status": 400,
+                        },
+                    )
+                    return
+
+                with server._lock:
+                    server.messages.append(message)
+                    sid = "SM{:032d}".format(len(server.messages))
+                self._respond(
+                    201,
+                    {
+                        "sid": sid,
+                        "to": message.get("To"),
+                        "from": message.get("From"),
+                        "body": message.get("Body"),
+                        "status": "queued",
+                    },
+                )
+
+            def _respond(self, status: int, payload: typing.Dict[str, typing.Any]):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
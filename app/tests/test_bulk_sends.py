@@ -0,0 +1,147 @@
+import datetime
+from unittest import mock
+
+from airq import tasks
+from airq.models import bulk_sends
+from airq.models.bulk_sends import BulkSend
+from airq.models.bulk_sends import BulkSendRecipient
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
+from tests.base import BaseTestCase
+
+
+class BulkSendTestCase(BaseTestCase):
+    def _make_clients(
+        self, num_clients: int, last_activity_at: int = 0, area_code: int = 415
+    ):
+        clients = [
+            Client(
+                identifier=f"+1{area_code}222{i:04d}",
+                type_code=ClientIdentifierType.PHONE_NUMBER,
+                last_activity_at=last_activity_at,
+            )
+            for i in range(num_clients)
+        ]
+        self.db.session.add_all(clients)
+        self.db.session.commit()
+        return [client.id for client in clients]
+
+    @mock.patch.object(bulk_sends, "BULK_SEND_CHUNK_SIZE", 2)
+    def test_get_chunks(self):
+        client_ids = self._make_clients(5)
+        self._make_clients(1, last_activity_at=self.timestamp, area_code=503)
+        bulk_send = BulkSend.query.create("Hello", self.timestamp - 60)
+        self.assertEqual(5, bulk_send.num_recipients)
+        self.assertEqual(
+            [
+                (0, client_ids[1]),
+                (client_ids[1], client_ids[3]),
+                (client_ids[3], client_ids[4]),
+            ],
+            list(bulk_send.get_chunks()),
+        )
+
+    @mock.patch.object(bulk_sends, "BULK_SEND_CHUNK_SIZE", 2)
+    def test_bulk_send(self):
+        client_ids = self._make_clients(5)
+        self._make_clients(1, last_activity_at=self.timestamp, area_code=503)
+        bulk_send = BulkSend.query.create("Hello", self.timestamp - 60)
+        bulk_send_id = bulk_send.id
+
+        # Pretend a previous attempt got as far as the second client.
+        for client_id in client_ids[:2]:
+            self.db.session.add(
+                BulkSendRecipient(
+                    bulk_send_id=bulk_send_id,
+                    client_id=client_id,
+                    sent_at=self.clock.now(),
+                )
+            )
+        self.db.session.commit()
+
+        self.clock.advance(10)
+        tasks.bulk_send.delay(bulk_send_id)
+
+        self.assertEqual(
+            {f"+1415222{i:04d}" for i in range(2, 5)},
+            {call[1]["to"] for call in self._mocks["send_sms"].call_args_list},
+        )
+        bulk_send = BulkSend.query.get(bulk_send_id)
+        self.assertTrue(bulk_send.is_complete)
+        progress = bulk_send.get_progress()
+        self.assertEqual(5, progress.num_sent)
+        self.assertEqual(100.0, progress.percent_complete)
+        self.assertEqual(0.5, progress.messages_per_second)
+
+        # Running it again doesn't send anything.
+        self._mocks["send_sms"].reset_mock()
+        tasks.bulk_send.delay(bulk_send_id)
+        self._mocks["send_sms"].assert_not_called()
+        bulk_send = BulkSend.query.get(bulk_send_id)
+        self.assertEqual(self.clock.now(), bulk_send.completed_at)
+
+        # Nor does it move the time it was completed.
+        self.clock.advance(60)
+        tasks.complete_bulk_send.delay(bulk_send_id)
+        bulk_send = BulkSend.query.get(bulk_send_id)
+        self.assertEqual(
+            self.clock.now() - datetime.timedelta(seconds=60), bulk_send.completed_at
+        )
+
+    @mock.patch.object(bulk_sends, "BULK_SEND_BATCH_SIZE", 1)
+    def test_send_chunk_skips_clients_sent_by_another_run(self):
+        client_ids = self._make_clients(3)
+        bulk_send = BulkSend.query.create("Hello", self.timestamp - 60)
+        bulk_send_id = bulk_send.id
+        send_messages = Client.send_messages
+
+        def send_alongside_another_run(messages):
+            # Pretend a redelivered copy of the chunk got to the last client first.
+            if not BulkSendRecipient.query.filter_by(client_id=client_ids[2]).count():
+                self.db.session.add(
+                    BulkSendRecipient(
+                        bulk_send_id=bulk_send_id,
+                        client_id=client_ids[2],
+                        sent_at=self.clock.now(),
+                    )
+                )
+                self.db.session.commit()
+            return send_messages(messages)
+
+        with mock.patch.object(
+            Client, "send_messages", side_effect=send_alongside_another_run
+        ):
+            num_sent = bulk_send.send_chunk(0, client_ids[-1])
+
+        self.assertEqual(2, num_sent)
+        self.assertEqual(
+            ["+14152220000", "+14152220001"],
+            [call[1]["to"] for call in self._mocks["send_sms"].call_args_list],
+        )
+
+    def test_resume(self):
+        client_ids = self._make_clients(2)
+        bulk_send = BulkSend.query.create("Hello", self.timestamp - 60)
+        bulk_send_id = bulk_send.id
+        self.db.session.add(
+            BulkSendRecipient(
+                bulk_send_id=bulk_send_id,
+                client_id=client_ids[0],
+                sent_at=self.clock.now(),
+            )
+        )
+        self.db.session.commit()
+
+        # Someone was just sent the message, so it's still running.
+        self.clock.advance(bulk_sends.BULK_SEND_STALL_SECONDS - 1)
+        self.assertFalse(bulk_send.is_stalled)
+        self.assertFalse(bulk_send.resume())
+
+        self.clock.advance(1)
+        self.assertTrue(bulk_send.is_stalled)
+        self.assertTrue(bulk_send.resume())
+
+        # Resuming it counts as progress, so it can't be resumed again right away.
+        bulk_send = BulkSend.query.get(bulk_send_id)
+        self.assertFalse(bulk_send.is_stalled)
+        self.assertFalse(bulk_send.resume())
@@ -0,0 +1,39 @@
+from unittest import mock
+
+from airq.lib.cache import get_cache_stats
+from airq.lib.cache import VersionedLRUCache
+from tests.base import BaseTestCase
+
+
+class CacheTestCase(BaseTestCase):
+    def test_versioned_lru_cache(self):
+        cache: VersionedLRUCache[str, int] = VersionedLRUCache("test", maxsize=2)
+        compute = mock.Mock(side_effect=range(100))
+
+        self.assertEqual(0, cache.get("a", 1, compute))
+        self.assertEqual(0, cache.get("a", 1, compute))
+        self.assertEqual(1, compute.call_count)
+
+        # A new version replaces the entry.
+        self.assertEqual(1, cache.get("a", 2, compute))
+        self.assertEqual(1, cache.get("a", 2, compute))
+        self.assertEqual(2, compute.call_count)
+
+        # The least recently used entry is evicted.
+        self.assertEqual(2, cache.get("b", 1, compute))
+        self.assertEqual(1, cache.get("a", 2, compute))
+        self.assertEqual(3, cache.get("c", 1, compute))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get("a", 2, compute))
+        self.assertEqual(4, cache.get("b", 1, compute))
+
+        stats = cache.stats
+        self.assertEqual(4, stats.hits)
+        self.assertEqual(5, stats.misses)
+        self.assertAlmostEqual(4 / 9, stats.hit_rate)
+
+        self.assertEqual(stats, get_cache_stats()["test"])
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.stats.lookups)
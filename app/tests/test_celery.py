@@ -0,0 +1,33 @@
+import datetime
+
+from celery import states
+
+from airq.celery import celery
+from tests.base import BaseTestCase
+
+
+class CeleryTestCase(BaseTestCase):
+    def test_result_backend(self):
+        # The result backend's tables are created by a migration rather than by
+        # Celery, so make sure they still fit its models.
+        backend = celery.backend
+        backend.store_result("test-result", {"num_sent": 1}, states.SUCCESS)
+        self.assertEqual(
+            {"num_sent": 1}, backend.get_task_meta("test-result")["result"]
+        )
+
+        # Expired results are deleted by the backend_cleanup task.
+        session = backend.ResultSession()
+        try:
+            session.query(backend.task_cls).filter_by(task_id="test-result").update(
+                {
+                    "date_done": datetime.datetime.utcnow()
+                    - celery.conf.result_expires
+                    - datetime.timedelta(minutes=1)
+                }
+            )
+            session.commit()
+        finally:
+            session.close()
+        celery.tasks["celery.backend_cleanup"]()
+        self.assertEqual(states.PENDING, backend.get_task_meta("test-result")["status"])
@@ -12,6 +12,7 @@ from airq.models.clients import ClientIdentifierType
 from airq.models.events import Event
 from airq.models.events import EventType
 from airq.models.zipcodes import Zipcode
+from airq.sync import purpleair
 from tests.base import BaseTestCase
 
 
@@ -38,10 +39,11 @@ class ClientTestCase(BaseTestCase):
         alerts_disabled_at: int = 0,
         num_alerts_sent: int = 0,
         created_at: typing.Optional[datetime.datetime] = None,
+        identifier: str = "+12222222222",
     ) -> Client:
         assert self.zipcode is not None, "Zipcode not set"
         client = Client(
-            identifier="+12222222222",
+            identifier=identifier,
             type_code=ClientIdentifierType.PHONE_NUMBER,
             last_activity_at=last_activity_at,
             zipcode_id=self.zipcode.id,
@@ -184,6 +186,122 @@ class ClientTestCase(BaseTestCase):
         self.db.session.commit()
         self.assertEqual(0, Client.query.filter_eligible_for_sending().count())
 
+    def test_filter_alert_candidates(self):
+        client = self._make_client(last_pm25=Pm25.MODERATE - 1)
+        zipcode = client.zipcode
+
+        def is_candidate() -> bool:
+            return client.id in {c.id for c in Client.query.filter_alert_candidates()}
+
+        # Don't consider clients whose AQI level hasn't changed
+        zipcode.pm25 = Pm25.MODERATE - 2
+        self.db.session.commit()
+        self.assertFalse(is_candidate())
+
+        zipcode.pm25 = Pm25.UNHEALTHY_FOR_SENSITIVE_GROUPS
+        self.db.session.commit()
+        self.assertTrue(is_candidate())
+
+        # Don't consider clients who were alerted within their alert frequency
+        client.last_alert_sent_at = self.timestamp - 60 * 60
+        self.db.session.commit()
+        self.assertFalse(is_candidate())
+
+        client.alert_frequency = 1
+        self.db.session.commit()
+        self.assertFalse(is_candidate())
+
+        client.alert_frequency = 0
+        self.db.session.commit()
+        self.assertTrue(is_candidate())
+
+        # The alert threshold behaves just like it does in maybe_notify
+        client.alert_threshold = Pm25.MODERATE.value
+        client.last_alert_sent_at = 0
+        self.db.session.commit()
+        for last_pm25, curr_pm25 in (
+            (Pm25.MODERATE - 1, Pm25.MODERATE),
+            (Pm25.MODERATE, Pm25.MODERATE - 1),
+            (Pm25.MODERATE, Pm25.MODERATE + 1),
+            (Pm25.MODERATE, Pm25.UNHEALTHY_FOR_SENSITIVE_GROUPS),
+            (Pm25.UNHEALTHY_FOR_SENSITIVE_GROUPS, Pm25.MODERATE),
+            (Pm25.UNHEALTHY, Pm25.GOOD),
+        ):
+            with self.subTest("{} => {}".format(last_pm25, curr_pm25)):
+                client.last_pm25 = last_pm25
+                client.last_alert_sent_at = 0
+                zipcode.pm25 = curr_pm25
+                self.db.session.commit()
+                expected = is_candidate()
+                with mock.patch.object(Client, "is_in_send_window", return_value=True):
+                    self.assertEqual(expected, client.maybe_notify())
+
+    def test_get_activity_counts(self):
+        day = 24 * 60 * 60
+        for i, (last_activity_at, last_alert_sent_at) in enumerate(
+            (
+                (self.timestamp - day // 2, 0),
+                (0, self.timestamp - day // 2),
+                (self.timestamp - 3 * day + 1, self.timestamp - 6 * day + 1),
+                (self.timestamp - 10 * day, self.timestamp - 29 * day),
+                (self.timestamp - 40 * day, 0),
+                (0, 0),
+            )
+        ):
+            self._make_client(
+                last_activity_at=last_activity_at,
+                last_alert_sent_at=last_alert_sent_at,
+                identifier=f"+1222222222{i}",
+            )
+        self.db.session.add(
+            Client(
+                identifier="127.0.0.1",
+                type_code=ClientIdentifierType.IP,
+                last_activity_at=self.timestamp,
+            )
+        )
+        self.db.session.commit()
+
+        expected = {1: 2, 2: 2, 3: 3, 4: 3, 5: 3, 6: 3, 7: 3, 30: 4}
+        self.assertEqual(expected, Client.query.get_activity_counts())
+
+    def test_schedule_sends(self):
+        clients = [
+            self._make_client(
+                last_pm25=Pm25.MODERATE - 1, identifier="+1222222222{}".format(i)
+            )
+            for i in range(3)
+        ]
+        client_ids = [client.id for client in clients]
+        zipcode_id = self.zipcode.id
+        self.zipcode.pm25 = Pm25.UNHEALTHY_FOR_SENSITIVE_GROUPS
+        self.db.session.commit()
+
+        with mock.patch.object(
+            Client, "is_in_send_window", return_value=True
+        ), mock.patch.object(purpleair, "CLIENTS_PER_SEND_SHARD", 2), mock.patch.object(
+            purpleair, "SENDS_PER_COMMIT", 1
+        ), mock.patch.object(
+            purpleair, "send_alerts", wraps=purpleair.send_alerts
+        ) as mock_send_alerts:
+            result = purpleair._schedule_sends()
+            # A redelivered shard skips the clients that were already alerted.
+            self.assertEqual(0, purpleair.send_alerts(client_ids))
+
+        # The eager tasks ran in their own app context, which removed our session.
+        self.zipcode = Zipcode.query.get(zipcode_id)
+        self.assertIsNotNone(result)
+        self.assertEqual({"alerts": 3, "share_requests": 0}, result.get())
+        self.assertEqual(3, mock_send_alerts.call_count)
+        self.assertEqual(3, self._mocks["send_sms"].call_count)
+        for client_id in client_ids:
+            self.assertEqual(
+                self.timestamp, Client.query.get(client_id).last_alert_sent_at
+            )
+
+        # Everyone was just alerted, so there's nothing left to schedule.
+        self.assertIsNone(purpleair._schedule_sends())
+
     def test_enable_alerts(self):
         client = self._make_client(alerts_disabled_at=self.timestamp)
         client.enable_alerts()
@@ -267,14 +385,14 @@ class ClientTestCase(BaseTestCase):
         self.db.session.commit()
         self.assertEqual(1, Client.query.filter_eligible_for_share_requests().count())
 
-        event = Event.query.create(client.id, EventType.SHARE_REQUEST)
+        client.mark_share_requested()
         self.assertEqual(0, Client.query.filter_eligible_for_share_requests().count())
 
-        event.timestamp -= datetime.timedelta(days=60)
+        client.last_share_request_at -= datetime.timedelta(days=60)
         self.db.session.commit()
         self.assertEqual(1, Client.query.filter_eligible_for_share_requests().count())
 
-        event.timestamp += datetime.timedelta(seconds=2)
+        client.last_share_request_at += datetime.timedelta(seconds=2)
         self.db.session.commit()
         self.assertEqual(0, Client.query.filter_eligible_for_share_requests().count())
 
@@ -295,24 +413,24 @@ class ClientTestCase(BaseTestCase):
         self.assertFalse(client.request_share())
         self.assertEqual(1, Event.query.count())
 
-        share_request = client.get_last_share_request()
-        share_request.timestamp -= datetime.timedelta(days=60)
+        client.last_share_request_at -= datetime.timedelta(days=60)
         self.db.session.commit()
         self.assertFalse(client.request_share())
         self.assertEqual(1, Event.query.count())
 
-        share_request.timestamp -= datetime.timedelta(seconds=1)
+        client.last_share_request_at -= datetime.timedelta(seconds=1)
         self.db.session.commit()
         self.assertTrue(client.request_share())
         self.assertEqual(2, Event.query.count())
         self.assert_event(client.id, EventType.SHARE_REQUEST)
         share_request = client.get_last_share_request()
         self.assertEqual(share_request.timestamp, self.clock.now())
+        self.assertEqual(client.last_share_request_at, self.clock.now())
         self.assertEqual(
             2, Event.query.filter_by(type_code=EventType.SHARE_REQUEST).count()
         )
 
-        share_request.timestamp -= datetime.timedelta(days=60, seconds=1)
+        client.last_share_request_at -= datetime.timedelta(days=60, seconds=1)
         client.created_at += datetime.timedelta(seconds=1)
         self.db.session.commit()
         self.assertFalse(client.request_share())
@@ -331,19 +449,30 @@ class ClientTestCase(BaseTestCase):
     def test_get_last_client_event(self):
         client = self._make_client()
         self.assertIsNone(client.get_last_client_event())
+        self.assertIsNone(client.get_last_client_event_type())
 
         client.log_event(
             EventType.ALERT, zipcode=client.zipcode.zipcode, pm25=client.zipcode.pm25
         )
         self.assertIsNone(client.get_last_client_event())
+        self.assertIsNone(client.get_last_client_event_type())
 
         client.log_event(EventType.MENU)
         last_event = client.get_last_client_event()
         self.assertEqual(EventType.MENU, last_event.type_code)
+        self.assertEqual(EventType.MENU, client.get_last_client_event_type())
+        self.assertEqual(self.clock.now(), client.last_inbound_event_at)
+        self.assertTrue(client.has_recent_last_event_of_type(EventType.MENU))
 
+        self.clock.advance()
         client.log_event(EventType.SHARE_REQUEST)
         last_event = client.get_last_client_event()
         self.assertEqual(EventType.MENU, last_event.type_code)
+        self.assertEqual(EventType.MENU, client.get_last_client_event_type())
+        self.assertEqual(self.clock.now(), client.last_share_request_at)
+
+        self.clock.advance(60 * 60)
+        self.assertFalse(client.has_recent_last_event_of_type(EventType.MENU))
 
     def test_alert_frequency(self):
         client = self._make_client()
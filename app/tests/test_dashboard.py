@@ -0,0 +1,59 @@
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
+from airq.models import dashboard
+from airq.models.dashboard import DashboardSnapshot
+from airq.models.events import EventType
+from tests.base import BaseTestCase
+
+
+class DashboardSnapshotTestCase(BaseTestCase):
+    def test_create(self):
+        self.assertIsNone(DashboardSnapshot.query.get_latest())
+
+        client = Client(
+            identifier="+12222222222",
+            type_code=ClientIdentifierType.PHONE_NUMBER,
+            last_activity_at=self.timestamp,
+        )
+        self.db.session.add(client)
+        self.db.session.commit()
+        client.log_event(EventType.MENU)
+
+        first = DashboardSnapshot.query.create()
+        self.assertEqual(
+            {
+                "Total Alerts Sent": 0,
+                "Total Subscribed Clients": 0,
+                "Total New Clients": 1,
+                "Total Clients": 1,
+            },
+            first.summary,
+        )
+        self.assertEqual(
+            ["1", "2", "3", "4", "5", "6", "7", "30"], list(first.activity_counts)
+        )
+        self.assertEqual(1, first.activity_counts["30"])
+        self.assertEqual(["2020-09-18", "TOTAL"], list(first.event_stats))
+        self.assertEqual(1, first.event_stats["2020-09-18"]["MENU"])
+
+        # Only the latest snapshot is kept.
+        self.clock.advance(60)
+        second = DashboardSnapshot.query.create()
+        self.assertEqual(second, DashboardSnapshot.query.get_latest())
+        self.assertEqual(1, DashboardSnapshot.query.count())
+
+    def test_refresh(self):
+        # Refreshes queued for the same snapshot only compute one.
+        first_id = DashboardSnapshot.query.refresh(0).id
+        self.assertEqual(first_id, DashboardSnapshot.query.get_latest_id())
+        self.assertIsNone(DashboardSnapshot.query.refresh(0))
+        second_id = DashboardSnapshot.query.refresh(first_id).id
+        self.assertEqual(second_id, DashboardSnapshot.query.get_latest_id())
+        self.assertIsNone(DashboardSnapshot.query.refresh(first_id))
+
+        # Nor do refreshes run while another is running.
+        with self.db.engine.connect() as conn:
+            conn.execute("SELECT pg_advisory_lock(%s)", (dashboard.REFRESH_LOCK_ID,))
+            self.assertIsNone(DashboardSnapshot.query.refresh())
+            conn.execute("SELECT pg_advisory_unlock(%s)", (dashboard.REFRESH_LOCK_ID,))
+        self.assertIsNotNone(DashboardSnapshot.query.refresh())
@@ -1,5 +1,15 @@
+import datetime
+
+from sqlalchemy.exc import OperationalError
+from unittest import mock
+
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
 from airq.models.events import Event
+from airq.models.events import EventCount
 from airq.models.events import EventType
+from airq.sync.events import _event_counts_sync
+from airq.sync.events import _partitions_sync
 from tests.base import BaseTestCase
 
 
@@ -41,3 +51,217 @@ class EventTestCase(BaseTestCase):
                 )
                 with self.assertRaises(TypeError):
                     event.validate()
+
+    def _make_client(self) -> Client:
+        client = Client(
+            identifier="+12222222222",
+            type_code=ClientIdentifierType.PHONE_NUMBER,
+            last_activity_at=0,
+        )
+        self.db.session.add(client)
+        self.db.session.commit()
+        return client
+
+    def test_buffered(self):
+        client_id = self._make_client().id
+
+        # The events are written with a single INSERT, inside of a savepoint.
+        with self.assert_num_queries(3):
+            with Event.query.buffered() as buffer:
+                Event.query.create(client_id, EventType.MENU)
+                with Event.query.buffered() as nested:
+                    self.assertIs(buffer, nested)
+                    Event.query.create(client_id, EventType.ABOUT)
+                Event.query.create(
+                    client_id, EventType.QUALITY, zipcode="97204", pm25=10.1
+                )
+                self.assertEqual(3, len(buffer))
+
+        self.assertEqual(
+            [EventType.MENU, EventType.ABOUT, EventType.QUALITY],
+            [e.type_code for e in Event.query.order_by(Event.id).all()],
+        )
+        self.assertEqual(
+            {"zipcode": "97204", "pm25": 10.1},
+            Event.query.filter_by(type_code=EventType.QUALITY).one().data,
+        )
+
+    def test_buffered_validates_events(self):
+        client = self._make_client()
+        with Event.query.buffered() as buffer:
+            with self.assertRaises(TypeError):
+                Event.query.create(client.id, EventType.QUALITY, zipcode="97204")
+            self.assertEqual(0, len(buffer))
+
+    def test_buffered_rolls_back_on_error(self):
+        client = self._make_client()
+        with self.assertRaises(ValueError):
+            with Event.query.buffered():
+                Event.query.create(client.id, EventType.MENU)
+                client.locale = "es"
+                raise ValueError()
+
+        self.assertEqual(0, Event.query.count())
+        self.assertEqual("en", Client.query.get(client.id).locale)
+
+    def test_buffered_falls_back_to_writing_events_one_at_a_time(self):
+        client = self._make_client()
+        with self.assertLogs("airq.models.events", "ERROR") as logs:
+            with Event.query.buffered():
+                Event.query.create(client.id, EventType.MENU)
+                Event.query.create(client.id + 1, EventType.MENU)
+                Event.query.create(client.id, EventType.ABOUT)
+
+        self.assertEqual(2, len(logs.records))
+        self.assertIn(f"'client_id': {client.id + 1}", logs.records[1].getMessage())
+        self.assertEqual(
+            [EventType.MENU, EventType.ABOUT],
+            [e.type_code for e in Event.query.order_by(Event.id).all()],
+        )
+
+    def test_buffered_requeues_events_when_commit_fails(self):
+        client = self._make_client()
+        commit = self.db.session.commit
+        num_calls = 0
+
+        def fail_first_commit():
+            nonlocal num_calls
+            num_calls += 1
+            if num_calls == 1:
+                raise OperationalError("COMMIT", {}, Exception("connection lost"))
+            commit()
+
+        with mock.patch.object(self.db.session, "commit", fail_first_commit):
+            with self.assertLogs("airq.models.events", "ERROR"):
+                with self.assertRaises(OperationalError):
+                    with Event.query.buffered():
+                        Event.query.create(client.id, EventType.MENU)
+                        Event.query.create(
+                            client.id, EventType.QUALITY, zipcode="97204", pm25=10.1
+                        )
+                        client.locale = "es"
+
+        # The events are written again by the `write_events` task, but the rest of
+        # the failed transaction is lost.
+        self.assertEqual(2, num_calls)
+        self.assertEqual(
+            [EventType.MENU, EventType.QUALITY],
+            [e.type_code for e in Event.query.order_by(Event.id).all()],
+        )
+        self.assertEqual(
+            {"zipcode": "97204", "pm25": 10.1},
+            Event.query.filter_by(type_code=EventType.QUALITY).one().data,
+        )
+        self.assertEqual(self.clock.now(), Event.query.first().timestamp)
+        self.assertEqual("en", Client.query.get(client.id).locale)
+
+    def _make_event(
+        self,
+        client_id: int,
+        type_code: EventType,
+        days_ago: int = 0,
+        hours_ago: int = 0,
+    ):
+        self.db.session.add(
+            Event(
+                client_id=client_id,
+                type_code=type_code,
+                timestamp=self.clock.now()
+                - datetime.timedelta(days=days_ago, hours=hours_ago),
+                json_data={},
+            )
+        )
+        self.db.session.commit()
+
+    def test_get_stats(self):
+        client_id = self._make_client().id
+        self._make_event(client_id, EventType.MENU, days_ago=40)
+        # Only the part of the first day after the cutoff (30 days ago) counts.
+        self._make_event(client_id, EventType.MENU, days_ago=30, hours_ago=1)
+        self._make_event(client_id, EventType.ABOUT, days_ago=29, hours_ago=23)
+        self._make_event(client_id, EventType.MENU, days_ago=2)
+        self._make_event(client_id, EventType.MENU, days_ago=2)
+        self._make_event(client_id, EventType.ABOUT, days_ago=1)
+        self._make_event(client_id, EventType.MENU)
+
+        # Without a rollup, everything is counted from the events table.
+        stats = Event.query.get_stats()
+        self.assertEqual(
+            ["2020-09-18", "2020-09-17", "2020-09-16", "2020-08-19", "TOTAL"],
+            list(stats),
+        )
+        self.assertEqual(0, stats["2020-08-19"]["MENU"])
+        self.assertEqual(1, stats["2020-08-19"]["ABOUT"])
+        self.assertEqual(2, stats["2020-09-16"]["MENU"])
+        self.assertEqual(1, stats["2020-09-17"]["ABOUT"])
+        self.assertEqual(1, stats["2020-09-18"]["MENU"])
+        self.assertEqual(3, stats["TOTAL"]["MENU"])
+        self.assertEqual(2, stats["TOTAL"]["ABOUT"])
+
+        # The rollup counts whole days, but the stats stay the same.
+        _event_counts_sync()
+        self.assertEqual(6, EventCount.query.count())
+        self.assertEqual(datetime.date(2020, 9, 18), EventCount.query.get_last_date())
+        self.assertEqual(stats, Event.query.get_stats())
+
+        # Events since the last rollup are still counted.
+        self._make_event(client_id, EventType.MENU)
+        stats = Event.query.get_stats()
+        self.assertEqual(2, stats["2020-09-18"]["MENU"])
+        self.assertEqual(4, stats["TOTAL"]["MENU"])
+
+        _event_counts_sync()
+        self.assertEqual(6, EventCount.query.count())
+        self.assertEqual(stats, Event.query.get_stats())
+
+    def test_partitions_sync(self):
+        self.assertEqual(
+            ["events_2020_09", "events_2020_10", "events_2020_11"], _partitions_sync()
+        )
+        partitions = {
+            name
+            for name, in self.db.session.execute(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = 'events'::regclass"
+            )
+        }
+        self.assertLessEqual(
+            {"events_default", "events_2020_09", "events_2020_10", "events_2020_11"},
+            partitions,
+        )
+
+    def test_partitions_sync_moves_default_events(self):
+        # An event from beyond the partitions we've created lands in the default
+        # partition, and is moved once its month's partition is created.
+        client_id = self._make_client().id
+        timestamp = datetime.datetime(2031, 3, 15, tzinfo=datetime.timezone.utc)
+        self.db.session.add(
+            Event(
+                client_id=client_id,
+                type_code=EventType.MENU,
+                timestamp=timestamp,
+                json_data={},
+            )
+        )
+        self.db.session.commit()
+
+        def get_partition():
+            return self.db.session.execute(
+                "SELECT tableoid::regclass::text FROM events WHERE timestamp = :ts",
+                {"ts": timestamp},
+            ).scalar()
+
+        self.assertEqual("events_default", get_partition())
+        self.clock.dt = datetime.datetime(2031, 1, 15, tzinfo=datetime.timezone.utc)
+        self.assertIn("events_2031_03", _partitions_sync())
+        self.assertEqual("events_2031_03", get_partition())
+        self.assertEqual(1, Event.query.filter(Event.timestamp == timestamp).count())
+
+        # Partitions which already exist are left alone.
+        self.assertIn("events_2031_03", _partitions_sync())
+        self.assertEqual("events_2031_03", get_partition())
+
+        self.db.session.execute(
+            "DROP TABLE events_2031_01, events_2031_02, events_2031_03"
+        )
+        self.db.session.commit()
@@ -0,0 +1,40 @@
+import hashlib
+import os
+import tempfile
+
+from unittest import mock
+
+from airq import config
+from airq.lib.http import cached_download
+from tests.base import BaseTestCase
+from tests.mocks.fixtures import FakeFixtureServer
+from tests.mocks.fixtures import FIXTURES_DIR
+
+
+class HttpTestCase(BaseTestCase):
+    def test_cached_download(self):
+        with open(os.path.join(FIXTURES_DIR, "geonames/US.zip"), "rb") as f:
+            content = f.read()
+
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.object(
+            config, "DOWNLOAD_CACHE_DIR", cache_dir
+        ), FakeFixtureServer({"/US.zip": "geonames/US.zip"}) as server:
+            url = f"{server.url}/US.zip"
+            download = cached_download(url, "US.zip")
+            self.assertTrue(download.was_downloaded)
+            self.assertEqual(os.path.join(cache_dir, "US.zip"), download.path)
+            self.assertEqual(hashlib.sha256(content).hexdigest(), download.sha256)
+            with open(download.path, "rb") as f:
+                self.assertEqual(content, f.read())
+
+            # The second request is conditional, so the file isn't sent again.
+            cached = cached_download(url, "US.zip")
+            self.assertFalse(cached.was_downloaded)
+            self.assertEqual(download.path, cached.path)
+            self.assertEqual(download.sha256, cached.sha256)
+            self.assertEqual([("/US.zip", 200), ("/US.zip", 304)], server.responses)
+
+            # A missing file is downloaded again.
+            os.remove(download.path)
+            self.assertTrue(cached_download(url, "US.zip").was_downloaded)
+            self.assertEqual(("/US.zip", 200), server.responses[-1])
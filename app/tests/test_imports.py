@@ -0,0 +1,113 @@
+import csv
+import io
+
+from unittest import mock
+
+from airq import tasks
+from airq.models import imports
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
+from airq.models.imports import ClientImport
+from airq.models.imports import ClientImportRow
+from airq.models.zipcodes import Zipcode
+from tests.base import BaseTestCase
+
+
+class ClientImportTestCase(BaseTestCase):
+    def test_get_missing_columns(self):
+        self.assertEqual(
+            [], ClientImport.get_missing_columns(["zipcode", "phone_number"])
+        )
+        self.assertEqual(
+            ["phone_number"], ClientImport.get_missing_columns(["zipcode", "phone"])
+        )
+        self.assertEqual(
+            ["phone_number", "zipcode"], ClientImport.get_missing_columns([])
+        )
+
+    def _create_import(self, lines, **kwargs) -> ClientImport:
+        return ClientImport.query.create(
+            csv.DictReader(io.StringIO("\n".join(lines))), **kwargs
+        )
+
+    def test_import_clients(self):
+        existing = Client(
+            identifier="+15035551212",
+            type_code=ClientIdentifierType.PHONE_NUMBER,
+            last_activity_at=0,
+        )
+        self.db.session.add(existing)
+        self.db.session.commit()
+        existing_id = existing.id
+
+        client_import = self._create_import(
+            [
+                "phone_number,zipcode",
+                "4152223333,97204",
+                "5035551212,97204",
+                "abc,97204",
+                "4152224444,00000",
+                "+14152223333, 97204",
+                "4152225555,97204 ",
+            ],
+            locale="es",
+        )
+        self.assertEqual(6, client_import.num_rows)
+
+        with mock.patch.object(imports, "IMPORT_BATCH_SIZE", 2):
+            tasks.import_clients.delay(client_import.id)
+
+        client_import = ClientImport.query.get(client_import.id)
+        self.assertTrue(client_import.is_complete)
+        self.assertEqual(6, client_import.num_processed)
+        self.assertEqual(2, client_import.num_created)
+        self.assertEqual(2, client_import.num_duplicates)
+        self.assertEqual(
+            [
+                "Row 3: abc is not a valid US phone number",
+                "Row 4: 00000 is not a valid zipcode",
+            ],
+            client_import.errors,
+        )
+
+        zipcode = Zipcode.query.get_by_zipcode("97204")
+        clients = (
+            Client.query.filter(Client.id != existing_id).order_by(Client.id).all()
+        )
+        self.assertEqual(
+            ["+14152223333", "+14152225555"], [c.identifier for c in clients]
+        )
+        for client in clients:
+            self.assertEqual("es", client.locale)
+            self.assertEqual(zipcode.id, client.zipcode_id)
+            self.assertEqual(zipcode.pm25, client.last_pm25)
+            self.assertEqual(self.timestamp, client.last_activity_at)
+
+        # The rows are only kept until the import completes.
+        self.assertEqual(
+            0,
+            ClientImportRow.query.filter_by(client_import_id=client_import.id).count(),
+        )
+
+    def test_import_clients_resumes(self):
+        client_import = self._create_import(
+            [
+                "phone_number,zipcode",
+                "4152223333,97204",
+                "4152224444,97204",
+                "4152225555,97204",
+            ]
+        )
+        # Pretend a previous run got through the first two rows and then died.
+        client_import.num_processed = 2
+        self.db.session.commit()
+
+        tasks.import_clients.delay(client_import.id)
+
+        client_import = ClientImport.query.get(client_import.id)
+        self.assertTrue(client_import.is_complete)
+        self.assertEqual(3, client_import.num_processed)
+        self.assertEqual(1, client_import.num_created)
+        self.assertEqual(
+            ["+14152225555"], [c.identifier for c in Client.query.order_by(Client.id)]
+        )
@@ -0,0 +1,47 @@
+from airq.lib import postgres
+from airq.lib.postgres import copy_rows
+from airq.lib.postgres import create_temp_table
+from tests.base import BaseTestCase
+
+
+class PostgresTestCase(BaseTestCase):
+    def test_copy_rows(self):
+        rows = [
+            (1, "tab\tand\nnewline", 1.5, True),
+            (2, "back\\slash", None, False),
+        ] + [(i, f"row {i}", 0.1 * i, i % 2 == 0) for i in range(3, 10001)]
+        num_consumed = 0
+
+        def iter_rows():
+            nonlocal num_consumed
+            for row in rows:
+                num_consumed += 1
+                yield row
+
+        staging = create_temp_table(
+            "copy_staging",
+            {
+                "id": "integer",
+                "name": "text",
+                "value": "double precision",
+                "flag": "boolean",
+            },
+        )
+        reader = postgres._CopyRowsReader(iter_rows())
+        reader.read(postgres.COPY_CHUNK_SIZE)
+        # Rows are only formatted as they're read.
+        self.assertLess(num_consumed, len(rows))
+
+        self.assertEqual(
+            len(rows), copy_rows(staging, ["id", "name", "value", "flag"], rows)
+        )
+        self.assertListEqual(
+            rows,
+            [
+                tuple(row)
+                for row in self.db.session.execute(
+                    f"SELECT id, name, value, flag FROM {staging} ORDER BY id"
+                )
+            ],
+        )
+        self.db.session.rollback()
@@ -1,11 +1,101 @@
+from airq.commands import quality
 from airq.lib.readings import Pm25
 from airq.models.clients import Client
 from airq.models.events import Event
 from airq.models.events import EventType
+from airq.models.zipcodes import Zipcode
 from tests.base import BaseTestCase
 
 
 class SMSTestCase(BaseTestCase):
+    def test_quality_replies_are_cached(self):
+        def get_quality(from_number: str) -> bytes:
+            response = self.client.post(
+                "/sms/en", data={"Body": "97204", "From": from_number}
+            )
+            self.assertEqual(200, response.status_code)
+            return response.data
+
+        # Welcome messages aren't cached, but later replies are.
+        for from_number in ("+12222222222", "+13333333333"):
+            get_quality(from_number)
+        for from_number in ("+12222222222", "+13333333333"):
+            self.assert_twilio_response(
+                "Portland 97204 is GOOD (AQI 41).\n"
+                "\n"
+                'Text "M" for Menu, "E" to end alerts.',
+                get_quality(from_number),
+            )
+        self.assertEqual(1, quality._summary_cache.stats.misses)
+        self.assertEqual(1, quality._summary_cache.stats.hits)
+
+        # The next metrics sync invalidates the cached reply.
+        zipcode = Zipcode.query.get_by_zipcode("97204")
+        pm25, pm25_updated_at = zipcode.pm25, zipcode.pm25_updated_at
+        zipcode.pm25 = 40
+        zipcode.pm25_updated_at += 1
+        self.db.session.commit()
+        try:
+            self.assert_twilio_response(
+                "Portland 97204 is UNHEALTHY FOR SENSITIVE GROUPS (AQI 112).\n"
+                "\n"
+                'Text "M" for Menu, "E" to end alerts.',
+                get_quality("+12222222222"),
+            )
+            self.assertEqual(2, quality._summary_cache.stats.misses)
+        finally:
+            zipcode = Zipcode.query.get_by_zipcode("97204")
+            zipcode.pm25, zipcode.pm25_updated_at = pm25, pm25_updated_at
+            self.db.session.commit()
+
+    def test_details_replies_are_cached_until_recommendations_change(self):
+        def get_details() -> bytes:
+            response = self.client.post(
+                "/sms/en", data={"Body": "1", "From": "+13333333333"}
+            )
+            self.assertEqual(200, response.status_code)
+            return response.data
+
+        self.client.post("/sms/en", data={"Body": "97038", "From": "+13333333333"})
+        self.assertEqual(get_details(), get_details())
+        self.assertEqual(1, quality._details_cache.stats.misses)
+        self.assertEqual(1, quality._details_cache.stats.hits)
+
+        # Recommendations are updated even when the zipcode's own pm25 isn't.
+        zipcode = Zipcode.query.get_by_zipcode("97038")
+        recommendations_data = zipcode.recommendations_data
+        zipcode.recommendations_data = []
+        self.db.session.commit()
+        try:
+            self.assertNotIn(b"Here are the closest places", get_details())
+            self.assertEqual(2, quality._details_cache.stats.misses)
+        finally:
+            zipcode = Zipcode.query.get_by_zipcode("97038")
+            zipcode.recommendations_data = recommendations_data
+            self.db.session.commit()
+
+    def test_num_queries(self):
+        self.client.post("/sms/en", data={"Body": "97204", "From": "+12222222222"})
+
+        # Each message takes one query to load the client along with its zipcode
+        # and city, one to update the client's activity and conversation state and
+        # one to write the message's event, which is buffered until the reply is ready.
+        # Commands may need a few more on top of that.
+        for body, num_queries in (
+            ("M", 3),
+            ("3", 3),
+            ("1", 3),
+            ("5", 7),
+            ("1", 3),
+            ("2", 7),
+        ):
+            self.clock.advance()
+            with self.subTest(body), self.assert_num_queries(num_queries):
+                response = self.client.post(
+                    "/sms/en", data={"Body": body, "From": "+12222222222"}
+                )
+                self.assertEqual(200, response.status_code)
+
     def test_get_quality(self):
         response = self.client.post(
             "/sms/en", data={"Body": "00000", "From": "+12222222222"}
@@ -0,0 +1,67 @@
+import gzip
+import os
+
+from airq.lib.sql_dumps import iter_insert_rows
+from tests.base import BaseTestCase
+from tests.mocks.fixtures import FIXTURES_DIR
+
+
+class SqlDumpsTestCase(BaseTestCase):
+    def test_iter_insert_rows(self):
+        lines = [
+            "-- MySQL dump\n",
+            "CREATE TABLE `t` (`id` int, `zip` varchar(5), `city` varchar(45), `tz` varchar(45));\n",
+            "INSERT INTO `t` VALUES (1,'00501','Holtsville','America/New_York'),"
+            "(2,'20606','Abell, St. Mary\\'s','America/New_York'),"
+            "(3,'99501','It''s (odd), \\\\ \\n','America/Anchorage');\n",
+            "INSERT INTO `t` VALUES (4,'96701',NULL,'Pacific/Honolulu'),"
+            "(5,'','NULL',NULL);\n",
+        ]
+        self.assertEqual(
+            [
+                ("00501", "Holtsville", "1"),
+                ("20606", "Abell, St. Mary's", "2"),
+                ("99501", "It's (odd), \\ \n", "3"),
+                ("96701", None, "4"),
+                ("", "NULL", "5"),
+            ],
+            list(iter_insert_rows(lines, columns=(1, 2, 0))),
+        )
+        self.assertEqual(
+            [
+                ("America/New_York",),
+                ("America/New_York",),
+                ("America/Anchorage",),
+                ("Pacific/Honolulu",),
+                (None,),
+            ],
+            list(iter_insert_rows(lines, columns=(3,))),
+        )
+
+    def test_iter_insert_rows_invalid(self):
+        lines = ["INSERT INTO `t` VALUES (1,'a'),(2,'b),(3,'c');\n"]
+        with self.assertRaises(ValueError):
+            list(iter_insert_rows(lines, columns=(1,)))
+
+    def test_iter_insert_rows_fixture(self):
+        path = os.path.join(FIXTURES_DIR, "geonames/zipcodes_to_timezones.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = list(iter_insert_rows(f, columns=range(10)))
+
+        self.assertEqual(41958, len(rows))
+        self.assertEqual({10}, {len(row) for row in rows})
+        self.assertIn(
+            (
+                "8638",
+                "20606",
+                "Abell",
+                "St. Mary's County",
+                "MD",
+                "United States",
+                "America/New_York",
+                "60",
+                "http://where.yahooapis.com/geocode",
+                "2012-04-23",
+            ),
+            rows,
+        )
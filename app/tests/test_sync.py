@@ -1,23 +1,55 @@
+import json
+import math
+import numpy as np
 import os
 import logging
+import random
+import tempfile
 
 from requests.exceptions import HTTPError
 from unittest import mock
 
+from airq import config
+from airq.lib.geo import haversine_distance
+from airq.lib.geo import haversine_many
+from airq.lib.purpleair import parse_sensor_columns
 from airq.lib.purpleair import PURPLEAIR_URL
+from airq.lib.purpleair import SensorColumns
 from airq.models.cities import City
 from airq.models.relations import SensorZipcodeRelation
 from airq.models.sensors import Sensor
+from airq.models.sensors import SensorLastSeen
 from airq.models.zipcodes import Zipcode
 from airq.sync import models_sync
+from airq.sync import purpleair
+from airq.sync.geonames import geonames_sync
 from airq.sync.geonames import GEONAMES_URL
 from airq.sync.geonames import ZIP_2_TIMEZONES_URL
+from airq.sync.purpleair import _metrics_sync
+from airq.sync.purpleair import _metrics_sync_in_python
+from airq.sync.purpleair import _metrics_sync_in_sql
+from airq.sync.purpleair import _recommendations_sync
+from airq.sync.purpleair import _sensors_sync
+from airq.sync.purpleair import _validate_readings
+from airq.sync.purpleair import SENSOR_FRESHNESS_SECONDS
 from tests.base import BaseTestCase
+from tests.mocks.fixtures import FakeFixtureServer
 from tests.mocks.requests import ErrorResponse
 from tests.mocks.requests import MockRequests
+from tests.mocks.requests import SuccessResponse
 
 
 class SyncTestCase(BaseTestCase):
+    def _restore_fixture(self):
+        """Put back the fixture's sensors and metrics, which later tests rely on."""
+        self.clock.dt = self.get_mock_datetime()
+        # Sensors' last_seen only moves forward, so clear it first.
+        SensorLastSeen.query.update({"last_seen": 0})
+        self.db.session.commit()
+        resp = SuccessResponse("purpleair/purpleair.json")
+        _sensors_sync(parse_sensor_columns(resp.iter_content(1024)))
+        _metrics_sync()
+
     def test_sync(self):
         skip_force_rebuild = bool(os.getenv("SKIP_FORCE_REBUILD", False))
         if not skip_force_rebuild:
@@ -26,6 +58,7 @@ class SyncTestCase(BaseTestCase):
             self.assertEqual(City.query.count(), 0)
             self.assertEqual(Zipcode.query.count(), 0)
             self.assertEqual(Sensor.query.count(), 0)
+            self.assertEqual(SensorLastSeen.query.count(), 0)
             self.assertEqual(SensorZipcodeRelation.query.count(), 0)
 
         with MockRequests.for_urls(
@@ -40,6 +73,7 @@ class SyncTestCase(BaseTestCase):
         self.assertGreater(City.query.count(), 0)
         self.assertGreater(Zipcode.query.count(), 0)
         self.assertGreater(Sensor.query.count(), 0)
+        self.assertEqual(Sensor.query.count(), SensorLastSeen.query.count())
         self.assertGreater(SensorZipcodeRelation.query.count(), 0)
 
         # Assert that zipcodes with a valid pm25 have a metrics_data blob
@@ -49,6 +83,63 @@ class SyncTestCase(BaseTestCase):
             self.assertIsNotNone(zipcode.metrics_data)
             self.assertTrue(len(zipcode.metrics_data["sensor_ids"]) > 0)
 
+    def test_geonames_sync_only_writes_changes(self):
+        num_zipcodes = Zipcode.query.count()
+        num_cities = City.query.count()
+        zipcode = Zipcode.query.get_by_zipcode("97002")
+        zipcode_id = zipcode.id
+        timezone = zipcode.timezone
+        zipcode.timezone = "America/New_York"
+        self.db.session.commit()
+
+        with MockRequests.for_urls(
+            {
+                GEONAMES_URL: "geonames/US.zip",
+                ZIP_2_TIMEZONES_URL: "geonames/zipcodes_to_timezones.gz",
+            }
+        ):
+            with mock.patch("airq.sync.geonames.logger") as mock_logger:
+                geonames_sync()
+
+        mock_logger.info.assert_any_call("Created %s cities", 0)
+        mock_logger.info.assert_any_call("Created or updated %s zipcodes", 1)
+        self.assertEqual(Zipcode.query.count(), num_zipcodes)
+        self.assertEqual(City.query.count(), num_cities)
+        self.assertEqual(Zipcode.query.get(zipcode_id).timezone, timezone)
+
+    def test_geonames_sync_skips_unchanged_sources(self):
+        zipcode = Zipcode.query.get_by_zipcode("97002")
+        zipcode_id = zipcode.id
+        timezone = zipcode.timezone
+
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.object(
+            config, "DOWNLOAD_CACHE_DIR", cache_dir
+        ), FakeFixtureServer(
+            {
+                "/US.zip": "geonames/US.zip",
+                "/zipcodes_to_timezones.gz": "geonames/zipcodes_to_timezones.gz",
+            }
+        ) as server, mock.patch(
+            "airq.sync.geonames.GEONAMES_URL", f"{server.url}/US.zip"
+        ), mock.patch(
+            "airq.sync.geonames.ZIP_2_TIMEZONES_URL",
+            f"{server.url}/zipcodes_to_timezones.gz",
+        ):
+            geonames_sync(only_if_changed=True)
+            self.assertEqual({200}, {status for _, status in server.responses})
+
+            Zipcode.query.get(zipcode_id).timezone = "America/New_York"
+            self.db.session.commit()
+
+            # Neither source is sent again, and nothing is synced.
+            server.responses.clear()
+            geonames_sync(only_if_changed=True)
+            self.assertEqual({304}, {status for _, status in server.responses})
+            self.assertEqual("America/New_York", Zipcode.query.get(zipcode_id).timezone)
+
+            geonames_sync()
+            self.assertEqual(timezone, Zipcode.query.get(zipcode_id).timezone)
+
     @mock.patch.object(logging.Logger, "log")
     def test_sync_error(self, mock_log):
         error = HTTPError("foo")
@@ -74,3 +165,462 @@ class SyncTestCase(BaseTestCase):
             error,
             exc_info=True,
         )
+
+    def test_relations(self):
+        # Each sensor should be related to its 25 closest zipcodes within 25km.
+        zipcodes = Zipcode.query.all()
+        for sensor in Sensor.query.all():
+            distances = [
+                haversine_distance(
+                    sensor.longitude, sensor.latitude, z.longitude, z.latitude
+                )
+                for z in zipcodes
+            ]
+            expected = sorted(d for d in distances if d < 25)[:25]
+            actual = sorted(
+                r.distance
+                for r in SensorZipcodeRelation.query.filter_by(sensor_id=sensor.id)
+            )
+            self.assertEqual(len(expected), len(actual))
+            for expected_distance, actual_distance in zip(expected, actual):
+                self.assertAlmostEqual(expected_distance, actual_distance, places=6)
+
+    def test_sensors_sync_only_writes_changes(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        columns = parse_sensor_columns(resp.iter_content(1024))
+
+        # Nothing has moved since the initial sync.
+        self.assertTupleEqual(([], []), _sensors_sync(columns))
+
+        sensor = Sensor.query.order_by(Sensor.id).first()
+        latitude = sensor.latitude
+        latest_reading = sensor.latest_reading
+        sensor.latitude += 1
+        sensor.latest_reading += 1
+        self.db.session.commit()
+
+        self.assertTupleEqual(([sensor.id], [sensor.id]), _sensors_sync(columns))
+        sensor = Sensor.query.get(sensor.id)
+        self.assertEqual(latitude, sensor.latitude)
+        self.assertEqual(latest_reading, sensor.latest_reading)
+
+    def test_sensors_sync_refreshes_last_seen(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        columns = parse_sensor_columns(resp.iter_content(1024))
+
+        def get_sensors():
+            return {
+                s.id: (s.latest_reading, s.humidity, s.updated_at)
+                for s in Sensor.query
+            }
+
+        def get_last_seen():
+            return dict(
+                SensorLastSeen.query.with_entities(
+                    SensorLastSeen.sensor_id, SensorLastSeen.last_seen
+                )
+            )
+
+        sensors = get_sensors()
+        last_seen = get_last_seen()
+        self.assertEqual(set(sensors), set(last_seen))
+
+        # Sensors which were just seen again, but whose readings are the same,
+        # aren't reported as changed or rewritten, but they are marked as seen.
+        columns.last_seen += 60
+        self.assertTupleEqual(([], []), _sensors_sync(columns))
+        self.assertDictEqual(sensors, get_sensors())
+        self.assertDictEqual(
+            {sensor_id: ts + 60 for sensor_id, ts in last_seen.items()},
+            get_last_seen(),
+        )
+
+        # So an hour later (the interval between syncs) they're still fresh.
+        self.clock.advance(3600)
+        columns.last_seen += 3600
+        self.assertTupleEqual(([], []), _sensors_sync(columns))
+        self.assertDictEqual(sensors, get_sensors())
+        self.assertEqual(
+            0,
+            SensorLastSeen.query.filter(
+                SensorLastSeen.last_seen <= self.timestamp - SENSOR_FRESHNESS_SECONDS
+            ).count(),
+        )
+
+        # Sensors with a new reading are reported as changed and rewritten.
+        sensor_id = columns.sensor_index[0].item()
+        columns.pm25[0] += 1
+        self.assertTupleEqual(([], [sensor_id]), _sensors_sync(columns))
+        sensor = Sensor.query.get(sensor_id)
+        self.assertEqual(columns.pm25[0], sensor.latest_reading)
+        self.assertEqual(last_seen[sensor_id] + 3660, sensor.updated_at)
+
+        # As are sensors which report again after going stale, since they count
+        # towards their zipcodes' metrics again.
+        SensorLastSeen.query.filter_by(sensor_id=sensor_id).update(
+            {"last_seen": self.timestamp - SENSOR_FRESHNESS_SECONDS}
+        )
+        self.db.session.commit()
+        self.assertTupleEqual(([], [sensor_id]), _sensors_sync(columns))
+        self.assertEqual(last_seen[sensor_id] + 3660, get_last_seen()[sensor_id])
+
+        self._restore_fixture()
+
+    def test_metrics_sync_modes_agree(self):
+        def get_metrics():
+            return {
+                z.id: (z.pm25, z.humidity, z.pm25_updated_at, z.metrics_data)
+                for z in Zipcode.query.filter(Zipcode.metrics_data.isnot(None))
+            }
+
+        def clear_metrics():
+            Zipcode.query.update(
+                {"pm25": 0, "humidity": 0, "pm25_updated_at": 0, "metrics_data": None}
+            )
+            self.db.session.commit()
+
+        clear_metrics()
+        _metrics_sync_in_python()
+        expected = get_metrics()
+        self.assertTrue(expected)
+
+        clear_metrics()
+        _metrics_sync_in_sql()
+        self.assertDictEqual(expected, get_metrics())
+
+    def test_python_round(self):
+        rng = random.Random(0)
+        values = [2.675, 1.2875, 14.5625, 0.0625, -0.0625, 0.0, 1e-300, 5e-324, 1e20]
+        for _ in range(10000):
+            # Averages of readings with few decimals land on (or next to) ties.
+            readings = [
+                round(rng.uniform(0, 500), rng.randint(0, 2))
+                for _ in range(rng.randint(1, 8))
+            ]
+            values.append(sum(readings) / len(readings))
+            values.append(rng.uniform(-1000, 1000))
+
+        for ndigits in (0, 1, 3):
+            rounded = self.db.session.execute(
+                "SELECT python_round(x, :ndigits) "
+                "FROM unnest(CAST(:values AS double precision[])) AS x",
+                {"values": values, "ndigits": ndigits},
+            ).fetchall()
+            self.assertEqual(
+                [round(value, ndigits) for value in values],
+                [row[0] for row in rounded],
+            )
+
+    def test_metrics_sync_incremental(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        columns = parse_sensor_columns(resp.iter_content(1024))
+        sensor_id = int(columns.sensor_index[0])
+        related_zipcode_ids = {
+            r.zipcode_id
+            for r in SensorZipcodeRelation.query.filter_by(sensor_id=sensor_id)
+        }
+        unrelated_zipcode = Zipcode.query.filter(
+            Zipcode.id.notin_(related_zipcode_ids),
+            Zipcode.pm25_updated_at == self.timestamp,
+        ).first()
+        unrelated_zipcode.pm25 = 999
+        self.db.session.commit()
+
+        pm25 = columns.pm25[0]
+        columns.pm25[0] = pm25 + 10
+        self.assertTupleEqual(([], [sensor_id]), _sensors_sync(columns))
+        self.clock.advance(60)
+        _metrics_sync_in_sql([sensor_id], set())
+
+        # Unaffected zipcodes aren't recomputed, but are still marked as fresh.
+        zipcode = Zipcode.query.get(unrelated_zipcode.id)
+        self.assertEqual(999, zipcode.pm25)
+        self.assertEqual(self.timestamp, zipcode.pm25_updated_at)
+
+        # Affected zipcodes end up just as they would after a full recompute.
+        def get_metrics():
+            return {
+                z.id: (z.pm25, z.humidity, z.pm25_updated_at, z.metrics_data)
+                for z in Zipcode.query.filter(Zipcode.id.in_(related_zipcode_ids))
+            }
+
+        incremental = get_metrics()
+        _metrics_sync_in_sql()
+        self.assertDictEqual(get_metrics(), incremental)
+        self.assertNotEqual(999, Zipcode.query.get(unrelated_zipcode.id).pm25)
+
+        columns.pm25[0] = pm25
+        self.assertTupleEqual(([], [sensor_id]), _sensors_sync(columns))
+        _metrics_sync_in_sql()
+
+    def test_purpleair_sync_is_atomic(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        columns = parse_sensor_columns(resp.iter_content(1024))
+        sensor_id = int(columns.sensor_index[0])
+        latest_reading = Sensor.query.get(sensor_id).latest_reading
+        columns.pm25[0] += 10
+
+        # A run which fails before its metrics are written commits nothing...
+        with mock.patch.object(
+            purpleair, "_get_purpleair_data", return_value=columns
+        ), mock.patch.object(
+            purpleair, "_recommendations_sync", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                purpleair.purpleair_sync()
+        self.db.session.rollback()
+        self.assertEqual(latest_reading, Sensor.query.get(sensor_id).latest_reading)
+
+        # ...so the next run still sees the change, and recomputes its zipcodes.
+        self.assertTupleEqual(([], [sensor_id]), _sensors_sync(columns))
+        self.db.session.rollback()
+
+    def test_metrics_sync_stale_sensors(self):
+        # Once every sensor is stale there's nothing left to compute.
+        last_synced_at = self.timestamp
+        self.clock.advance(60 * 60)
+        _metrics_sync_in_sql([], set())
+        self.assertEqual(
+            0, Zipcode.query.filter(Zipcode.pm25_updated_at > last_synced_at).count()
+        )
+
+    def test_metrics_sync_hourly(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        columns = parse_sensor_columns(resp.iter_content(1024))
+        # Each hour a third of the sensors report new readings, a third report the
+        # same readings, and the rest stop reporting.
+        group = np.arange(len(columns)) % 3
+        is_changing = group == 0
+        is_reporting = group < 2
+        stored_sensor_ids = {s.id for s in Sensor.query}
+
+        def get_sensor_ids(mask):
+            return sorted(
+                set(columns.sensor_index[mask].tolist()) & stored_sensor_ids
+            )
+
+        changing_sensor_ids = get_sensor_ids(is_changing)
+        reporting_sensor_ids = get_sensor_ids(is_reporting)
+        stopped_sensor_ids = get_sensor_ids(~is_reporting)
+
+        def get_metrics():
+            return {
+                z.id: (z.pm25, z.humidity, z.pm25_updated_at, z.metrics_data)
+                for z in Zipcode.query
+            }
+
+        def get_related_zipcode_ids(sensor_ids):
+            return {
+                r.zipcode_id
+                for r in SensorZipcodeRelation.query.filter(
+                    SensorZipcodeRelation.sensor_id.in_(sensor_ids)
+                )
+            }
+
+        for i in range(2):
+            self.clock.advance(60 * 60)
+            columns.last_seen[is_reporting] += 60 * 60
+            columns.pm25[is_changing] += 1
+            metrics = get_metrics()
+            self.assertTupleEqual(([], changing_sensor_ids), _sensors_sync(columns))
+            _metrics_sync_in_sql(changing_sensor_ids, set())
+
+            # Sensors which are still reporting keep their zipcodes fresh, whether
+            # or not their readings changed.
+            incremental = get_metrics()
+            self.assertSetEqual(
+                get_related_zipcode_ids(reporting_sensor_ids),
+                {
+                    zipcode_id
+                    for zipcode_id, values in incremental.items()
+                    if values[2] == self.timestamp
+                },
+            )
+
+            # Only zipcodes near sensors whose readings changed, or (on the first
+            # sync) which stopped reporting, are recomputed.
+            recomputed_zipcode_ids = {
+                zipcode_id
+                for zipcode_id, values in incremental.items()
+                if values[:2] + values[3:]
+                != metrics[zipcode_id][:2] + metrics[zipcode_id][3:]
+            }
+            affected_zipcode_ids = get_related_zipcode_ids(changing_sensor_ids)
+            if i == 0:
+                affected_zipcode_ids |= get_related_zipcode_ids(stopped_sensor_ids)
+            self.assertLessEqual(recomputed_zipcode_ids, affected_zipcode_ids)
+            self.assertTrue(recomputed_zipcode_ids)
+
+            _metrics_sync_in_sql()
+            self.assertDictEqual(incremental, get_metrics())
+
+        self._restore_fixture()
+
+    def test_recommendations_sync(self):
+        _recommendations_sync()
+
+        cutoff = Zipcode.pm25_stale_cutoff()
+        fresh_zipcodes = Zipcode.query.filter(Zipcode.pm25_updated_at > cutoff).all()
+        for zipcode in fresh_zipcodes:
+            candidates = [z for z in fresh_zipcodes if z.pm25 < zipcode.pm25_level]
+            distances = haversine_many(
+                zipcode.longitude,
+                zipcode.latitude,
+                [z.longitude for z in candidates],
+                [z.latitude for z in candidates],
+            )
+            expected = [
+                (candidates[i].zipcode, candidates[i].city.name, round(distances[i], 3))
+                for i in np.lexsort(([z.id for z in candidates], distances))[:3]
+            ]
+            if not zipcode.pm25_level:
+                expected = []
+            with self.subTest(zipcode.zipcode):
+                self.assertListEqual(
+                    expected,
+                    [
+                        (r.zipcode, r.city_name, r.distance)
+                        for r in zipcode.get_recommendations(3)
+                    ],
+                )
+
+    def test_validate_readings(self):
+        ts = self.timestamp
+        nan = float("nan")
+        readings = [
+            # (pm25, humidity, latitude, longitude, last_seen, channel_flag)
+            (10.0, 50.0, 45.5, -122.6, ts, 0),  # valid
+            (10.0, 50.0, 45.5, -122.6, ts - 60 * 60 - 1, 0),  # stale
+            (10.0, 50.0, 45.5, -122.6, ts, 1),  # flagged
+            (10.0, 50.0, 45.5, -122.6, ts, -1),  # unknown flag
+            (nan, 50.0, 45.5, -122.6, ts, 0),  # invalid pm25
+            (0.0, 50.0, 45.5, -122.6, ts, 0),  # pm25 too low
+            (1001.0, 50.0, 45.5, -122.6, ts, 0),  # pm25 too high
+            (10.0, nan, 45.5, -122.6, ts, 0),  # invalid humidity
+            (10.0, 50.0, nan, -122.6, ts, 0),  # missing latitude
+            (1000.0, 0.0, 45.5, -122.6, ts - 60 * 60, 0),  # valid
+            (nan, nan, nan, nan, 0, -1),  # only counted as stale
+        ]
+        pm25, humidity, latitude, longitude, last_seen, channel_flag = zip(*readings)
+        columns = SensorColumns(
+            channel_flags=["Normal", "A-Downgraded"],
+            sensor_index=np.arange(len(readings)),
+            pm25=np.array(pm25),
+            humidity=np.array(humidity),
+            latitude=np.array(latitude),
+            longitude=np.array(longitude),
+            last_seen=np.array(last_seen),
+            channel_flag=np.array(channel_flag, dtype=np.int8),
+        )
+        is_valid, rejections = _validate_readings(columns)
+        self.assertListEqual([0, 9], np.flatnonzero(is_valid).tolist())
+        self.assertDictEqual(
+            {
+                "stale": 2,
+                "flagged": 2,
+                "invalid_pm25": 1,
+                "pm25_out_of_range": 2,
+                "invalid_humidity": 1,
+                "missing_coordinates": 1,
+            },
+            rejections,
+        )
+
+
+class PurpleairParserTestCase(BaseTestCase):
+    def test_parse_sensor_columns(self):
+        resp = SuccessResponse("purpleair/purpleair.json")
+        expected = resp.json()
+        fields = expected["fields"]
+        # Use a tiny chunk size so that rows straddle chunk boundaries.
+        for chunk_size in (7, 100, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size):
+                columns = parse_sensor_columns(resp.iter_content(chunk_size))
+                self.assertEqual(len(expected["data"]), len(columns))
+                self.assertEqual(expected["channel_flags"], columns.channel_flags)
+                for i, row in enumerate(expected["data"]):
+                    data = dict(zip(fields, row))
+                    self.assertEqual(data["sensor_index"], columns.sensor_index[i])
+                    self.assertEqual(data["pm2.5"], columns.pm25[i])
+                    self.assertEqual(data["humidity"], columns.humidity[i])
+                    self.assertEqual(data["latitude"], columns.latitude[i])
+                    self.assertEqual(data["longitude"], columns.longitude[i])
+                    self.assertEqual(data["last_seen"], columns.last_seen[i])
+                    self.assertEqual(data["channel_flags"], columns.channel_flag[i])
+
+    def test_parse_sensor_columns_missing_values(self):
+        payload = {
+            "fields": ["sensor_index", "pm2.5", "latitude", "channel_flags"],
+            "channel_flags": ["Normal"],
+            "data": [[1, None, 45.1, None], [2, "nan", None, 0]],
+        }
+        columns = parse_sensor_columns([json.dumps(payload).encode()])
+        self.assertEqual([1, 2], columns.sensor_index.tolist())
+        self.assertTrue(math.isnan(columns.pm25[0]))
+        self.assertTrue(math.isnan(columns.pm25[1]))
+        self.assertEqual(45.1, columns.latitude[0])
+        self.assertTrue(math.isnan(columns.latitude[1]))
+        self.assertTrue(math.isnan(columns.humidity[0]))
+        self.assertEqual([-1, 0], columns.channel_flag.tolist())
+
+    def test_parse_sensor_columns_invalid_ids(self):
+        payload = {
+            "fields": ["sensor_index", "pm2.5"],
+            "channel_flags": ["Normal"],
+            "data": [
+                [1, 2.5],
+                [None, 3.5],
+                ["nan", 4.5],
+                ["x", 5.5],
+                [2.5, 6.5],
+                [3, 7.5],
+            ],
+        }
+        columns = parse_sensor_columns([json.dumps(payload).encode()])
+        self.assertEqual([1, 3], columns.sensor_index.tolist())
+        self.assertEqual([2.5, 7.5], columns.pm25.tolist())
+        self.assertEqual([0, 0], columns.last_seen.tolist())
+
+        # Without any ids at all, there's nothing to keep.
+        payload = {"fields": ["pm2.5"], "channel_flags": [], "data": [[2.5]]}
+        self.assertEqual(0, len(parse_sensor_columns([json.dumps(payload).encode()])))
+
+    def test_parse_sensor_columns_trailing_keys(self):
+        payload = (
+            '{"fields": ["sensor_index", "pm2.5"], "channel_flags": ["Normal"], '
+            '"data": [[1, 2.5], [2, 3.5]], "max_age": 604800, "extra": [[3, 4.5]]}'
+        ).encode()
+        for chunk_size in (1, 5, len(payload)):
+            with self.subTest(chunk_size=chunk_size):
+                columns = parse_sensor_columns(
+                    payload[i : i + chunk_size]
+                    for i in range(0, len(payload), chunk_size)
+                )
+                self.assertEqual([1, 2], columns.sensor_index.tolist())
+                self.assertEqual([2.5, 3.5], columns.pm25.tolist())
+
+    def test_parse_sensor_columns_brackets_in_strings(self):
+        payload = {
+            "fields": ["sensor_index", "name", "pm2.5"],
+            "channel_flags": ["Normal"],
+            "data": [[1, "Attic ], [", 2.5], [2, 'Shed "]," ,', 3.5], [3, "]", 4.5]],
+        }
+        content = json.dumps(payload).encode()
+        for chunk_size in (1, 7, len(content)):
+            with self.subTest(chunk_size=chunk_size):
+                columns = parse_sensor_columns(
+                    content[i : i + chunk_size]
+                    for i in range(0, len(content), chunk_size)
+                )
+                self.assertEqual([1, 2, 3], columns.sensor_index.tolist())
+                self.assertEqual([2.5, 3.5, 4.5], columns.pm25.tolist())
+
+    def test_parse_sensor_columns_malformed(self):
+        with self.assertRaises(ValueError):
+            parse_sensor_columns([b'{"fields": ["sensor_index"], "channel_flags": []}'])
+        with self.assertRaises(ValueError):
+            parse_sensor_columns([b'{"data": [[1]], "fields": ["sensor_index"]}'])
+        with self.assertRaises(ValueError):
+            parse_sensor_columns(
+                [b'{"fields": ["sensor_index"], "channel_flags": [], "data": [[1], [2'],
+            )
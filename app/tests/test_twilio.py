@@ -0,0 +1,114 @@
+import time
+
+from unittest import mock
+from twilio.rest.api.v2010.account.message import MessageList
+
+from airq import config
+from airq.lib.twilio import get_client
+from airq.lib.twilio import RateLimiter
+from airq.lib.twilio import TwilioErrorCode
+from airq.models.clients import Client
+from airq.models.clients import ClientIdentifierType
+from airq.models.events import EventType
+from airq.models.zipcodes import Zipcode
+from tests.base import BaseTestCase
+from tests.mocks.twilio import create_message
+from tests.mocks.twilio import FakeTwilioServer
+
+
+class TwilioTestCase(BaseTestCase):
+    def _make_clients(self, num_clients: int):
+        zipcode = Zipcode.query.filter_by(zipcode="97204").first()
+        clients = [
+            Client(
+                identifier="+1222222{:04d}".format(i),
+                type_code=ClientIdentifierType.PHONE_NUMBER,
+                zipcode_id=zipcode.id,
+                last_pm25=zipcode.pm25,
+            )
+            for i in range(num_clients)
+        ]
+        self.db.session.add_all(clients)
+        self.db.session.commit()
+        return clients
+
+    def test_send_messages(self):
+        clients = self._make_clients(20)
+        unsubscribed = clients[3]
+        with FakeTwilioServer(
+            latency=0.01,
+            error_codes={unsubscribed.identifier: TwilioErrorCode.UNSUBSCRIBED},
+        ) as server, mock.patch.object(
+            MessageList, "create", create_message
+        ), mock.patch.object(
+            config, "TWILIO_API_URL", server.url
+        ), mock.patch.object(
+            config, "TWILIO_MESSAGES_PER_SECOND", 1000
+        ):
+            get_client.cache_clear()
+            try:
+                sent = list(Client.send_messages((c, "Hello") for c in clients))
+            finally:
+                get_client.cache_clear()
+
+        self.assertCountEqual([c for c in clients if c != unsubscribed], sent)
+        self.assertCountEqual(
+            [c.identifier for c in sent], [m["To"] for m in server.messages]
+        )
+        self.assertEqual({"Hello"}, {m["Body"] for m in server.messages})
+        self.assertEqual(
+            {config.TWILIO_NUMBERS["en"]}, {m["From"] for m in server.messages}
+        )
+
+        # Connections are pooled rather than opened for each message.
+        self.assertLessEqual(
+            len(server.connections), config.TWILIO_MAX_CONCURRENT_SENDS
+        )
+
+        # Clients Twilio can't reach are unsubscribed, just like with send_message.
+        unsubscribed = Client.query.get(unsubscribed.id)
+        self.assertEqual(self.timestamp, unsubscribed.alerts_disabled_at)
+        self.assert_event(
+            unsubscribed.id,
+            EventType.UNSUBSCRIBE_AUTO,
+            zipcode=unsubscribed.zipcode.zipcode,
+        )
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(per_second=100)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait("+15005550006")
+        limiter.wait("+15005550007")
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_rate_limiter_is_shared(self):
+        # Each worker process has its own limiter, but they share the limit.
+        limiters = [
+            RateLimiter(per_second=100, block_size=1),
+            RateLimiter(per_second=100, block_size=1),
+        ]
+        start = time.monotonic()
+        for i in range(6):
+            limiters[i % 2].wait("+15005550006")
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_rate_limiter_reserves_blocks(self):
+        limiters = [
+            RateLimiter(per_second=100, block_size=3),
+            RateLimiter(per_second=100, block_size=3),
+        ]
+        start = time.monotonic()
+        with mock.patch.object(
+            RateLimiter, "_reserve", autospec=True, side_effect=RateLimiter._reserve
+        ) as reserve:
+            for limiter in limiters:
+                for _ in range(3):
+                    limiter.wait("+15005550006")
+
+        # The second limiter's block starts once the first's is over.
+        self.assertEqual(2, reserve.call_count)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertLess(time.monotonic() - start, 0.5)
@@ -1,3 +1,8 @@
+import geohash
+
+from airq.lib.geo import haversine_distance
+from airq.lib.geo import haversine_many
+from airq.lib.geo import haversine_matrix
 from airq.models.zipcodes import Zipcode
 from tests.base import BaseTestCase
 
@@ -9,10 +14,60 @@ class ZipcodeTestCase(BaseTestCase):
 
         zipcode = Zipcode.query.filter_by(zipcode="97038").first()
         self.assertListEqual(
-            [
-                Zipcode.query.filter_by(zipcode="97023").first(),
-                Zipcode.query.filter_by(zipcode="97027").first(),
-                Zipcode.query.filter_by(zipcode="97022").first(),
-            ],
-            zipcode.get_recommendations(3),
+            ["97023", "97027", "97022"],
+            [r.zipcode for r in zipcode.get_recommendations(3)],
+        )
+
+    def test_distance(self):
+        zipcodes = Zipcode.query.order_by(Zipcode.id).limit(20).all()
+        longitudes = [z.longitude for z in zipcodes]
+        latitudes = [z.latitude for z in zipcodes]
+        matrix = haversine_matrix(longitudes, latitudes, longitudes, latitudes)
+        for i, a in enumerate(zipcodes):
+            distances = haversine_many(a.longitude, a.latitude, longitudes, latitudes)
+            for j, b in enumerate(zipcodes):
+                expected = haversine_distance(
+                    a.longitude, a.latitude, b.longitude, b.latitude
+                )
+                self.assertAlmostEqual(expected, matrix[i, j], places=9)
+                self.assertAlmostEqual(expected, distances[j], places=9)
+
+        # Recommendations know their distance from the zipcode they were made for.
+        zipcode = Zipcode.query.filter_by(zipcode="97038").first()
+        recommendations = zipcode.get_recommendations(3)
+        others = [
+            Zipcode.query.filter_by(zipcode=r.zipcode).first() for r in recommendations
+        ]
+        distances = haversine_many(
+            zipcode.longitude,
+            zipcode.latitude,
+            [z.longitude for z in others],
+            [z.latitude for z in others],
+        )
+        for recommendation, distance in zip(recommendations, distances):
+            self.assertAlmostEqual(distance, recommendation.distance, places=3)
+
+    def test_filter_geohash_prefix(self):
+        zipcode = Zipcode.query.filter_by(zipcode="97204").first()
+        self.assertEqual(12, len(zipcode.geohash))
+        self.assertEqual(
+            zipcode.geohash, geohash.encode(zipcode.latitude, zipcode.longitude)
+        )
+
+        zipcodes = Zipcode.query.all()
+        for length in (1, 3, 5, 12):
+            prefix = zipcode.geohash[:length]
+            self.assertCountEqual(
+                [z.zipcode for z in zipcodes if z.geohash.startswith(prefix)],
+                [z.zipcode for z in Zipcode.query.filter_geohash_prefix(prefix)],
+            )
+
+        # The range is served by the geohash index.
+        self.db.session.execute("SET LOCAL enable_seqscan = off")
+        query = Zipcode.query.filter_geohash_prefix("c20").with_entities(Zipcode.id)
+        statement = query.statement.compile(
+            dialect=self.db.engine.dialect, compile_kwargs={"literal_binds": True}
         )
+        plan = self.db.session.execute(f"EXPLAIN {statement}").fetchall()
+        self.db.session.rollback()
+        self.assertIn("ix_zipcodes_geohash", "\n".join(row[0] for row in plan))
@@ -0,0 +1,79 @@
+"""
+Compare the scalar `haversine_distance` with the vectorized `haversine_many`
+on the shapes the app uses: one zipcode against every other zipcode, and a
+pairwise matrix between two sets of points.
+
+Run from the `app` directory inside the app container:
+
+    python ../scripts/bench_haversine.py [num_points]
+"""
+import numpy as np
+import os
+import sys
+import time
+
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+sys.path.insert(0, APP_DIR)
+
+from airq.lib.geo import haversine_distance  # noqa: E402
+from airq.lib.geo import haversine_many  # noqa: E402
+from airq.lib.geo import haversine_matrix  # noqa: E402
+
+
+def _time(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 41000
+    rng = np.random.default_rng(0)
+    # Roughly the bounding box of the contiguous US.
+    lats = rng.uniform(25, 49, num_points)
+    lons = rng.uniform(-124, -67, num_points)
+    lat, lon = 45.5181, -122.6745
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+
+    scalar = _time(
+        lambda: [
+            haversine_distance(lon, lat, lon_list[i], lat_list[i])
+            for i in range(num_points)
+        ]
+    )
+    vectorized = _time(lambda: haversine_many(lon, lat, lons, lats))
+    expected = np.array(
+        [haversine_distance(lon, lat, x, y) for x, y in zip(lon_list, lat_list)]
+    )
+    assert np.allclose(haversine_many(lon, lat, lons, lats), expected)
+    print(f"one-to-many ({num_points} points)")
+    print(f"  scalar loop:    {scalar * 1000:8.2f}ms")
+    print(f"  haversine_many: {vectorized * 1000:8.2f}ms ({scalar / vectorized:.0f}x)")
+
+    n = 1000
+    scalar = _time(
+        lambda: [
+            [
+                haversine_distance(lon_list[i], lat_list[i], x, y)
+                for x, y in zip(lon_list[:n], lat_list[:n])
+            ]
+            for i in range(n)
+        ],
+        repeat=1,
+    )
+    vectorized = _time(lambda: haversine_matrix(lons[:n], lats[:n], lons[:n], lats[:n]))
+    print(f"pairwise ({n}x{n} points)")
+    print(f"  scalar loop:      {scalar * 1000:8.2f}ms")
+    print(
+        f"  haversine_matrix: {vectorized * 1000:8.2f}ms ({scalar / vectorized:.0f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
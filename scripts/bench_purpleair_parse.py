@@ -0,0 +1,119 @@
+"""
+Compare the legacy Purpleair parser (`resp.json()` plus a dict per sensor)
+with the streaming, columnar parser on a synthetic nationwide payload.
+
+Each parser runs in its own subprocess so that peak RSS is measured in isolation.
+Run from the `app` directory inside the app container:
+
+    python ../scripts/bench_purpleair_parse.py [num_sensors]
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+FIXTURE = os.path.join(APP_DIR, "tests", "fixtures", "purpleair", "purpleair.json")
+CHUNK_SIZE = 64 * 1024
+
+
+def _iter_chunks(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _parse_legacy(path: str) -> int:
+    # Mirrors what `_get_purpleair_data` used to do with `resp.json()`.
+    response_dict = json.loads(b"".join(_iter_chunks(path)))
+    fields = response_dict["fields"]
+    channel_flags = response_dict["channel_flags"]
+    data = []
+    for sensor_data in response_dict["data"]:
+        sensor_data = dict(zip(fields, sensor_data))
+        try:
+            sensor_data["channel_flags"] = channel_flags[sensor_data["channel_flags"]]
+        except KeyError:
+            pass
+        data.append(sensor_data)
+    return len(data)
+
+
+def _parse_streaming(path: str) -> int:
+    from airq.lib.purpleair import parse_sensor_columns
+
+    return len(parse_sensor_columns(_iter_chunks(path)))
+
+
+def _run_child(mode: str, path: str):
+    sys.path.insert(0, APP_DIR)
+    if mode == "streaming":
+        # Import outside of the timed section so both modes pay the same startup cost.
+        import airq.lib.purpleair  # noqa
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == "legacy":
+        num_sensors = _parse_legacy(path)
+    else:
+        num_sensors = _parse_streaming(path)
+    duration = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "sensors": num_sensors,
+                "seconds": duration,
+                "peak_rss_kb": peak_rss,
+                "baseline_rss_kb": baseline_rss,
+            }
+        )
+    )
+
+
+def _write_payload(num_sensors: int) -> str:
+    with open(FIXTURE) as f:
+        payload = json.load(f)
+    rows = payload["data"]
+    payload["data"] = [[i] + random.choice(rows)[1:] for i in range(num_sensors)]
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f)
+    return path
+
+
+def main():
+    num_sensors = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    path = _write_payload(num_sensors)
+    try:
+        print(f"Payload: {num_sensors} sensors, {os.path.getsize(path) / 1e6:.1f} MB")
+        for mode in ("legacy", "streaming"):
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", mode, path]
+            )
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print(
+                "{:>10}: {:.3f}s, peak RSS +{:.1f} MB".format(
+                    mode,
+                    result["seconds"],
+                    (result["peak_rss_kb"] - result["baseline_rss_kb"]) / 1024,
+                )
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        _run_child(sys.argv[2], sys.argv[3])
+    else:
+        main()
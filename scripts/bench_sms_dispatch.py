@@ -0,0 +1,78 @@
+"""
+Compare sending texts one at a time (a new Twilio client per message, as
+`send_sms` used to) with the pooled, concurrent `SmsDispatcher`.
+
+Both run against a local fake Twilio server that adds a fixed latency to
+each request. Run from the `app` directory inside the app container:
+
+    python ../scripts/bench_sms_dispatch.py [num_messages] [latency_seconds]
+"""
+import os
+import sys
+import time
+
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+sys.path.insert(0, APP_DIR)
+
+# Send for real (rather than logging) and don't rate limit the fake server.
+os.environ["FLASK_ENV"] = "test"
+os.environ.setdefault("TWILIO_NUMBER_EN", "+15005550006")
+os.environ.setdefault("TWILIO_MESSAGES_PER_SECOND", "0")
+
+from twilio.rest import Client  # noqa: E402
+
+from airq import config  # noqa: E402
+from airq.lib.twilio import get_client  # noqa: E402
+from airq.lib.twilio import SmsDispatcher  # noqa: E402
+from tests.mocks.twilio import FakeTwilioServer  # noqa: E402
+
+
+def _send_sequentially(num_messages: int, url: str):
+    for i in range(num_messages):
+        client = Client(config.TWILIO_SID, config.TWILIO_AUTHTOKEN)
+        client.api.base_url = url
+        client.messages.create(
+            body="Hello", to=f"+1222222{i:04d}", from_=config.TWILIO_NUMBERS["en"]
+        )
+
+
+def _send_concurrently(num_messages: int):
+    with SmsDispatcher[int]() as dispatcher:
+        for i in range(num_messages):
+            dispatcher.submit(i, "Hello", f"+1222222{i:04d}", "en")
+        for _, exc in dispatcher.results():
+            if exc:
+                raise exc
+
+
+def main():
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    with FakeTwilioServer(latency=latency) as server:
+        config.TWILIO_API_URL = server.url
+        get_client.cache_clear()
+
+        start = time.perf_counter()
+        _send_sequentially(num_messages, server.url)
+        sequential = time.perf_counter() - start
+
+        server.connections.clear()
+        start = time.perf_counter()
+        _send_concurrently(num_messages)
+        concurrent = time.perf_counter() - start
+
+    print(f"{num_messages} messages, {latency * 1000:.0f}ms per request")
+    print(f"  sequential: {num_messages / sequential:8.1f} messages/second")
+    print(
+        f"  dispatcher: {num_messages / concurrent:8.1f} messages/second "
+        f"({config.TWILIO_MAX_CONCURRENT_SENDS} workers, "
+        f"{len(server.connections)} connections)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Compare the legacy zip2timezone dump parser (find the first paren, then split
+on "),(" and ",") with the tokenizer in `airq.lib.sql_dumps` on a synthetic
+dump built from the test fixture.
+
+Some of the synthetic rows have commas in their city or county names, which
+the legacy parser splits in the wrong place. Run from the `app` directory:
+
+    python ../scripts/bench_timezones_parse.py [num_rows]
+"""
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+FIXTURE = os.path.join(
+    APP_DIR, "tests", "fixtures", "geonames", "zipcodes_to_timezones.gz"
+)
+# mysqldump splits extended INSERTs into lines of about this many bytes.
+LINE_SIZE = 1024 * 1024
+# The fraction of rows whose city name has a comma in it.
+COMMA_RATE = 0.05
+
+sys.path.insert(0, APP_DIR)
+
+from airq.lib.sql_dumps import iter_insert_rows  # noqa
+
+
+def _parse_legacy(path: str):
+    # Mirrors what the geonames sync used to do.
+    zipcode_to_timezones = {}
+    with gzip.open(path) as f:
+        for line in f:
+            line = line.decode().strip()
+            if line.startswith("INSERT INTO"):
+                i = 0
+                while line[i] != "(":
+                    i += 1
+                i += 1  # Skip the leading "("
+                j = len(line) - 1
+                j -= 1  # Skip the trailing ";"
+                j -= 1  # Skip the trailing ")"
+                row_defs = line[i:j].split("),(")
+                for row_def in row_defs:
+                    fields = row_def.split(",")
+                    zipcode = fields[1][1:-1].strip()
+                    timezone = fields[6][1:-1].strip()
+                    zipcode_to_timezones[zipcode] = timezone
+    return zipcode_to_timezones
+
+
+def _parse_tokenized(path: str):
+    zipcode_to_timezones = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for zipcode, timezone in iter_insert_rows(f, columns=(1, 6)):
+            if zipcode and timezone:
+                zipcode_to_timezones[zipcode.strip()] = timezone.strip()
+    return zipcode_to_timezones
+
+
+def _quote(value):
+    if value is None:
+        return "NULL"
+    return "'{}'".format(value.replace("\\", "\\\\").replace("'", "\\'"))
+
+
+def _write_dump(num_rows: int):
+    with gzip.open(FIXTURE, "rt", encoding="utf-8") as f:
+        rows = list(iter_insert_rows(f, columns=range(10)))
+
+    expected = {}
+    fd, path = tempfile.mkstemp(suffix=".sql.gz")
+    os.close(fd)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        values = []
+        size = 0
+        for i in range(num_rows):
+            row = list(random.choice(rows))
+            row[0] = str(i + 1)
+            row[1] = "{:07d}".format(i)
+            if random.random() < COMMA_RATE:
+                row[2] = f"{row[2]}, {row[4]}"
+            expected[row[1]] = row[6]
+            value = "({})".format(
+                ",".join(
+                    _quote(v) if j not in (0, 7) else (v or "NULL")
+                    for j, v in enumerate(row)
+                )
+            )
+            values.append(value)
+            size += len(value) + 1
+            if size >= LINE_SIZE or i == num_rows - 1:
+                f.write(
+                    "INSERT INTO `timezonebyzipcode` VALUES {};\n".format(
+                        ",".join(values)
+                    )
+                )
+                values = []
+                size = 0
+    return path, expected
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    path, expected = _write_dump(num_rows)
+    try:
+        with gzip.open(path) as f:
+            size = sum(len(line) for line in f)
+        print(f"Dump: {num_rows} rows, {size / 1e6:.1f} MB uncompressed")
+        for mode, parse in (("legacy", _parse_legacy), ("tokenized", _parse_tokenized)):
+            durations = []
+            for _ in range(3):
+                start = time.perf_counter()
+                result = parse(path)
+                durations.append(time.perf_counter() - start)
+            num_wrong = sum(
+                1
+                for zipcode, timezone in expected.items()
+                if result.get(zipcode) != timezone
+            )
+            print(
+                "{:>10}: {:.3f}s (best of 3), {} of {} timezones wrong".format(
+                    mode, min(durations), num_wrong, len(expected)
+                )
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()